@@ -0,0 +1,262 @@
+"""Daemon que agenda as sincronizações e a renovação do token em um único processo.
+
+Substitui as entradas de cron separadas de ``main.py``, ``sincronizar_clientes.py``
+e ``atualiza_token_totoro.py``: os imports, o pool de conexões MySQL e a sessão
+HTTP são reaproveitados entre execuções, e cada job nunca roda em paralelo
+consigo mesmo, nem com o script avulso equivalente (``trava_execucao``); um
+segundo agendador sai na hora. O estado dos jobs é gravado em JOBS_STATUS_FILE e exposto pelo
+``token_monitor`` em ``/api/jobs``.
+
+Variáveis de ambiente (intervalos em minutos):
+- AGENDA_PRODUTOS_MIN (padrão 60)
+- AGENDA_CLIENTES_MIN (padrão 120)
+- AGENDA_TOKEN_MIN (padrão 360)
+- AGENDA_WEBHOOKS_MIN (padrão 0.5)
+- AGENDA_ESTOQUE_MIN (padrão 5)
+- AGENDA_IMAGENS_MIN (padrão 60)
+- AGENDA_PEDIDOS_MIN (padrão 30)
+- DB_POOL_SIZE (padrão 5)
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import signal
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+
+import db
+from logger import logger
+from token_refresh import registrar_renovacao, token_expirado
+from trava_execucao import TravaOcupada, trava_de_script, trava_execucao
+
+JOBS_STATUS_FILE = os.getenv("JOBS_STATUS_FILE", "jobs_status.json")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+
+
+class TokenIndisponivel(RuntimeError):
+    """O token expirou e a renovação feita antes do job não o trouxe de volta."""
+
+
+class Job:
+    """Tarefa periódica com trava própria para não sobrepor execuções."""
+
+    def __init__(self, nome: str, funcao: Callable[[], object], intervalo_min: float,
+                 requer_token: bool = True):
+        self.nome = nome
+        self.funcao = funcao
+        self.intervalo = timedelta(minutes=intervalo_min)
+        self.requer_token = requer_token
+        self.proxima_execucao = datetime.now()
+        self.trava = threading.Lock()
+        self.estado: Dict[str, object] = {
+            "estado": "aguardando",
+            "intervalo_min": intervalo_min,
+            "execucoes": 0,
+            "falhas": 0,
+            "ultimo_inicio": None,
+            "ultimo_fim": None,
+            "ultima_duracao_s": None,
+            "ultimo_sucesso": None,
+            "ultimo_erro": None,
+            "proxima_execucao": self.proxima_execucao.isoformat(timespec="seconds"),
+        }
+
+
+class Agendador:
+    """Executa os jobs registrados nos seus intervalos, em threads próprias."""
+
+    def __init__(self, status_file: str = JOBS_STATUS_FILE):
+        self.status_file = status_file
+        self.jobs: Dict[str, Job] = {}
+        self._parar = threading.Event()
+        self._trava_status = threading.Lock()
+        self._threads: Dict[str, threading.Thread] = {}
+
+    def registrar(self, job: Job) -> None:
+        self.jobs[job.nome] = job
+
+    def _salvar_status(self) -> None:
+        """Grava o estado de todos os jobs de forma atômica (tmp + rename)."""
+        with self._trava_status:
+            dados = {
+                "atualizado_em": datetime.now().isoformat(timespec="seconds"),
+                "pid": os.getpid(),
+                "jobs": {nome: job.estado for nome, job in self.jobs.items()},
+            }
+            tmp = f"{self.status_file}.tmp"
+            try:
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(dados, f, ensure_ascii=False, default=str)
+                os.replace(tmp, self.status_file)
+            except OSError as e:
+                logger.warning("Falha ao gravar %s: %s", self.status_file, e)
+
+    def executar(self, job: Job) -> bool:
+        """Executa o job agora, se ele não estiver em andamento.
+
+        Com o token expirado, renova antes (ou espera a renovação já em curso);
+        se ele continuar expirado, o job é pulado até o próximo intervalo.
+
+        Returns:
+            bool: False quando a execução foi pulada por já haver uma em curso.
+        """
+        if not job.trava.acquire(blocking=False):
+            logger.warning("Job %s ainda em execução; disparo ignorado", job.nome)
+            return False
+        try:
+            sem_token = False
+            if job.requer_token and "token" in self.jobs and token_expirado():
+                logger.info("Token expirado antes do job %s; renovando primeiro", job.nome)
+                token = self.jobs["token"]
+                if not self.executar(token):
+                    # Renovação já em curso em outra thread: espera ela terminar
+                    with token.trava:
+                        pass
+                sem_token = token_expirado()
+
+            inicio = datetime.now()
+            job.estado.update(estado="executando", ultimo_inicio=inicio.isoformat(timespec="seconds"))
+            self._salvar_status()
+            logger.info("Job %s iniciado", job.nome)
+            try:
+                if sem_token:
+                    raise TokenIndisponivel("token expirado e não renovado")
+                with trava_execucao(job.nome, espera_seg=0):
+                    resultado = job.funcao()
+                if resultado is False:
+                    raise RuntimeError("job retornou falha")
+                job.estado.update(ultimo_sucesso=True, ultimo_erro=None)
+            except (TravaOcupada, TokenIndisponivel) as e:
+                # Execução avulsa (cron/manual) em curso ou renovação do token
+                # sem sucesso: o job não roda e não conta como falha
+                job.estado.update(ultimo_sucesso=None, ultimo_erro=str(e))
+                logger.warning("Job %s ignorado: %s", job.nome, e)
+            except Exception as e:
+                job.estado["falhas"] += 1
+                job.estado.update(ultimo_sucesso=False, ultimo_erro=str(e))
+                logger.exception("Job %s falhou", job.nome)
+            fim = datetime.now()
+            job.proxima_execucao = fim + job.intervalo
+            job.estado["execucoes"] += 1
+            job.estado.update(
+                estado="aguardando",
+                ultimo_fim=fim.isoformat(timespec="seconds"),
+                ultima_duracao_s=round((fim - inicio).total_seconds(), 1),
+                proxima_execucao=job.proxima_execucao.isoformat(timespec="seconds"),
+            )
+            self._salvar_status()
+            logger.info("Job %s finalizado em %ss", job.nome, job.estado["ultima_duracao_s"])
+            return True
+        finally:
+            job.trava.release()
+
+    def _disparar(self, job: Job) -> None:
+        """Inicia o job em uma thread, a menos que a anterior ainda esteja viva."""
+        thread = self._threads.get(job.nome)
+        if thread is not None and thread.is_alive():
+            return
+        thread = threading.Thread(target=self.executar, args=(job,), name=f"job-{job.nome}", daemon=True)
+        self._threads[job.nome] = thread
+        thread.start()
+
+    def rodar(self, tick_s: float = 1.0) -> None:
+        """Laço principal: dispara os jobs vencidos até receber sinal de parada."""
+        logger.info("Agendador iniciado com jobs: %s", ", ".join(self.jobs))
+        self._salvar_status()
+        while not self._parar.is_set():
+            agora = datetime.now()
+            for job in self.jobs.values():
+                if agora >= job.proxima_execucao:
+                    self._disparar(job)
+            self._parar.wait(tick_s)
+        logger.info("Agendador parando; aguardando jobs em execução")
+        for thread in self._threads.values():
+            thread.join()
+        for job in self.jobs.values():
+            job.estado["estado"] = "parado"
+        self._salvar_status()
+
+    def parar(self, *_args) -> None:
+        self._parar.set()
+
+
+def _job_produtos() -> None:
+    import main
+    main.main()
+
+
+def _job_clientes() -> None:
+    from sincronizar_clientes import sincronizar_clientes
+    sincronizar_clientes()
+
+
+def _job_pedidos() -> None:
+    from sincronizar_pedidos import sincronizar_pedidos
+    sincronizar_pedidos()
+
+
+def _job_token() -> bool:
+    from atualiza_token_totoro import atualizar_tokens_bling
+    if not atualizar_tokens_bling():
+        return False
+    registrar_renovacao()
+    return True
+
+
+def _job_estoque() -> None:
+    from sincronizar_estoque import sincronizar_estoque
+    sincronizar_estoque()
+
+
+def _job_imagens() -> None:
+    from imagens import sincronizar_imagens
+    sincronizar_imagens()
+
+
+def _job_webhooks() -> None:
+    import webhooks
+    webhooks.processar_fila()
+
+
+def criar_agendador(status_file: Optional[str] = None) -> Agendador:
+    """Monta o agendador com os jobs padrão e intervalos vindos do ambiente."""
+    agendador = Agendador(status_file or JOBS_STATUS_FILE)
+    token = Job("token", _job_token, float(os.getenv("AGENDA_TOKEN_MIN", "360")), requer_token=False)
+    if not token_expirado():
+        token.proxima_execucao = datetime.now() + token.intervalo
+        token.estado["proxima_execucao"] = token.proxima_execucao.isoformat(timespec="seconds")
+    agendador.registrar(token)
+    agendador.registrar(Job("produtos", _job_produtos, float(os.getenv("AGENDA_PRODUTOS_MIN", "60"))))
+    agendador.registrar(Job("clientes", _job_clientes, float(os.getenv("AGENDA_CLIENTES_MIN", "120"))))
+    agendador.registrar(Job("pedidos", _job_pedidos, float(os.getenv("AGENDA_PEDIDOS_MIN", "30"))))
+    agendador.registrar(Job("estoque", _job_estoque, float(os.getenv("AGENDA_ESTOQUE_MIN", "5"))))
+    agendador.registrar(Job("imagens", _job_imagens, float(os.getenv("AGENDA_IMAGENS_MIN", "60")),
+                            requer_token=False))
+    agendador.registrar(Job("webhooks", _job_webhooks, float(os.getenv("AGENDA_WEBHOOKS_MIN", "0.5"))))
+    return agendador
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Daemon de sincronização Bling")
+    parser.add_argument(
+        "--somente", nargs="+", metavar="JOB",
+        help="Registra apenas os jobs informados (token, produtos, clientes, pedidos, estoque, imagens, webhooks)",
+    )
+    args = parser.parse_args()
+
+    db.ativar_pool(DB_POOL_SIZE)
+    agendador = criar_agendador()
+    if args.somente:
+        agendador.jobs = {n: j for n, j in agendador.jobs.items() if n in args.somente}
+
+    signal.signal(signal.SIGTERM, agendador.parar)
+    signal.signal(signal.SIGINT, agendador.parar)
+    with trava_de_script("agendador"):
+        agendador.rodar()
+
+
+if __name__ == "__main__":
+    main()
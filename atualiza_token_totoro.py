@@ -41,7 +41,12 @@ DB_CONFIG = {
     'database': 'acdcco13_banquinho'
 }
 
-def atualizar_tokens_bling():
+def atualizar_tokens_bling() -> bool:
+    """Renova os tokens do Bling e grava em configuracoes_api e no .env.
+
+    Returns:
+        bool: True se os tokens foram renovados e persistidos.
+    """
     try:
         # Obter credenciais do .env
         refresh_token = os.getenv('BLING_REFRESH_TOKEN')
@@ -51,7 +56,7 @@ def atualizar_tokens_bling():
         if not all([refresh_token, client_id, client_secret]):
             logger.error("Credenciais incompletas para renovação do token. Verifique BLING_REFRESH_TOKEN, BLING_CLIENT_ID e BLING_CLIENT_SECRET no .env")
             print("[ERRO] Credenciais incompletas no arquivo .env")
-            return
+            return False
 
         # Conectar ao banco
         conn = mysql.connector.connect(**DB_CONFIG)
@@ -78,7 +83,7 @@ def atualizar_tokens_bling():
         if not new_access_token:
             logger.error("Resposta de token sem access_token.")
             print("[ERRO] Resposta da API sem access_token")
-            return
+            return False
 
         # Atualizar access_token no banco
         cursor.execute("UPDATE configuracoes_api SET valor = %s WHERE chave = 'totoro_access_token'", (new_access_token,))
@@ -97,6 +102,7 @@ def atualizar_tokens_bling():
         
         logger.info("Token do Bling renovado com sucesso.")
         print("[SUCESSO] Access Token e Refresh Token atualizados com sucesso no banco e .env.")
+        return True
 
     except requests.exceptions.HTTPError as e:
         status = getattr(e.response, "status_code", "?")
@@ -118,7 +124,9 @@ def atualizar_tokens_bling():
         if 'conn' in locals() and conn.is_connected():
             cursor.close()
             conn.close()
+    return False
 
 
 # Executar
-atualizar_tokens_bling()
+if __name__ == "__main__":
+    atualizar_tokens_bling()
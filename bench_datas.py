@@ -0,0 +1,105 @@
+"""Benchmark da detecção de alteração de contatos (_api_data_alteracao).
+
+Simula páginas de 100 contatos no formato de detalhes do Bling v3 e compara o
+parser antigo (regex sem compilar + fromisoformat + strptime em exceções,
+sondando todas as chaves) com o caminho rápido memorizado de
+``sincronizar_clientes``.
+
+Uso:
+    python bench_datas.py [paginas]
+"""
+import re
+import sys
+import time
+from datetime import datetime, timezone
+
+import sincronizar_clientes as sc
+
+
+def _gerar_pagina(pagina: int) -> list:
+    """Gera 100 contatos com o campo de alteração fora das primeiras chaves."""
+    contatos = []
+    for i in range(100):
+        # Muitos contatos compartilham o mesmo timestamp (importações em lote)
+        minuto = (pagina * 100 + i) // 7 % 60
+        contatos.append({
+            "id": pagina * 1000 + i,
+            "nome": f"Cliente {i}",
+            "metadata": {"dataAtualizacao": f"2024-05-{1 + i % 28:02d} 10:{minuto:02d}:00"},
+        })
+    return contatos
+
+
+def _legado_parse(value):
+    if not value:
+        return None
+    s = str(value).strip()
+    try:
+        if s.endswith('Z'):
+            s = s[:-1] + '+00:00'
+        m = re.search(r"([+-]\d{2})(\d{2})$", s)
+        if m and ':' not in s[-6:]:
+            s = s[:-5] + f"{m.group(1)}:{m.group(2)}"
+        dt = datetime.fromisoformat(s)
+        if dt.tzinfo is not None:
+            dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+        return dt
+    except Exception:
+        for fmt in (
+            "%Y-%m-%d %H:%M:%S%z",
+            "%Y-%m-%dT%H:%M:%S%z",
+            "%Y-%m-%d %H:%M:%S",
+            "%Y-%m-%dT%H:%M:%S",
+            "%Y-%m-%d",
+        ):
+            try:
+                dt = datetime.strptime(s, fmt)
+                if "%z" in fmt and dt.tzinfo is not None:
+                    dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+                return dt
+            except Exception:
+                continue
+    return None
+
+
+def _legado_data_alteracao(cliente):
+    chaves = (
+        'atualizadoEm', 'dataAlteracao', 'data_alteracao',
+        'updatedAt', 'updated_at', 'dataAtualizacao', 'alteradoEm'
+    )
+    for key in chaves:
+        if key in cliente and cliente.get(key):
+            return _legado_parse(cliente.get(key))
+    meta = cliente.get('metadata') or cliente.get('meta') or {}
+    for key in chaves:
+        if key in meta and meta.get(key):
+            return _legado_parse(meta.get(key))
+    return None
+
+
+def _medir(nome: str, func, paginas: list) -> float:
+    inicio = time.perf_counter()
+    for contatos in paginas:
+        for c in contatos:
+            func(c)
+    total = time.perf_counter() - inicio
+    por_pagina = total / len(paginas) * 1e6
+    print(f"{nome:<24} {total:8.4f}s  ({por_pagina:,.1f} µs por página de 100)")
+    return total
+
+
+def main() -> None:
+    qtd = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    paginas = [_gerar_pagina(p) for p in range(qtd)]
+    print(f"Processando {qtd} páginas de 100 contatos")
+
+    legado = _medir("legado", _legado_data_alteracao, paginas)
+    novo = _medir("rápido + cache", sc._api_data_alteracao, paginas)
+    assert all(
+        sc._api_data_alteracao(c) == _legado_data_alteracao(c) for c in paginas[0]
+    )
+    print(f"Ganho: {legado / novo:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
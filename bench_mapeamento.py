@@ -0,0 +1,121 @@
+"""Micro-benchmark do mapeamento de produtos (payload da API -> parâmetros do upsert).
+
+Compara o caminho antigo (dict intermediário em main._mapear_produto seguido de
+db._params_upsert) com o mapeamento único de ``mapeamento.mapear_produto``.
+
+Uso:
+    python bench_mapeamento.py [quantidade]
+"""
+import sys
+import time
+
+from mapeamento import mapear_produto
+
+
+def _gerar_produtos(qtd: int) -> list:
+    """Gera payloads sintéticos no formato da listagem de produtos do Bling v3."""
+    produtos = []
+    for i in range(1, qtd + 1):
+        produtos.append({
+            "id": 16000000000 + i,
+            "codigo": f"SKU-{i:06d}",
+            "nome": f"Produto sintético {i}",
+            "preco": f"{i % 500},{i % 100:02d}" if i % 2 else i % 500 + 0.99,
+            "tipo": "P",
+            "situacao": "Ativo" if i % 7 else "Inativo",
+            "formato": "S",
+            "estoque": {"saldoVirtualTotal": i % 37},
+            "dimensoes": {"largura": "10,5", "altura": 3, "profundidade": "7.25"},
+            "pesoLiquido": "0,350",
+            "pesoBruto": 0.4,
+        })
+    return produtos
+
+
+def _legado_float(value):
+    if value is None:
+        return 0.0
+    try:
+        return float(str(value).replace(",", "."))
+    except (ValueError, TypeError):
+        return 0.0
+
+
+def _legado_int(value):
+    try:
+        return int(float(str(value).replace(",", ".")))
+    except (ValueError, TypeError):
+        return 0
+
+
+def _legado_mapear(p: dict) -> dict:
+    estoque = 0
+    if 'estoques' in p and p['estoques']:
+        for deposito in p['estoques']:
+            estoque += _legado_float(deposito.get('saldoVirtualTotal', 0))
+    dimensoes = p.get('dimensoes', {})
+    return {
+        "id_bling": int(p.get("id")),
+        "codigo": p.get("codigo"),
+        "nome": p.get("nome"),
+        "preco": p.get("preco", 0),
+        "estoque": (p.get("estoque") or {}).get("saldoVirtualTotal", 0),
+        "tipo": p.get("tipo"),
+        "situacao": (p.get("situacao") or "")[:1],
+        "formato": p.get("formato"),
+        "largura": _legado_float(dimensoes.get("largura")),
+        "altura": _legado_float(dimensoes.get("altura")),
+        "profundidade": _legado_float(dimensoes.get("profundidade")),
+        "peso_liquido": p.get("pesoLiquido"),
+        "peso_bruto": p.get("pesoBruto"),
+    }
+
+
+def _legado_params(produto: dict) -> tuple:
+    return (
+        int(produto["id_bling"]),
+        produto.get("codigo"),
+        (produto.get("nome") or "")[:255],
+        _legado_float(produto.get("preco")),
+        _legado_int(produto.get("estoque")),
+        produto.get("tipo"),
+        (produto.get("situacao") or "")[:1],
+        produto.get("formato"),
+        _legado_float(produto.get("largura")),
+        _legado_float(produto.get("altura")),
+        _legado_float(produto.get("profundidade")),
+        _legado_float(produto.get("peso_liquido")),
+        _legado_float(produto.get("peso_bruto")),
+    )
+
+
+def _medir(nome: str, func, produtos: list, repeticoes: int = 3) -> float:
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        func(produtos)
+        melhor = min(melhor, time.perf_counter() - inicio)
+    print(f"{nome:<28} {melhor:8.3f}s  ({len(produtos) / melhor:,.0f} produtos/s)")
+    return melhor
+
+
+def main() -> None:
+    qtd = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    produtos = _gerar_produtos(qtd)
+    print(f"Mapeando {qtd:,} produtos sintéticos (melhor de 3)")
+
+    legado = _medir(
+        "legado (dict + params)",
+        lambda ps: [_legado_params(_legado_mapear(p)) for p in ps if p.get("id")],
+        produtos,
+    )
+    novo = _medir(
+        "mapear_produto (tupla)",
+        lambda ps: [mapear_produto(p) for p in ps if p.get("id")],
+        produtos,
+    )
+    print(f"Ganho: {legado / novo:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,26 @@
-"""Cliente simples para consumo da API v3 do Bling (produtos)."""
+"""Cliente simples para consumo da API v3 do Bling (produtos e listagens genéricas)."""
 import os
 from time import sleep
 
 import requests
 from dotenv import load_dotenv
+import gravacao_api
+from json_rapido import extrair_data, loads
+from limite_taxa import aguardar_vez
 from logger import logger
 
 load_dotenv()
 
+BLING_API_URL = "https://www.bling.com.br/Api/v3"
+
+
+class FalhaListagem(RuntimeError):
+    """Página de listagem não obtida após as retentativas (diferente do fim da paginação)."""
+
+
+_sessao = None
+_sessao_pid = None
+
 
 def _get_auth_headers():
     """Headers de autenticação (Bearer) para chamadas à API do Bling."""
@@ -17,44 +30,67 @@ def _get_auth_headers():
     }
 
 
-def buscar_produtos(pagina: int = 1):
-    """Busca a página informada de produtos.
+def obter_sessao() -> requests.Session:
+    """Sessão HTTP (keep-alive) do processo atual.
 
-    Args:
-        pagina: número da página (1-based)
+    Cada processo cria a sua; uma sessão herdada via fork não é reutilizada.
+    """
+    global _sessao, _sessao_pid
+    if _sessao is None or _sessao_pid != os.getpid():
+        _sessao = requests.Session()
+        _sessao_pid = os.getpid()
+    return _sessao
 
-    Returns:
-        list: lista de produtos (cada item é um dict).
+
+def _get(url: str, params=None, timeout: int = 30) -> requests.Response:
+    """GET autenticado na API do Bling respeitando o limite de taxa compartilhado.
+
+    Em modo de reprodução (BLING_REPRODUZIR_DIR) a resposta vem da gravação, sem
+    rede; em modo de gravação (BLING_GRAVAR_DIR) a resposta também é gravada
+    (ver ``gravacao_api``).
     """
-    url = "https://www.bling.com.br/Api/v3/produtos"
-    params = {"pagina": pagina, "limite": 100, "criterio": "cadastro", "ordem": "DESC"}
+    if gravacao_api.diretorio_reproducao():
+        return gravacao_api.reproduzir(url, params)
+    aguardar_vez()
+    resp = obter_sessao().get(url, params=params, headers=_get_auth_headers(), timeout=timeout)
+    gravacao_api.gravar(url, params, resp)
+    return resp
+
+
+def _com_retentativas(descricao: str, requisicao, padrao):
+    """Executa ``requisicao()`` com a política de retentativas padrão da integração.
 
-    max_retries, retry_delay, timeout = 3, 5, 30
+    Timeouts e erros HTTP/rede são repetidos até 3 vezes (5s de espera); resposta
+    não JSON encerra na hora. Em falha definitiva devolve ``padrao``.
+
+    Args:
+        descricao: complemento das mensagens de log (ex.: "produtos (página 2)").
+    """
+    max_retries, retry_delay = 3, 5
+    if gravacao_api.diretorio_reproducao():
+        retry_delay = 0  # sem rede: esperar não muda a resposta gravada
 
     for attempt in range(max_retries):
         try:
-            resp = requests.get(url, params=params, headers=_get_auth_headers(), timeout=timeout)
-            resp.raise_for_status()
-            data = resp.json()
-            return data.get("data", [])
+            return requisicao()
         except requests.exceptions.Timeout:
             if attempt < max_retries - 1:
                 logger.warning(
-                    "Timeout ao buscar produtos (página %s). Tentativa %s/%s. Aguardando %ss...",
-                    pagina,
+                    "Timeout ao buscar %s. Tentativa %s/%s. Aguardando %ss...",
+                    descricao,
                     attempt + 1,
                     max_retries,
                     retry_delay,
                 )
                 sleep(retry_delay)
                 continue
-            logger.error("Timeout definitivo ao buscar produtos (página %s)", pagina)
+            logger.error("Timeout definitivo ao buscar %s", descricao)
             break
         except requests.exceptions.RequestException as e:
             if attempt < max_retries - 1:
                 logger.warning(
-                    "Erro ao buscar produtos (página %s): %s. Tentativa %s/%s. Aguardando %ss...",
-                    pagina,
+                    "Erro ao buscar %s: %s. Tentativa %s/%s. Aguardando %ss...",
+                    descricao,
                     e,
                     attempt + 1,
                     max_retries,
@@ -62,12 +98,72 @@ def buscar_produtos(pagina: int = 1):
                 )
                 sleep(retry_delay)
                 continue
-            logger.error("Erro ao buscar produtos (página %s): %s", pagina, e)
+            logger.error("Erro ao buscar %s: %s", descricao, e)
             break
         except ValueError:
-            logger.error("Resposta inválida (não JSON) para produtos (página %s)", pagina)
+            logger.error("Resposta inválida (não JSON) para %s", descricao)
             break
-    return []
+    return padrao
+
+
+_FALHA = object()
+
+
+def buscar_pagina(recurso: str, pagina: int = 1, params=None, limite: int = 100,
+                  descricao: str = None) -> list:
+    """Busca uma página de qualquer listagem da API v3 (ex.: "produtos", "pedidos/vendas").
+
+    Returns:
+        list: itens da página; lista vazia apenas no fim da paginação.
+
+    Raises:
+        FalhaListagem: se a página não foi obtida (timeout, erro HTTP/rede ou
+            resposta inválida), para que a listagem não pareça completa.
+    """
+    url = f"{BLING_API_URL}/{recurso}"
+    params = {"pagina": pagina, "limite": limite, **(params or {})}
+
+    def requisicao():
+        resp = _get(url, params=params, timeout=30)
+        resp.raise_for_status()
+        return extrair_data(resp.content)
+
+    descricao = f"{descricao or recurso} (página {pagina})"
+    itens = _com_retentativas(descricao, requisicao, _FALHA)
+    if itens is _FALHA:
+        raise FalhaListagem(f"Falha ao buscar {descricao}")
+    return itens
+
+
+def buscar_registro(recurso: str, id_registro: int, descricao: str = None):
+    """Busca um registro pelo ID (``GET /<recurso>/<id>``).
+
+    Returns:
+        dict | None: conteúdo de ``data`` ou None em caso de erro/ausência.
+    """
+    url = f"{BLING_API_URL}/{recurso}/{id_registro}"
+
+    def requisicao():
+        resp = _get(url, timeout=30)
+        resp.raise_for_status()
+        return loads(resp.content).get("data")
+
+    return _com_retentativas(f"{descricao or recurso} {id_registro}", requisicao, None)
+
+
+def buscar_produtos(pagina: int = 1):
+    """Busca a página informada de produtos.
+
+    Args:
+        pagina: número da página (1-based)
+
+    Returns:
+        list: lista de produtos (cada item é um dict).
+
+    Raises:
+        FalhaListagem: se a página não foi obtida.
+    """
+    return buscar_pagina("produtos", pagina, {"criterio": "cadastro", "ordem": "DESC"})
 
 
 def buscar_detalhes_produto(id_produto: int):
@@ -76,43 +172,27 @@ def buscar_detalhes_produto(id_produto: int):
     Returns:
         dict | None: Detalhes do produto ou None em caso de erro/ausência.
     """
-    url = f"https://www.bling.com.br/Api/v3/produtos/{id_produto}"
-    max_retries, retry_delay, timeout = 3, 5, 30
+    return buscar_registro("produtos", id_produto, descricao="detalhes do produto")
 
-    for attempt in range(max_retries):
-        try:
-            resp = requests.get(url, headers=_get_auth_headers(), timeout=timeout)
-            resp.raise_for_status()
-            data = resp.json()
-            return data.get("data")
-        except requests.exceptions.Timeout:
-            if attempt < max_retries - 1:
-                logger.warning(
-                    "Timeout ao buscar detalhes do produto %s. Tentativa %s/%s. Aguardando %ss...",
-                    id_produto,
-                    attempt + 1,
-                    max_retries,
-                    retry_delay,
-                )
-                sleep(retry_delay)
-                continue
-            logger.error("Timeout definitivo ao buscar detalhes do produto %s", id_produto)
-            break
-        except requests.exceptions.RequestException as e:
-            if attempt < max_retries - 1:
-                logger.warning(
-                    "Erro ao buscar detalhes do produto %s: %s. Tentativa %s/%s. Aguardando %ss...",
-                    id_produto,
-                    e,
-                    attempt + 1,
-                    max_retries,
-                    retry_delay,
-                )
-                sleep(retry_delay)
-                continue
-            logger.error("Erro ao buscar detalhes do produto %s: %s", id_produto, e)
-            break
-        except ValueError:
-            logger.error("Resposta inválida (não JSON) para detalhes do produto %s", id_produto)
-            break
-    return None
+
+def buscar_saldos_estoque(ids_produtos):
+    """Busca os saldos de estoque de vários produtos em uma única requisição.
+
+    Args:
+        ids_produtos: IDs de produto do Bling (recomendado até 100 por chamada).
+
+    Returns:
+        list: itens com produto.id, saldoFisicoTotal e saldoVirtualTotal;
+        lista vazia em caso de erro.
+    """
+    url = f"{BLING_API_URL}/estoques/saldos"
+    params = {"idsProdutos[]": [int(i) for i in ids_produtos]}
+
+    def requisicao():
+        resp = _get(url, params=params, timeout=30)
+        resp.raise_for_status()
+        return extrair_data(resp.content)
+
+    return _com_retentativas(
+        f"saldos de estoque ({len(params['idsProdutos[]'])} produtos)", requisicao, []
+    )
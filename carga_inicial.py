@@ -0,0 +1,156 @@
+"""Carga em massa de produtos e clientes via LOAD DATA LOCAL INFILE.
+
+Para o primeiro povoamento do banco ou recuperação de desastre: os registros
+mapeados são gravados em streaming num arquivo temporário delimitado por TAB,
+carregados com ``LOAD DATA LOCAL INFILE`` em uma tabela de staging temporária e
+mesclados na tabela final com um único ``INSERT ... SELECT ... ON DUPLICATE KEY
+UPDATE``.
+
+Os detalhes de produto (imagem, dimensões do detalhe) continuam sendo
+preenchidos pela próxima execução normal do ``main.py``.
+
+O servidor MySQL precisa de ``local_infile=ON``.
+
+Uso:
+    python carga_inicial.py [--somente produtos|clientes] [--sem-detalhes-clientes]
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import tempfile
+from typing import Iterable, Sequence
+
+import db
+from bling_clientes import buscar_detalhes_cliente
+from logger import logger
+from mapeamento import ProdutoMapeado, mapear_produto
+from motor_sync import PRODUTOS, Entidade, listar
+from sincronizar_clientes import CAMPOS_CLIENTE, CLIENTES, _params_cliente
+
+_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r", "\0": "\\0"})
+
+
+def _campo_tsv(valor) -> str:
+    """Formata um valor no formato padrão do LOAD DATA (\\N para NULL)."""
+    if valor is None:
+        return "\\N"
+    if isinstance(valor, str):
+        return valor.translate(_ESCAPES)
+    return str(valor)
+
+
+def _gravar_tsv(arquivo, linhas: Iterable[Sequence]) -> int:
+    total = 0
+    for linha in linhas:
+        arquivo.write("\t".join(_campo_tsv(v) for v in linha))
+        arquivo.write("\n")
+        total += 1
+    return total
+
+
+def carregar_via_staging(conn, tabela: str, colunas: Sequence[str], chave: str,
+                         linhas: Iterable[Sequence]) -> int:
+    """Grava as linhas em arquivo temporário, carrega em staging e mescla na tabela.
+
+    Returns:
+        int: linhas gravadas no arquivo de carga.
+    """
+    staging = f"stg_{tabela}"
+    lista_colunas = ", ".join(colunas)
+    atualizacoes = ", ".join(f"{c} = VALUES({c})" for c in colunas if c != chave)
+
+    fd, caminho = tempfile.mkstemp(prefix=f"{tabela}_", suffix=".tsv")
+    cursor = conn.cursor()
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="\n") as arquivo:
+            total = _gravar_tsv(arquivo, linhas)
+        logger.info("Arquivo de carga de %s com %s linhas: %s", tabela, total, caminho)
+        if not total:
+            return 0
+
+        cursor.execute(f"DROP TEMPORARY TABLE IF EXISTS {staging}")
+        cursor.execute(f"CREATE TEMPORARY TABLE {staging} LIKE {tabela}")
+        cursor.execute(
+            f"""
+            LOAD DATA LOCAL INFILE %s INTO TABLE {staging}
+            CHARACTER SET utf8mb4
+            FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\'
+            LINES TERMINATED BY '\\n'
+            ({lista_colunas})
+            """,
+            (caminho,),
+        )
+        logger.info("LOAD DATA em %s: %s linhas", staging, cursor.rowcount)
+        cursor.execute(
+            f"""
+            INSERT INTO {tabela} ({lista_colunas})
+            SELECT {lista_colunas} FROM {staging}
+            ON DUPLICATE KEY UPDATE {atualizacoes}
+            """
+        )
+        conn.commit()
+        cursor.execute(f"DROP TEMPORARY TABLE IF EXISTS {staging}")
+        return total
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        os.remove(caminho)
+
+
+def _paginar(entidade: Entidade) -> Iterable[dict]:
+    """Itens da listagem ancorada e sem repetições de ``motor_sync.listar``."""
+    for itens in listar(entidade):
+        yield from itens
+
+
+def _linhas_produtos() -> Iterable[ProdutoMapeado]:
+    for p in _paginar(PRODUTOS):
+        if p.get("id"):
+            yield mapear_produto(p)
+
+
+def _linhas_clientes(com_detalhes: bool) -> Iterable[tuple]:
+    for cliente in _paginar(CLIENTES):
+        if not cliente.get("id"):
+            continue
+        if com_detalhes:
+            cliente = buscar_detalhes_cliente(cliente["id"]) or cliente
+        yield _params_cliente(cliente)
+
+
+def carga_produtos(conn) -> int:
+    return carregar_via_staging(
+        conn, "produtos_bling", ProdutoMapeado.CAMPOS, "id_bling", _linhas_produtos()
+    )
+
+
+def carga_clientes(conn, com_detalhes: bool = True) -> int:
+    return carregar_via_staging(
+        conn, "clientes_bling", CAMPOS_CLIENTE, "id", _linhas_clientes(com_detalhes)
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Carga inicial em massa (LOAD DATA) a partir do Bling")
+    parser.add_argument("--somente", choices=("produtos", "clientes"),
+                        help="Carrega apenas uma das tabelas")
+    parser.add_argument("--sem-detalhes-clientes", action="store_true",
+                        help="Usa só os dados da listagem de contatos (sem endereço; muito mais rápido)")
+    args = parser.parse_args()
+
+    conn = db.conectar_mysql(local_infile=True)
+    try:
+        if args.somente in (None, "produtos"):
+            logger.warning("Carga de produtos concluída: %s linhas", carga_produtos(conn))
+        if args.somente in (None, "clientes"):
+            total = carga_clientes(conn, com_detalhes=not args.sem_detalhes_clientes)
+            logger.warning("Carga de clientes concluída: %s linhas", total)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""Consultas de contatos para o monitor (token_monitor), priorizando dados locais.
+
+``buscar_lote`` resolve uma lista de IDs em três etapas:
+1. ``clientes_bling``, em uma única consulta ``WHERE id IN (...)``;
+2. cache em memória do processo com os contatos trazidos do Bling há menos de
+   CONTATOS_CACHE_TTL_SEG;
+3. o restante é buscado no Bling em paralelo (CONTATOS_LOTE_WORKERS threads),
+   respeitando o limite de requisições compartilhado com a sincronização
+   (``limite_taxa``).
+
+Cada ID recebe um status: ``local``, ``cache``, ``api``, ``nao_encontrado`` ou
+``invalido``.
+
+``pesquisar`` busca em ``clientes_bling`` usando os índices da migração 5:
+igualdade em documento, telefone/celular e email (normalizados como em
+``sincronizar_clientes``), FULLTEXT ou prefixo em nome/fantasia, com paginação
+por keyset (``id > apos``).
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from bling_clientes import buscar_detalhes_cliente
+from db import conectar_mysql
+from limite_taxa import obter_limitador
+from logger import logger
+from sincronizar_clientes import CAMPOS_CLIENTE, _limpar_campo, _to_upper
+
+CONTATOS_LOTE_MAX = int(os.getenv("CONTATOS_LOTE_MAX", "500"))
+CONTATOS_LOTE_WORKERS = int(os.getenv("CONTATOS_LOTE_WORKERS", "4"))
+CONTATOS_CACHE_TTL_SEG = float(os.getenv("CONTATOS_CACHE_TTL_SEG", "300"))
+BUSCA_CLIENTES_MAX = 200
+
+# Tamanho mínimo de palavra indexada pelo FULLTEXT do InnoDB (innodb_ft_min_token_size)
+_FT_MIN_TOKEN = 3
+_CARACTERES_FT = str.maketrans({c: " " for c in '+-<>()~*"@'})
+
+_cache: Dict[int, Tuple[float, dict]] = {}
+_cache_lock = threading.Lock()
+
+
+def _normalizar_ids(ids: Iterable) -> Tuple[List[int], List]:
+    """Separa IDs válidos (inteiros positivos, sem repetição) dos inválidos."""
+    validos, invalidos, vistos = [], [], set()
+    for valor in ids:
+        try:
+            id_contato = int(valor)
+        except (TypeError, ValueError):
+            invalidos.append(valor)
+            continue
+        if id_contato <= 0:
+            invalidos.append(valor)
+        elif id_contato not in vistos:
+            vistos.add(id_contato)
+            validos.append(id_contato)
+    return validos, invalidos
+
+
+def _buscar_locais(ids: List[int]) -> Dict[int, dict]:
+    """Contatos já sincronizados em clientes_bling, em uma única consulta."""
+    if not ids:
+        return {}
+    conn = conectar_mysql()
+    cursor = conn.cursor()
+    try:
+        marcadores = ", ".join(["%s"] * len(ids))
+        cursor.execute(
+            f"SELECT {', '.join(CAMPOS_CLIENTE)} FROM clientes_bling WHERE id IN ({marcadores})",
+            ids,
+        )
+        return {int(row[0]): dict(zip(CAMPOS_CLIENTE, row)) for row in cursor.fetchall()}
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _do_cache(id_contato: int):
+    with _cache_lock:
+        item = _cache.get(id_contato)
+        if item and time.monotonic() - item[0] < CONTATOS_CACHE_TTL_SEG:
+            return item[1]
+        _cache.pop(id_contato, None)
+    return None
+
+
+def _guardar_cache(id_contato: int, dados: dict) -> None:
+    with _cache_lock:
+        _cache[id_contato] = (time.monotonic(), dados)
+
+
+def buscar_lote(ids: Iterable, workers: int = CONTATOS_LOTE_WORKERS) -> Dict[str, dict]:
+    """Resolve uma lista de IDs de contato, localmente primeiro e depois no Bling.
+
+    Returns:
+        dict: {id (str): {"status": ..., "origem": "bling"|"local", "data": ...}}.
+
+    Raises:
+        ValueError: se a lista tiver mais de CONTATOS_LOTE_MAX IDs.
+    """
+    validos, invalidos = _normalizar_ids(ids)
+    if len(validos) > CONTATOS_LOTE_MAX:
+        raise ValueError(f"Máximo de {CONTATOS_LOTE_MAX} IDs por requisição")
+
+    resultado: Dict[str, dict] = {str(v): {"status": "invalido", "data": None} for v in invalidos}
+
+    locais = _buscar_locais(validos)
+    restantes = []
+    for id_contato in validos:
+        if id_contato in locais:
+            resultado[str(id_contato)] = {"status": "local", "origem": "local", "data": locais[id_contato]}
+            continue
+        dados = _do_cache(id_contato)
+        if dados is not None:
+            resultado[str(id_contato)] = {"status": "cache", "origem": "bling", "data": dados}
+        else:
+            restantes.append(id_contato)
+
+    if restantes:
+        obter_limitador()  # cria o limitador antes das threads
+        logger.info(
+            "Lote de contatos: %s locais, %s da API (%s threads)",
+            len(validos) - len(restantes), len(restantes), workers,
+        )
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(restantes)))) as executor:
+            for id_contato, dados in zip(restantes, executor.map(buscar_detalhes_cliente, restantes)):
+                if dados:
+                    _guardar_cache(id_contato, dados)
+                    resultado[str(id_contato)] = {"status": "api", "origem": "bling", "data": dados}
+                else:
+                    resultado[str(id_contato)] = {"status": "nao_encontrado", "data": None}
+
+    return resultado
+
+
+def _filtro_nome(termo: str) -> Tuple[str, list]:
+    """FULLTEXT (todas as palavras indexáveis, por prefixo) ou LIKE por prefixo para termos curtos."""
+    palavras = [p for p in termo.translate(_CARACTERES_FT).split() if len(p) >= _FT_MIN_TOKEN]
+    if palavras:
+        consulta = " ".join(f"+{p}*" for p in palavras)
+        return "MATCH(nome, fantasia) AGAINST (%s IN BOOLEAN MODE)", [consulta]
+    prefixo = termo.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    return "(nome LIKE %s OR fantasia LIKE %s)", [prefixo, prefixo]
+
+
+def pesquisar(nome: Optional[str] = None, documento: Optional[str] = None,
+              telefone: Optional[str] = None, email: Optional[str] = None,
+              apos: int = 0, limite: int = 50) -> dict:
+    """Busca clientes em clientes_bling combinando os filtros informados (AND).
+
+    Args:
+        nome: termo buscado em nome/fantasia.
+        documento: CPF/CNPJ, com ou sem pontuação.
+        telefone: comparado com telefone e celular, com ou sem pontuação.
+        email: endereço exato (sem diferenciar maiúsculas).
+        apos: último id da página anterior (keyset).
+        limite: itens por página (até BUSCA_CLIENTES_MAX).
+
+    Returns:
+        dict: {"data": [clientes], "proximo": id para a próxima página ou None}.
+
+    Raises:
+        ValueError: se nenhum filtro válido for informado.
+    """
+    condicoes, params = [], []
+    if documento and _limpar_campo(documento):
+        condicoes.append("documento = %s")
+        params.append(_limpar_campo(documento))
+    if telefone and _limpar_campo(telefone):
+        # Dois índices (telefone, celular): o MySQL usa index_merge de união
+        condicoes.append("(telefone = %s OR celular = %s)")
+        params += [_limpar_campo(telefone)] * 2
+    if email and email.strip():
+        condicoes.append("email = %s")
+        params.append(_to_upper(email))
+    if nome and nome.strip():
+        condicao, valores = _filtro_nome(_to_upper(nome))
+        condicoes.append(condicao)
+        params += valores
+    if not condicoes:
+        raise ValueError("Informe ao menos um filtro: nome, documento, telefone ou email")
+
+    limite = max(1, min(int(limite), BUSCA_CLIENTES_MAX))
+    condicoes.append("id > %s")
+    params.append(int(apos or 0))
+
+    conn = conectar_mysql()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            f"""
+            SELECT {', '.join(CAMPOS_CLIENTE)} FROM clientes_bling
+            WHERE {' AND '.join(condicoes)}
+            ORDER BY id
+            LIMIT %s
+            """,
+            params + [limite + 1],
+        )
+        linhas = cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+
+    clientes = [dict(zip(CAMPOS_CLIENTE, row)) for row in linhas[:limite]]
+    proximo = clientes[-1]["id"] if len(linhas) > limite else None
+    return {"data": clientes, "proximo": proximo}
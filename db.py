@@ -6,20 +6,24 @@ Exige variáveis de ambiente:
 from __future__ import annotations
 
 import os
-from typing import Any, Iterable, List, Tuple
+import time
+from typing import Callable, Iterable, List, Optional, Set, Tuple
 
 import mysql.connector
+from mysql.connector import pooling
 from dotenv import load_dotenv
 from logger import logger
+from mapeamento import ProdutoMapeado
 
 load_dotenv()
 
 
-def conectar_mysql():
-    """Abre conexão com MySQL usando variáveis de ambiente.
+_pool = None
+_pool_pid = None
 
-    Returns:
-        mysql.connector.MySQLConnection: conexão ativa com autocommit desabilitado.
+
+def _config_mysql() -> dict:
+    """Monta a configuração de conexão a partir das variáveis de ambiente.
 
     Raises:
         RuntimeError: se variáveis obrigatórias estiverem ausentes.
@@ -36,36 +40,66 @@ def conectar_mysql():
     faltando = [k for k in ("host", "user", "password", "database") if not cfg[k]]
     if faltando:
         raise RuntimeError(f"Variáveis de ambiente ausentes: {', '.join(faltando)}")
+    return cfg
 
-    conn = mysql.connector.connect(**cfg)
-    conn.autocommit = False
+
+def ativar_pool(tamanho: int = 5) -> None:
+    """Passa a servir conexões de um pool, reaproveitadas entre execuções.
+
+    Usado por processos de longa duração (agendador). Depois de ativado,
+    ``conectar_mysql`` devolve conexões do pool e ``close()`` as devolve a ele;
+    com o pool esgotado, abre uma conexão dedicada em vez de falhar.
+    """
+    global _pool, _pool_pid
+    if _pool is not None:
+        return
+    cfg = _config_mysql()
+    _pool = pooling.MySQLConnectionPool(
+        pool_name="bling_sync", pool_size=tamanho, autocommit=False, **cfg
+    )
+    _pool_pid = os.getpid()
     logger.info(
-        "Conectado ao banco %s:%s/%s", cfg["host"], cfg["port"], cfg["database"]
+        "Pool de conexões (%s) criado para %s:%s/%s",
+        tamanho, cfg["host"], cfg["port"], cfg["database"],
     )
-    return conn
 
 
-def _to_float(value: Any) -> float:
-    """Converte valor para float de forma tolerante a vírgulas e None."""
-    if value is None:
-        return 0.0
-    try:
-        return float(str(value).replace(",", "."))
-    except (ValueError, TypeError):
-        return 0.0
+def conectar_mysql(local_infile: bool = False, dedicada: bool = False):
+    """Abre conexão com MySQL usando variáveis de ambiente.
 
+    Args:
+        local_infile: habilita ``LOAD DATA LOCAL INFILE`` (conexão fora do pool).
+        dedicada: abre uma conexão própria mesmo com o pool ativo (sessões que
+            seguram estado, como as travas de ``trava_execucao``).
 
-def _to_int(value: Any) -> int:
-    """Converte valor para int aceitando entradas com vírgula/ponto."""
-    try:
-        return int(float(str(value).replace(",", ".")))
-    except (ValueError, TypeError):
-        return 0
+    Returns:
+        mysql.connector.MySQLConnection: conexão ativa com autocommit desabilitado.
 
+    Raises:
+        RuntimeError: se variáveis obrigatórias estiverem ausentes.
+    """
+    # Processos filhos (fork) não compartilham os sockets do pool do pai
+    if _pool is not None and _pool_pid == os.getpid() and not (local_infile or dedicada):
+        try:
+            return _pool.get_connection()
+        except mysql.connector.errors.PoolError:
+            # Jobs simultâneos podem somar mais conexões que o pool: não falha o job
+            logger.warning("Pool de conexões esgotado; abrindo conexão dedicada")
 
-_SQL_UPSERT = (
+    cfg = _config_mysql()
+    if local_infile:
+        cfg["allow_local_infile"] = True
+    conn = mysql.connector.connect(**cfg)
+    conn.autocommit = False
+    logger.info(
+        "Conectado ao banco %s:%s/%s", cfg["host"], cfg["port"], cfg["database"]
+    )
+    return conn
+
+
+_SQL_UPSERT_MODELO = (
     """
-INSERT INTO produtos_bling
+INSERT INTO {tabela}
     (id_bling, codigo, nome, preco, estoque, tipo, situacao, formato,
      largura, altura, profundidade, peso_liquido, peso_bruto)
 VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
@@ -86,80 +120,231 @@ ON DUPLICATE KEY UPDATE
     data_alteracao = CURRENT_TIMESTAMP
 """
 )
+_SQL_UPSERT = _SQL_UPSERT_MODELO.format(tabela="produtos_bling")
 
 
-def _params_upsert(produto: dict) -> Tuple:
-    """Prepara parâmetros para o upsert em produtos_bling."""
-    return (
-        int(produto["id_bling"]),
-        produto.get("codigo"),
-        (produto.get("nome") or "")[:255],
-        _to_float(produto.get("preco")),
-        _to_int(produto.get("estoque")),
-        produto.get("tipo"),
-        (produto.get("situacao") or "")[:1],
-        produto.get("formato"),
-        _to_float(produto.get("largura")),
-        _to_float(produto.get("altura")),
-        _to_float(produto.get("profundidade")),
-        _to_float(produto.get("peso_liquido")),
-        _to_float(produto.get("peso_bruto"))
-    )
-
-
-def inserir_ou_atualizar(cursor, produto: dict) -> bool:
+def inserir_ou_atualizar(cursor, produto: ProdutoMapeado) -> bool:
     """Insere/atualiza um único produto. Preferir upsert_batch para lotes."""
     try:
-        cursor.execute(_SQL_UPSERT, _params_upsert(produto))
+        cursor.execute(_SQL_UPSERT, produto)
         return True
     except Exception as e:
-        logger.error(
-            "Falha ao inserir/atualizar id_bling=%s: %s", produto.get("id_bling"), e
-        )
+        logger.error("Falha ao inserir/atualizar id_bling=%s: %s", produto.id_bling, e)
         return False
 
 
-def upsert_batch(cursor, produtos: Iterable[dict]) -> int:
+def upsert_batch(cursor, produtos: Iterable[ProdutoMapeado], tabela: str = "produtos_bling") -> int:
     """Insere/atualiza múltiplos produtos em lote (executemany).
 
+    Os itens já são as tuplas de parâmetros geradas por ``mapeamento.mapear_produto``.
+    ``tabela`` permite gravar em uma cópia com o mesmo esquema (ex.: tabela sombra).
     O commit é responsabilidade do chamador.
 
     Returns:
         int: quantidade de itens enviados ao executemany (não confundir com rowcount).
     """
-    itens = [p for p in produtos if p.get("id_bling")]
-    if not itens:
+    params: List[ProdutoMapeado] = [p for p in produtos if p[0]]
+    if not params:
         return 0
 
     try:
-        params: List[Tuple] = [_params_upsert(p) for p in itens]
-        cursor.executemany(_SQL_UPSERT, params)
+        sql = _SQL_UPSERT if tabela == "produtos_bling" else _SQL_UPSERT_MODELO.format(tabela=tabela)
+        cursor.executemany(sql, params)
         return len(params)
     except mysql.connector.Error as e:
         logger.error("Erro durante upsert em lote: %s", e)
         raise
 
 
+_SQL_PRECISA_DETALHES = """
+    imagem IS NULL OR imagem = ''
+    OR detalhes_proxima <= NOW()
+    OR (detalhes_proxima IS NULL
+        AND (data_alteracao IS NULL OR data_alteracao < (NOW() - INTERVAL %s HOUR)))
+"""
+
+
 def needs_details(cursor, id_bling: int, max_age_hours: int) -> bool:
     """Determina se os detalhes do produto devem ser buscados/atualizados.
 
     Verdadeiro quando:
     - imagem é nula/vazia, ou
-    - data_alteracao é nula, ou
-    - data_alteracao é mais antiga que NOW() - max_age_hours.
+    - detalhes_proxima (intervalo adaptativo do produto) já passou, ou
+    - sem detalhes_proxima: data_alteracao é nula ou mais antiga que NOW() - max_age_hours.
     """
     cursor.execute(
-        """
-        SELECT
-            (imagem IS NULL OR imagem = '') AS img_vazia,
-            (data_alteracao IS NULL OR data_alteracao < (NOW() - INTERVAL %s HOUR)) AS stale
-        FROM produtos_bling
-        WHERE id_bling = %s
-        """,
+        f"SELECT ({_SQL_PRECISA_DETALHES}) FROM produtos_bling WHERE id_bling = %s",
         (int(max_age_hours), int(id_bling))
     )
     row = cursor.fetchone()
     if row is None:
         return True
-    img_vazia, stale = row
-    return bool(img_vazia or stale)
+    return bool(row[0])
+
+
+def fila_detalhes(cursor, max_age_hours: int, ids: Optional[Set[int]] = None,
+                  recentes: Iterable[int] = ()) -> List[int]:
+    """Monta, em uma única consulta, a fila priorizada de produtos que precisam de detalhes.
+
+    Ordem de prioridade:
+    1. imagem nula/vazia;
+    2. vencidos (detalhes_proxima, ou data_alteracao + max_age_hours para quem
+       ainda não tem intervalo próprio), do mais atrasado para o menos atrasado;
+    3. ``recentes`` (SKUs novos ou alterados frente ao banco nesta execução,
+       ver ``main._diff_snapshot``) ainda fora da fila.
+
+    Args:
+        ids: se informado, restringe a fila a esses IDs (ex.: shard de um worker).
+    """
+    cursor.execute(
+        f"""
+        SELECT id_bling
+        FROM produtos_bling
+        WHERE {_SQL_PRECISA_DETALHES}
+        ORDER BY (imagem IS NULL OR imagem = '') DESC,
+                 COALESCE(detalhes_proxima, data_alteracao + INTERVAL %s HOUR)
+        """,
+        (int(max_age_hours), int(max_age_hours)),
+    )
+    fila = [int(row[0]) for row in cursor.fetchall()]
+    if ids is not None:
+        fila = [i for i in fila if i in ids]
+    na_fila = set(fila)
+    for id_bling in recentes:
+        if id_bling not in na_fila and (ids is None or id_bling in ids):
+            fila.append(id_bling)
+            na_fila.add(id_bling)
+    return fila
+
+
+def atualizar_estoques(cursor, saldos: Iterable[Tuple[int, float]]) -> int:
+    """Atualiza apenas produtos_bling.estoque em lote (executemany).
+
+    Args:
+        saldos: pares (id_bling, saldo_virtual_total).
+
+    Returns:
+        int: quantidade de pares enviados.
+    """
+    params = [(float(saldo), int(id_bling)) for id_bling, saldo in saldos]
+    if not params:
+        return 0
+    cursor.executemany("UPDATE produtos_bling SET estoque = %s WHERE id_bling = %s", params)
+    return len(params)
+
+
+def marcar_produtos_inativos(cursor, ids: Iterable[int]) -> int:
+    """Marca produtos como inativos (situacao = 'I') em um único UPDATE.
+
+    Returns:
+        int: linhas afetadas.
+    """
+    ids = [int(i) for i in ids]
+    if not ids:
+        return 0
+    marcadores = ", ".join(["%s"] * len(ids))
+    cursor.execute(
+        f"UPDATE produtos_bling SET situacao = 'I' WHERE id_bling IN ({marcadores})",
+        ids,
+    )
+    return cursor.rowcount
+
+
+_SQL_SNAPSHOT = """
+    SELECT id_bling, codigo, nome, preco, estoque, tipo, situacao, formato,
+           largura, altura, profundidade, peso_liquido, peso_bruto
+    FROM produtos_bling
+"""
+
+
+def carregar_snapshot(conn, normalizar=None) -> dict:
+    """Carrega produtos_bling em memória como {id_bling: (demais colunas do upsert)}.
+
+    Usa um cursor não bufferizado para ler as linhas em streaming, em uma
+    única consulta.
+
+    Args:
+        normalizar: função opcional aplicada à tupla de colunas de cada linha.
+    """
+    cursor = conn.cursor(buffered=False)
+    snapshot = {}
+    try:
+        cursor.execute(_SQL_SNAPSHOT)
+        for row in cursor:
+            valores = tuple(row[1:])
+            snapshot[int(row[0])] = normalizar(valores) if normalizar else valores
+    finally:
+        cursor.close()
+    return snapshot
+
+
+class CommitEmGrupo:
+    """Commit em grupo com savepoint por item.
+
+    Cada item roda entre ``SAVEPOINT`` e ``RELEASE``/``ROLLBACK TO SAVEPOINT``:
+    um item que falha desfaz só as próprias escritas, sem descartar os itens
+    bem-sucedidos ainda não confirmados. O commit acontece a cada
+    ``max_linhas`` itens confirmados ou ``max_seg`` segundos, o que vier primeiro.
+
+    Se o servidor desfizer a transação inteira (deadlock, timeout de lock), o
+    savepoint some junto: o grupo é dado como perdido, os itens pendentes são
+    somados em ``perdidos`` e o processamento segue com um grupo novo.
+    """
+
+    def __init__(self, conn, cursor, max_linhas: int = 100, max_seg: float = 5.0):
+        self.conn = conn
+        self.cursor = cursor
+        self.max_linhas = max_linhas
+        self.max_seg = max_seg
+        self.pendentes = 0
+        self.confirmados = 0
+        self.perdidos = 0
+        self._desde = time.monotonic()
+
+    def executar(self, funcao: Callable[..., bool], *args) -> bool:
+        """Executa ``funcao(*args)`` sob savepoint; resultado falso ou exceção desfaz o item.
+
+        Returns:
+            bool: True se o item foi mantido.
+        """
+        self.cursor.execute("SAVEPOINT item_grupo")
+        try:
+            ok = bool(funcao(*args))
+        except Exception as e:
+            logger.error("Item desfeito após erro: %s", e)
+            ok = False
+        try:
+            if ok:
+                self.cursor.execute("RELEASE SAVEPOINT item_grupo")
+                self.pendentes += 1
+            else:
+                self.cursor.execute("ROLLBACK TO SAVEPOINT item_grupo")
+        except mysql.connector.Error as e:
+            # Deadlock/timeout de lock desfazem a transação inteira e o savepoint com ela (1305)
+            self._descartar_grupo(e)
+            ok = False
+        if self.pendentes >= self.max_linhas or time.monotonic() - self._desde >= self.max_seg:
+            self.confirmar()
+        return ok
+
+    def _descartar_grupo(self, erro: Exception) -> None:
+        """Trata o grupo atual como perdido: desfaz a transação e zera os pendentes."""
+        logger.error(
+            "Grupo desfeito pelo servidor (%s): %s itens não confirmados perdidos", erro, self.pendentes
+        )
+        try:
+            self.conn.rollback()
+        except mysql.connector.Error as e:
+            logger.error("Falha no rollback do grupo: %s", e)
+        self.perdidos += self.pendentes
+        self.pendentes = 0
+        self._desde = time.monotonic()
+
+    def confirmar(self) -> None:
+        """Confirma os itens pendentes e reinicia a contagem do grupo."""
+        self.conn.commit()
+        if self.pendentes:
+            self.confirmados += self.pendentes
+            logger.info("Commit em grupo: %s itens (%s no total)", self.pendentes, self.confirmados)
+        self.pendentes = 0
+        self._desde = time.monotonic()
@@ -1,29 +1,33 @@
-"""Atualização de detalhes de produto (dimensões, preços, imagem) a partir do Bling."""
-from datetime import datetime
+"""Atualização de detalhes de produto (dimensões, preços, imagem) a partir do Bling.
+
+Cada produto tem seu próprio intervalo entre buscas de detalhes
+(``detalhes_intervalo_h``): ele cai pela metade quando a busca encontra
+alterações e dobra quando não encontra nada, dentro dos limites
+DETALHES_INTERVALO_MIN_H e DETALHES_INTERVALO_MAX_H. Produtos que mudam muito
+voltam à fila com frequência; os estáveis quase não consomem requisições.
+
+"Alteração" é medida contra a busca de detalhes anterior: ``detalhes_hash``
+guarda o md5 dos campos extraídos e só é escrito aqui, então o upsert da
+listagem (ou de um webhook) feito antes na mesma execução não mascara nem
+inventa mudanças.
+"""
+import hashlib
+import os
+from typing import Optional
 
 from bling_api import buscar_detalhes_produto
 from logger import logger
+from mapeamento import extrair_estoque, extrair_preco, to_float
 
-
-def _num(value):
-    """Converte texto/None para float, aceitando vírgula decimal."""
-    if value is None:
-        return 0.0
-    try:
-        return float(str(value).replace(",", "."))
-    except (ValueError, TypeError):
-        return 0.0
+DETAILS_MAX_AGE_HOURS = int(os.getenv("DETAILS_MAX_AGE_HOURS", "168"))
+DETALHES_INTERVALO_MIN_H = int(os.getenv("DETALHES_INTERVALO_MIN_H", "12"))
+DETALHES_INTERVALO_MAX_H = int(os.getenv("DETALHES_INTERVALO_MAX_H", "720"))
+DETALHES_INTERVALO_FATOR = 2
 
 
 def _extract_details(produto: dict) -> dict:
     """Extrai detalhes relevantes do payload do produto da API."""
-    dimensoes = produto.get("dimensoes", {})
-
-    # Preço pode vir como dict ou valor simples
-    if isinstance(produto.get("preco"), dict):
-        preco = _num(produto["preco"].get("preco", 0))
-    else:
-        preco = _num(produto.get("preco", 0))
+    dimensoes = produto.get("dimensoes") or {}
 
     # Imagem principal (primeira imagem interna se existir)
     imagem = None
@@ -36,17 +40,92 @@ def _extract_details(produto: dict) -> dict:
             imagem = primeiro_item.get("link")
 
     return {
-        "estoque": (produto.get("estoque") or {}).get("saldoVirtualTotal", 0),
-        "preco": preco,
-        "largura": _num(dimensoes.get("largura")),
-        "altura": _num(dimensoes.get("altura")),
-        "profundidade": _num(dimensoes.get("profundidade")),
-        "peso_liquido": produto.get("pesoLiquido"),
-        "peso_bruto": produto.get("pesoBruto"),
+        "estoque": extrair_estoque(produto),
+        "preco": extrair_preco(produto),
+        "largura": to_float(dimensoes.get("largura")),
+        "altura": to_float(dimensoes.get("altura")),
+        "profundidade": to_float(dimensoes.get("profundidade")),
+        "peso_liquido": to_float(produto.get("pesoLiquido")),
+        "peso_bruto": to_float(produto.get("pesoBruto")),
         "imagem": imagem,
     }
 
 
+_CAMPOS_DETALHES = (
+    "estoque", "preco", "largura", "altura", "profundidade", "peso_liquido", "peso_bruto", "imagem",
+)
+
+_SQL_UPDATE_DETALHES = """
+    UPDATE produtos_bling
+    SET estoque = %s,
+        preco = %s,
+        largura = %s,
+        altura = %s,
+        profundidade = %s,
+        peso_liquido = %s,
+        peso_bruto = %s,
+        imagem = %s,
+        detalhes_hash = %s
+    WHERE id_bling = %s
+"""
+
+# Atribuições de UPDATE de tabela única são avaliadas em ordem: detalhes_proxima
+# usa o intervalo já recalculado. mudou NULL (sem busca anterior) mantém o intervalo.
+_SQL_AGENDAR_DETALHES = """
+    UPDATE produtos_bling
+    SET data_alteracao = NOW(),
+        detalhes_intervalo_h = LEAST(%(maximo)s, GREATEST(%(minimo)s, CASE %(mudou)s
+            WHEN 1 THEN FLOOR(COALESCE(detalhes_intervalo_h, %(base)s) / %(fator)s)
+            WHEN 0 THEN COALESCE(detalhes_intervalo_h, %(base)s) * %(fator)s
+            ELSE COALESCE(detalhes_intervalo_h, %(base)s)
+        END)),
+        detalhes_proxima = NOW() + INTERVAL detalhes_intervalo_h HOUR
+    WHERE id_bling = %(id_bling)s
+"""
+
+
+def _hash_detalhes(detalhes: dict) -> str:
+    return hashlib.md5(repr(tuple(detalhes[c] for c in _CAMPOS_DETALHES)).encode("utf-8")).hexdigest()
+
+
+def aplicar_detalhes(cursor, id_bling: int, produto: dict) -> Optional[bool]:
+    """Grava em produtos_bling os detalhes de um payload já obtido da API.
+
+    Returns:
+        bool | None: True se os detalhes diferem dos gravados na busca anterior
+        (``detalhes_hash``), False se são iguais e None se não há busca
+        anterior (produto ainda sem hash ou sem linha na tabela).
+    """
+    detalhes = _extract_details(produto)
+    novo_hash = _hash_detalhes(detalhes)
+    cursor.execute("SELECT detalhes_hash FROM produtos_bling WHERE id_bling = %s", (int(id_bling),))
+    linhas = cursor.fetchall()
+    anterior = linhas[0][0] if linhas else None
+    cursor.execute(
+        _SQL_UPDATE_DETALHES,
+        tuple(detalhes[c] for c in _CAMPOS_DETALHES) + (novo_hash, id_bling),
+    )
+    return None if anterior is None else anterior != novo_hash
+
+
+def agendar_proximos_detalhes(cursor, id_bling: int, mudou: Optional[bool]) -> None:
+    """Recalcula o intervalo do produto e marca a próxima busca de detalhes.
+
+    ``mudou`` None (primeira busca) mantém o intervalo atual ou o inicial.
+    """
+    cursor.execute(
+        _SQL_AGENDAR_DETALHES,
+        {
+            "id_bling": int(id_bling),
+            "mudou": None if mudou is None else int(mudou),
+            "base": DETAILS_MAX_AGE_HOURS,
+            "minimo": DETALHES_INTERVALO_MIN_H,
+            "maximo": DETALHES_INTERVALO_MAX_H,
+            "fator": DETALHES_INTERVALO_FATOR,
+        },
+    )
+
+
 def update_product_details(cursor, id_bling: int) -> bool:
     """Busca detalhes no Bling e atualiza o registro em produtos_bling.
 
@@ -59,37 +138,8 @@ def update_product_details(cursor, id_bling: int) -> bool:
             logger.warning("Detalhes não encontrados para produto %s", id_bling)
             return False
 
-        detalhes = _extract_details(produto)
-
-        sql = """
-            UPDATE produtos_bling
-            SET estoque = %s,
-                preco = %s,
-                largura = %s,
-                altura = %s,
-                profundidade = %s,
-                peso_liquido = %s,
-                peso_bruto = %s,
-                imagem = %s,
-                data_alteracao = %s
-            WHERE id_bling = %s
-        """
-
-        cursor.execute(
-            sql,
-            (
-                detalhes["estoque"],
-                detalhes["preco"],
-                detalhes["largura"],
-                detalhes["altura"],
-                detalhes["profundidade"],
-                detalhes["peso_liquido"],
-                detalhes["peso_bruto"],
-                detalhes["imagem"],
-                datetime.now(),
-                id_bling,
-            ),
-        )
+        mudou = aplicar_detalhes(cursor, id_bling, produto)
+        agendar_proximos_detalhes(cursor, id_bling, mudou)
         return True
     except Exception as e:
         logger.error("Erro ao atualizar detalhes do produto %s: %s", id_bling, e)
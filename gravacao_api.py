@@ -0,0 +1,234 @@
+"""Gravação e reprodução do tráfego com a API do Bling.
+
+Com BLING_GRAVAR_DIR definido, toda resposta recebida por ``bling_api._get`` é
+anexada a ``<dir>/<endpoint>-<pid>.ndjson.gz`` (uma linha JSON por resposta).
+Cada resposta é um membro gzip próprio, fechado na hora: um processo
+interrompido não corrompe o arquivo, e cada processo grava os próprios
+arquivos, então os workers de ``main.py`` podem gravar ao mesmo tempo.
+
+Com BLING_REPRODUZIR_DIR definido, ``_get`` não acessa a rede nem consome o
+limite de requisições: a resposta vem da gravação com a mesma chave (caminho
+do endpoint + parâmetros ordenados). Se a mesma chave foi gravada mais de uma
+vez, vale a última. Chave ausente responde 404, como um registro inexistente.
+As âncoras das listagens (``motor_sync.Entidade.ancora``, fixadas no instante
+em que a listagem começa) ficam fora da chave, então a reprodução casa cada
+página com a gravada em outro momento.
+
+Serve para reconstruir ``produtos_bling``/``clientes_bling`` sem gastar cota
+da API e para medir ``main.py``/``sincronizar_clientes.py`` com dados reais de
+forma reproduzível::
+
+    BLING_GRAVAR_DIR=gravacoes/2026-10-19 python main.py
+    BLING_REPRODUZIR_DIR=gravacoes/2026-10-19 python main.py
+
+Listagens com janela de datas relativa a hoje (``sincronizar_pedidos``) só
+reproduzem no mesmo dia da gravação.
+
+``python gravacao_api.py --verificar`` grava uma listagem sintética de
+produtos e de contatos e a reproduz por ``motor_sync.listar``, sem rede.
+"""
+from __future__ import annotations
+
+import argparse
+import glob
+import gzip
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Set, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import requests
+
+from json_rapido import loads
+from logger import logger
+
+# Segmentos numéricos (IDs) não entram no nome do arquivo: /produtos/123 -> produtos
+_RE_ID = re.compile(r"/\d+(?=/|$)")
+
+_trava = threading.Lock()
+_gravacoes: Dict[str, Dict[str, Tuple[int, str]]] = {}
+# Parâmetros que mudam a cada execução (âncoras de listagem) e não entram na chave
+_FORA_DA_CHAVE: Set[str] = set()
+
+
+def diretorio_gravacao() -> Optional[str]:
+    return os.getenv("BLING_GRAVAR_DIR") or None
+
+
+def diretorio_reproducao() -> Optional[str]:
+    return os.getenv("BLING_REPRODUZIR_DIR") or None
+
+
+def ignorar_na_chave(parametro: str) -> None:
+    """Deixa ``parametro`` fora das chaves de gravação e reprodução."""
+    _FORA_DA_CHAVE.add(parametro)
+
+
+def _montar_chave(caminho: str, itens: Iterable[Tuple[str, str]]) -> str:
+    itens = sorted((str(k), str(v)) for k, v in itens if str(k) not in _FORA_DA_CHAVE)
+    return f"{caminho}?{urlencode(itens)}" if itens else caminho
+
+
+def chave(url: str, params=None) -> str:
+    """Caminho do endpoint (sem o prefixo da API) + parâmetros em ordem."""
+    caminho = urlsplit(url).path.split("/Api/v3/", 1)[-1].strip("/")
+    return _montar_chave(caminho, dict(params or {}).items())
+
+
+def _normalizar(chave_gravada: str) -> str:
+    """Chave gravada sem os parâmetros ignorados (gravações antigas os incluíam)."""
+    caminho, _, consulta = chave_gravada.partition("?")
+    return _montar_chave(caminho, parse_qsl(consulta, keep_blank_values=True))
+
+
+def _endpoint(chave_requisicao: str) -> str:
+    caminho = chave_requisicao.split("?", 1)[0]
+    return _RE_ID.sub("", "/" + caminho).strip("/").replace("/", "_") or "raiz"
+
+
+class RespostaGravada:
+    """Resposta reproduzida com a interface usada por ``bling_api`` (content, raise_for_status)."""
+
+    def __init__(self, url: str, status_code: int, corpo: str):
+        self.url = url
+        self.status_code = status_code
+        self.content = corpo.encode("utf-8")
+        self.headers = {"Content-Type": "application/json"}
+
+    def json(self):
+        return loads(self.content)
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(
+                f"{self.status_code} (reprodução) para {self.url}", response=self
+            )
+
+
+def gravar(url: str, params, resp) -> None:
+    """Anexa a resposta à gravação do endpoint; falhas de disco só geram log."""
+    diretorio = diretorio_gravacao()
+    if not diretorio:
+        return
+    chave_requisicao = chave(url, params)
+    linha = json.dumps({
+        "chave": chave_requisicao,
+        "status": resp.status_code,
+        "corpo": resp.content.decode("utf-8", errors="replace"),
+        "em": datetime.now().isoformat(timespec="seconds"),
+    }, ensure_ascii=False) + "\n"
+    caminho = os.path.join(diretorio, f"{_endpoint(chave_requisicao)}-{os.getpid()}.ndjson.gz")
+    try:
+        with _trava:
+            os.makedirs(diretorio, exist_ok=True)
+            with gzip.open(caminho, "ab") as arquivo:
+                arquivo.write(linha.encode("utf-8"))
+    except OSError as e:
+        logger.warning("Falha ao gravar resposta de %s: %s", chave_requisicao, e)
+
+
+def _carregar(diretorio: str, endpoint: str) -> Dict[str, Tuple[int, str]]:
+    """Índice {chave: (status, corpo)} de todos os arquivos gravados do endpoint."""
+    respostas: Dict[str, Tuple[int, str]] = {}
+    arquivos = sorted(glob.glob(os.path.join(diretorio, f"{glob.escape(endpoint)}-*.ndjson.gz")),
+                      key=os.path.getmtime)
+    for caminho in arquivos:
+        try:
+            with gzip.open(caminho, "rb") as f:
+                for linha in f:
+                    registro = loads(linha)
+                    respostas[_normalizar(registro["chave"])] = (registro["status"], registro["corpo"])
+        except EOFError:
+            # Gravação cortada no meio de um membro: vale o que foi lido
+            logger.warning("Gravação %s incompleta; usando as linhas anteriores ao corte", caminho)
+        except (OSError, ValueError) as e:
+            logger.error("Gravação %s ilegível: %s", caminho, e)
+    logger.info("Reprodução: %s respostas de %s carregadas de %s", len(respostas), endpoint, diretorio)
+    return respostas
+
+
+def reproduzir(url: str, params=None) -> RespostaGravada:
+    """Resposta gravada para a requisição; 404 se ela não foi gravada."""
+    diretorio = diretorio_reproducao()
+    chave_requisicao = chave(url, params)
+    endpoint = _endpoint(chave_requisicao)
+    with _trava:
+        respostas = _gravacoes.get(endpoint)
+        if respostas is None:
+            respostas = _gravacoes[endpoint] = _carregar(diretorio, endpoint)
+    gravada = respostas.get(chave_requisicao)
+    if gravada is None:
+        logger.debug("Reprodução sem resposta para %s", chave_requisicao)
+        return RespostaGravada(url, 404, '{"data": null}')
+    return RespostaGravada(url, *gravada)
+
+
+def verificar_ida_e_volta() -> bool:
+    """Grava uma listagem ancorada e a reproduz, com outra âncora, por ``motor_sync.listar``.
+
+    Usa um diretório temporário e respostas sintéticas; nada vai à rede.
+
+    Returns:
+        bool: True se cada entidade reproduziu exatamente as páginas gravadas.
+    """
+    # Importados aqui: ambos dependem (via bling_api) deste módulo
+    import motor_sync
+    from bling_api import BLING_API_URL, FalhaListagem
+    from sincronizar_clientes import CLIENTES
+
+    paginas = [[{"id": 1}, {"id": 2}], [{"id": 3}]]
+    variaveis = ("BLING_GRAVAR_DIR", "BLING_REPRODUZIR_DIR")
+    anteriores = {v: os.environ.pop(v, None) for v in variaveis}
+    ok = True
+    try:
+        with tempfile.TemporaryDirectory() as diretorio:
+            for entidade in (motor_sync.PRODUTOS, CLIENTES):
+                os.environ["BLING_GRAVAR_DIR"] = diretorio
+                url = f"{BLING_API_URL}/{entidade.recurso}"
+                params = entidade.parametros()
+                if entidade.ancora:
+                    params[entidade.ancora] = "2000-01-01 00:00:00"
+                for numero, itens in enumerate(paginas + [[]], start=1):
+                    corpo = json.dumps({"data": itens})
+                    gravar(url, {"pagina": numero, "limite": 100, **params}, RespostaGravada(url, 200, corpo))
+                del os.environ["BLING_GRAVAR_DIR"]
+
+                os.environ["BLING_REPRODUZIR_DIR"] = diretorio
+                _gravacoes.clear()
+                try:
+                    reproduzidas = list(motor_sync.listar(entidade))
+                except FalhaListagem as e:
+                    reproduzidas = e
+                finally:
+                    del os.environ["BLING_REPRODUZIR_DIR"]
+                if reproduzidas == paginas:
+                    logger.info("Reprodução de %s: %s páginas conferidas", entidade.nome, len(paginas))
+                else:
+                    logger.error("Reprodução de %s divergiu da gravação: %s", entidade.nome, reproduzidas)
+                    ok = False
+    finally:
+        _gravacoes.clear()
+        for variavel, valor in anteriores.items():
+            if valor is not None:
+                os.environ[variavel] = valor
+    return ok
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Gravação/reprodução das respostas da API do Bling")
+    parser.add_argument("--verificar", action="store_true",
+                        help="Grava uma listagem sintética e confere a reprodução (sem rede)")
+    args = parser.parse_args()
+    if not args.verificar:
+        parser.print_help()
+        return 2
+    return 0 if verificar_ida_e_volta() else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
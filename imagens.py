@@ -0,0 +1,227 @@
+"""Cache local das imagens de produto, deduplicado pelo hash do conteúdo.
+
+As URLs gravadas em ``produtos_bling.imagem`` apontam para o armazenamento do
+Bling, que é lento e expira os links. Este módulo baixa as imagens em paralelo
+para IMAGENS_DIR e grava em ``produtos_bling.imagem_local`` um caminho estável,
+relativo a IMAGENS_DIR, no formato ``ab/abcdef...<ext>`` (sha256 do conteúdo).
+Produtos com a mesma imagem compartilham o mesmo arquivo.
+
+Para cada produto, ``imagens_cache`` guarda a última URL baixada, ETag e
+Last-Modified. Só entram na fila produtos sem imagem local ou cuja URL mudou; o
+download usa GET condicional (If-None-Match / If-Modified-Since), então uma URL
+renovada que aponta para o mesmo objeto responde 304 sem transferir o arquivo.
+
+Uso:
+    python imagens.py [--revalidar] [--limite N]
+
+Variáveis de ambiente:
+- IMAGENS_DIR (padrão ``imagens``)
+- IMAGENS_WORKERS (padrão 8): downloads simultâneos
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, NamedTuple, Optional
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import db
+from logger import logger
+from trava_execucao import trava_de_script
+
+IMAGENS_DIR = os.getenv("IMAGENS_DIR", "imagens")
+IMAGENS_WORKERS = int(os.getenv("IMAGENS_WORKERS", "8"))
+
+_EXTENSOES = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp",
+    "image/gif": ".gif",
+}
+
+
+class Pendente(NamedTuple):
+    id_bling: int
+    url: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    caminho: Optional[str]
+
+
+class Resultado(NamedTuple):
+    id_bling: int
+    url: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    sha256: Optional[str]
+    caminho: Optional[str]
+    status: str  # "novo", "deduplicado", "inalterado" ou "erro"
+
+
+def _criar_sessao(workers: int) -> requests.Session:
+    sessao = requests.Session()
+    adaptador = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+    sessao.mount("https://", adaptador)
+    sessao.mount("http://", adaptador)
+    return sessao
+
+
+def _extensao(url: str, content_type: str) -> str:
+    ext = _EXTENSOES.get((content_type or "").split(";")[0].strip().lower())
+    if ext:
+        return ext
+    ext = os.path.splitext(urlparse(url).path)[1].lower()
+    return ext if 1 < len(ext) <= 5 else ".bin"
+
+
+def _baixar(sessao: requests.Session, item: Pendente, diretorio: str) -> Resultado:
+    """Baixa uma imagem com GET condicional e a grava endereçada pelo sha256."""
+    cabecalhos = {}
+    # Sem arquivo local não há o que revalidar
+    if item.caminho and os.path.exists(os.path.join(diretorio, item.caminho)):
+        if item.etag:
+            cabecalhos["If-None-Match"] = item.etag
+        if item.last_modified:
+            cabecalhos["If-Modified-Since"] = item.last_modified
+
+    try:
+        with sessao.get(item.url, headers=cabecalhos, timeout=30, stream=True) as resp:
+            if resp.status_code == 304:
+                return Resultado(item.id_bling, item.url, item.etag, item.last_modified,
+                                 None, item.caminho, "inalterado")
+            resp.raise_for_status()
+
+            hash_conteudo = hashlib.sha256()
+            fd, temporario = tempfile.mkstemp(dir=diretorio, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as arquivo:
+                    for bloco in resp.iter_content(chunk_size=65536):
+                        hash_conteudo.update(bloco)
+                        arquivo.write(bloco)
+                sha = hash_conteudo.hexdigest()
+                relativo = os.path.join(sha[:2], sha + _extensao(item.url, resp.headers.get("Content-Type")))
+                destino = os.path.join(diretorio, relativo)
+                if os.path.exists(destino):
+                    status = "deduplicado"
+                else:
+                    os.makedirs(os.path.dirname(destino), exist_ok=True)
+                    os.replace(temporario, destino)
+                    status = "novo"
+            finally:
+                if os.path.exists(temporario):
+                    os.remove(temporario)
+
+            return Resultado(item.id_bling, item.url, resp.headers.get("ETag"),
+                             resp.headers.get("Last-Modified"), sha, relativo, status)
+    except (requests.exceptions.RequestException, OSError) as e:
+        logger.error("Falha ao baixar imagem do produto %s: %s", item.id_bling, e)
+        return Resultado(item.id_bling, item.url, None, None, None, None, "erro")
+
+
+def _pendentes(cursor, revalidar: bool = False, limite: Optional[int] = None) -> List[Pendente]:
+    """Produtos com imagem remota cujo cache local falta ou está desatualizado."""
+    filtro = "" if revalidar else "AND (c.id_bling IS NULL OR c.url <> p.imagem OR p.imagem_local IS NULL)"
+    sql = f"""
+        SELECT p.id_bling, p.imagem, c.etag, c.last_modified, c.caminho
+        FROM produtos_bling p
+        LEFT JOIN imagens_cache c ON c.id_bling = p.id_bling
+        WHERE p.imagem IS NOT NULL AND p.imagem <> '' {filtro}
+        ORDER BY p.imagem_local IS NOT NULL, p.id_bling
+    """
+    if limite:
+        sql += f" LIMIT {int(limite)}"
+    cursor.execute(sql)
+    return [Pendente(int(r[0]), r[1], r[2], r[3], r[4]) for r in cursor.fetchall()]
+
+
+def _gravar_resultados(cursor, resultados: List[Resultado]) -> None:
+    ok = [r for r in resultados if r.status != "erro"]
+    if not ok:
+        return
+    cursor.executemany(
+        """
+        INSERT INTO imagens_cache (id_bling, url, etag, last_modified, sha256, caminho)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            url = VALUES(url),
+            etag = VALUES(etag),
+            last_modified = VALUES(last_modified),
+            sha256 = COALESCE(VALUES(sha256), sha256),
+            caminho = VALUES(caminho)
+        """,
+        [(r.id_bling, r.url, r.etag, r.last_modified, r.sha256, r.caminho) for r in ok],
+    )
+    cursor.executemany(
+        "UPDATE produtos_bling SET imagem_local = %s WHERE id_bling = %s",
+        [(r.caminho, r.id_bling) for r in ok],
+    )
+
+
+def sincronizar_imagens(revalidar: bool = False, limite: Optional[int] = None,
+                        workers: int = IMAGENS_WORKERS, diretorio: str = IMAGENS_DIR) -> dict:
+    """Baixa as imagens pendentes e atualiza imagens_cache / imagem_local.
+
+    Args:
+        revalidar: envia GET condicional para todas as imagens, não só as pendentes.
+        limite: máximo de produtos nesta execução.
+
+    Returns:
+        dict: contagem por status (novo, deduplicado, inalterado, erro).
+    """
+    os.makedirs(diretorio, exist_ok=True)
+    conn = db.conectar_mysql()
+    cursor = conn.cursor()
+    contagem = {"novo": 0, "deduplicado": 0, "inalterado": 0, "erro": 0}
+    try:
+        pendentes = _pendentes(cursor, revalidar, limite)
+        logger.info("Imagens a verificar: %s (%s downloads simultâneos)", len(pendentes), workers)
+        if not pendentes:
+            return contagem
+
+        sessao = _criar_sessao(workers)
+        lote: List[Resultado] = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for resultado in executor.map(lambda item: _baixar(sessao, item, diretorio), pendentes):
+                contagem[resultado.status] += 1
+                lote.append(resultado)
+                if len(lote) >= 100:
+                    _gravar_resultados(cursor, lote)
+                    conn.commit()
+                    lote = []
+        _gravar_resultados(cursor, lote)
+        conn.commit()
+
+        logger.info(
+            "Imagens concluídas. Novas=%s | Deduplicadas=%s | Inalteradas=%s | Erros=%s",
+            contagem["novo"], contagem["deduplicado"], contagem["inalterado"], contagem["erro"],
+        )
+        return contagem
+    except Exception:
+        conn.rollback()
+        logger.exception("Erro durante sincronização de imagens")
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Cache local das imagens de produto do Bling")
+    parser.add_argument("--revalidar", action="store_true",
+                        help="Revalida (GET condicional) todas as imagens, não só as pendentes")
+    parser.add_argument("--limite", type=int, help="Máximo de produtos nesta execução")
+    parser.add_argument("--workers", type=int, default=IMAGENS_WORKERS,
+                        help="Downloads simultâneos (padrão: IMAGENS_WORKERS ou 8)")
+    args = parser.parse_args()
+    sincronizar_imagens(revalidar=args.revalidar, limite=args.limite, workers=args.workers)
+
+
+if __name__ == "__main__":
+    with trava_de_script("imagens"):
+        main()
@@ -0,0 +1,55 @@
+"""Decodificação JSON das respostas do Bling com backend acelerado opcional.
+
+Usa ``orjson`` quando instalado e recai para o ``json`` da biblioteca padrão.
+Os decodificadores recebem o corpo bruto (bytes), evitando a detecção de
+encoding e a cópia em texto feitas por ``requests.Response.json()``.
+"""
+from __future__ import annotations
+
+import json
+import re
+from typing import Any, List, Union
+
+try:
+    import orjson as _orjson
+except ImportError:  # pragma: no cover - depende do ambiente
+    _orjson = None
+
+BACKEND = "orjson" if _orjson is not None else "json"
+
+_decoder = json.JSONDecoder()
+_PREFIXO_DATA = b'{"data":'
+_ESPACOS = re.compile(r"[ \t\r\n]*")
+
+
+def loads(conteudo: Union[bytes, str]) -> Any:
+    """Decodifica um documento JSON completo.
+
+    Raises:
+        ValueError: se o conteúdo não for JSON válido (ambos os backends).
+    """
+    if _orjson is not None:
+        return _orjson.loads(conteudo)
+    if isinstance(conteudo, (bytes, bytearray)):
+        conteudo = conteudo.decode("utf-8")
+    return json.loads(conteudo)
+
+
+def extrair_data(conteudo: bytes) -> List[Any]:
+    """Retorna apenas o array ``data`` de uma resposta de listagem.
+
+    Com o backend padrão, quando o corpo começa com ``{"data":`` (formato das
+    listagens do Bling v3), decodifica somente o valor de ``data`` e ignora o
+    restante do documento. Nos demais casos decodifica tudo.
+    """
+    if _orjson is None:
+        corpo = conteudo.lstrip()
+        if corpo.startswith(_PREFIXO_DATA):
+            texto = corpo.decode("utf-8")
+            inicio = _ESPACOS.match(texto, len(_PREFIXO_DATA)).end()
+            valor, _ = _decoder.raw_decode(texto, inicio)
+            return valor if isinstance(valor, list) else []
+    dados = loads(conteudo)
+    if not isinstance(dados, dict):
+        return []
+    return dados.get("data") or []
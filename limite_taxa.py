@@ -0,0 +1,121 @@
+"""Limite de taxa de requisições à API do Bling compartilhado entre processos.
+
+O Bling v3 aceita poucas requisições por segundo por conta. Todos os
+processos reservam horários de envio no mesmo relógio compartilhado, de modo
+que a soma respeite o limite. Por padrão o relógio é o arquivo
+BLING_RATE_LIMIT_ARQUIVO (``LimitadorArquivo``), comum ao monitor, ao
+agendador, aos scripts e aos workers; com a variável vazia (ou sem ``fcntl``)
+cada processo usa um ``LimitadorTaxa`` em memória, compartilhado apenas com
+os workers que ele mesmo criar.
+"""
+from __future__ import annotations
+
+import multiprocessing
+import os
+import struct
+import time
+from typing import Optional, Union
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - depende do sistema
+    fcntl = None
+
+REQUISICOES_POR_SEGUNDO = float(os.getenv("BLING_RATE_LIMIT", "3"))
+ARQUIVO_TAXA = os.getenv("BLING_RATE_LIMIT_ARQUIVO", "bling_taxa.lock")
+
+_HORARIO = struct.Struct("d")
+
+
+class LimitadorTaxa:
+    """Espaça requisições em intervalos mínimos, válido entre processos.
+
+    O estado (próximo horário livre) fica em memória compartilhada, então a
+    instância pode ser repassada a workers de um ``ProcessPoolExecutor`` via
+    ``initializer``/``initargs``.
+    """
+
+    def __init__(self, requisicoes_por_segundo: float = REQUISICOES_POR_SEGUNDO, ctx=None):
+        ctx = ctx or multiprocessing
+        self.intervalo = 1.0 / requisicoes_por_segundo if requisicoes_por_segundo > 0 else 0.0
+        self._proximo = ctx.Value("d", 0.0, lock=False)
+        self._lock = ctx.Lock()
+
+    def aguardar(self) -> None:
+        """Reserva o próximo horário livre e dorme até ele."""
+        if not self.intervalo:
+            return
+        with self._lock:
+            agora = time.time()
+            horario = max(agora, self._proximo.value)
+            self._proximo.value = horario + self.intervalo
+        espera = horario - agora
+        if espera > 0:
+            time.sleep(espera)
+
+
+class LimitadorArquivo:
+    """Espaça requisições entre quaisquer processos da máquina.
+
+    O próximo horário livre fica gravado em ``caminho`` e cada reserva é feita
+    sob ``fcntl.flock`` exclusivo. O arquivo é aberto a cada reserva (o flock
+    vale por descritor, então também exclui threads do mesmo processo) e a
+    instância guarda só o caminho, podendo ser repassada a workers.
+    """
+
+    def __init__(self, caminho: str = ARQUIVO_TAXA,
+                 requisicoes_por_segundo: float = REQUISICOES_POR_SEGUNDO):
+        self.caminho = caminho
+        self.intervalo = 1.0 / requisicoes_por_segundo if requisicoes_por_segundo > 0 else 0.0
+        diretorio = os.path.dirname(caminho)
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+
+    def aguardar(self) -> None:
+        """Reserva o próximo horário livre e dorme até ele."""
+        if not self.intervalo:
+            return
+        fd = os.open(self.caminho, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            dados = os.pread(fd, _HORARIO.size, 0)
+            proximo = _HORARIO.unpack(dados)[0] if len(dados) == _HORARIO.size else 0.0
+            agora = time.time()
+            horario = max(agora, proximo)
+            os.pwrite(fd, _HORARIO.pack(horario + self.intervalo), 0)
+        finally:
+            os.close(fd)  # libera o flock
+        espera = horario - agora
+        if espera > 0:
+            time.sleep(espera)
+
+
+Limitador = Union[LimitadorTaxa, LimitadorArquivo]
+
+_limitador: Optional[Limitador] = None
+
+
+def novo_limitador() -> Limitador:
+    """Cria o limitador padrão: por arquivo, ou em memória sem BLING_RATE_LIMIT_ARQUIVO."""
+    if ARQUIVO_TAXA and fcntl is not None:
+        return LimitadorArquivo()
+    return LimitadorTaxa()
+
+
+def definir_limitador(limitador: Optional[Limitador]) -> None:
+    """Define o limitador usado por este processo (None desativa)."""
+    global _limitador
+    _limitador = limitador
+
+
+def obter_limitador() -> Limitador:
+    """Retorna o limitador do processo, criando o padrão se ainda não houver."""
+    global _limitador
+    if _limitador is None:
+        _limitador = novo_limitador()
+    return _limitador
+
+
+def aguardar_vez() -> None:
+    """Bloqueia até que a próxima requisição possa ser enviada."""
+    obter_limitador().aguardar()
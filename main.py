@@ -1,153 +1,322 @@
 """Sincroniza produtos do Bling com o banco de dados MySQL."""
 from logger import logger
+import argparse
 import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 import db
-from bling_api import buscar_produtos
-from detalhes_bling import update_product_details
+import motor_sync
+from bling_api import FalhaListagem
+from mapeamento import mapear_produto
+from detalhes_bling import DETAILS_MAX_AGE_HOURS, update_product_details
+from limite_taxa import Limitador, definir_limitador, novo_limitador
+from reconciliacao import IdsVistos, calcular_ausentes, instante_banco, reconciliar
+from progresso import Progresso
+from snapshot import diferenca, normalizar, relatorio
+import troca_tabela
+from perfil import perfilar
+from trava_execucao import TRAVA_ESPERA_SEG, trava_de_script
 
-DETAILS_MAX_AGE_HOURS = int(os.getenv("DETAILS_MAX_AGE_HOURS", "168"))
+SYNC_WORKERS = int(os.getenv("SYNC_WORKERS", "1"))
+# Orçamento da etapa de detalhes por execução (0 = sem limite)
+DETALHES_ORCAMENTO_SEG = float(os.getenv("DETALHES_ORCAMENTO_SEG", "0"))
+DETALHES_MAX_REQUISICOES = int(os.getenv("DETALHES_MAX_REQUISICOES", "0"))
+# Commit em grupo da etapa de detalhes: a cada N itens ou S segundos
+DETALHES_COMMIT_LINHAS = int(os.getenv("DETALHES_COMMIT_LINHAS", "100"))
+DETALHES_COMMIT_SEG = float(os.getenv("DETALHES_COMMIT_SEG", "5"))
+
+def _buscar_todos_produtos(progresso=None, vistos=None):
+    """Busca paginada de todos os produtos da API.
 
-def _safe_float(value):
-    """Converte um valor para float de forma segura.
-    
     Args:
-        value: Valor a ser convertido para float
-    
+        vistos: ``IdsVistos`` que recebe os IDs listados (reconciliação).
+
     Returns:
-        float: Valor convertido ou 0.0 em caso de erro
+        tuple: (produtos, falha); ``falha`` é a FalhaListagem que interrompeu a
+        listagem (produtos contém as páginas anteriores a ela) ou None.
     """
-    if value is None:
-        return 0.0
+    todos_produtos = []
     try:
-        return float(str(value).replace(",", "."))  # Converte vírgula para ponto
-    except (ValueError, TypeError):
-        return 0.0
+        paginas = motor_sync.listar(motor_sync.PRODUTOS, vistos=vistos)
+        for pagina, produtos_api in enumerate(paginas, start=1):
+            todos_produtos.extend(produtos_api)
+            if progresso is not None:
+                progresso.atualizar(pagina=pagina + 1, linhas=len(todos_produtos))
+    except FalhaListagem as e:
+        logger.error("Listagem de produtos interrompida após %s itens: %s", len(todos_produtos), e)
+        return todos_produtos, e
+    return todos_produtos, None
+
+def _orcamento_esgotado(prazo, requisicoes: int, max_requisicoes) -> bool:
+    """Indica se o prazo (time.time()) ou o limite de requisições de detalhes acabou."""
+    if prazo is not None and time.time() >= prazo:
+        return True
+    return bool(max_requisicoes) and requisicoes >= max_requisicoes
+
+def _processar_produtos(conn, cursor, mapeados: list, ids_gravar=None,
+                        prazo=None, max_requisicoes=None, progresso=None, recentes=None) -> Counter:
+    """Faz upsert e atualiza detalhes de um conjunto de produtos já mapeados.
+
+    Os detalhes seguem a fila priorizada de ``db.fila_detalhes`` (sem imagem,
+    depois os mais antigos, depois os alterados nesta execução) até o fim da
+    fila ou do orçamento; o restante fica para a próxima execução.
 
-def _mapear_produto(p: dict) -> dict:
-    """Mapeia os dados do produto da API do Bling para o formato do banco de dados.
-    
     Args:
-        p (dict): Dicionário com dados do produto da API
-    
+        ids_gravar: se informado, o upsert se limita a esses IDs (modo diff);
+            os detalhes continuam avaliados para todos.
+        prazo: instante (time.time()) em que a etapa de detalhes deve parar.
+        max_requisicoes: máximo de produtos cujos detalhes serão buscados.
+        progresso: se informado, recebe fase, profundidade da fila e contadores.
+        recentes: IDs novos ou alterados frente ao banco nesta execução (último
+            nível de prioridade da fila de detalhes).
+
+    Returns:
+        Counter: contadores processados, upserts, det_ok, det_skip, det_fail e det_adiados.
+    """
+    totais = Counter()
+    totais["processados"] = len(mapeados)
+
+    gravar = mapeados if ids_gravar is None else [mp for mp in mapeados if mp[0] in ids_gravar]
+
+    # Faz um único upsert em lote
+    if gravar:
+        totais["upserts"] = db.upsert_batch(cursor, gravar)
+        conn.commit()
+
+    # Fila priorizada de detalhes
+    fila = db.fila_detalhes(
+        cursor, DETAILS_MAX_AGE_HOURS,
+        ids={mp.id_bling for mp in mapeados},
+        recentes=sorted(recentes or ()),
+    )
+    totais["det_skip"] = len(mapeados) - len(fila)
+    if progresso is not None:
+        progresso.fase("detalhes", linhas=0, fila_detalhes=len(fila), upserts=totais["upserts"])
+
+    grupo = db.CommitEmGrupo(conn, cursor, DETALHES_COMMIT_LINHAS, DETALHES_COMMIT_SEG)
+    for posicao, ib in enumerate(fila):
+        requisicoes = totais["det_ok"] + totais["det_fail"]
+        if _orcamento_esgotado(prazo, requisicoes, max_requisicoes):
+            totais["det_adiados"] = len(fila) - posicao
+            logger.warning(
+                "Orçamento de detalhes esgotado após %s requisições; %s produtos ficam para a próxima execução",
+                requisicoes, totais["det_adiados"],
+            )
+            break
+        # Falha desfaz só este produto (savepoint), não o grupo ainda não confirmado
+        if grupo.executar(update_product_details, cursor, ib):
+            totais["det_ok"] += 1
+        else:
+            totais["det_fail"] += 1
+        if progresso is not None:
+            progresso.atualizar(
+                linhas=posicao + 1, fila_detalhes=len(fila) - posicao - 1, erros=totais["det_fail"]
+            )
+
+    grupo.confirmar()  # commit final
+    # Itens de grupos desfeitos pelo servidor (deadlock) não chegaram ao banco
+    totais["det_ok"] -= grupo.perdidos
+    totais["det_fail"] += grupo.perdidos
+    if progresso is not None:
+        progresso.atualizar(forcar=True)
+    return totais
+
+def _inicializar_worker(limitador: Limitador) -> None:
+    """Instala, no processo worker, o limite de taxa compartilhado."""
+    definir_limitador(limitador)
+
+def _sincronizar_shard(indice: int, produtos: list, ids_gravar=None,
+                       prazo=None, max_requisicoes=None, recentes=None) -> Counter:
+    """Executa um shard em um processo worker, com conexão e sessão HTTP próprias."""
+    conn = db.conectar_mysql()
+    cursor = conn.cursor()
+    progresso = None
+    try:
+        logger.info("Shard %s iniciado com %s produtos (pid=%s)", indice, len(produtos), os.getpid())
+        progresso = Progresso(f"produtos-shard{indice}")
+        progresso.fase("upsert", linhas=len(produtos))
+        mapeados = [mapear_produto(p) for p in produtos]
+        totais = _processar_produtos(
+            conn, cursor, mapeados, ids_gravar, prazo, max_requisicoes, progresso, recentes
+        )
+        logger.info("Shard %s finalizado: %s", indice, dict(totais))
+        progresso.concluir()
+        return totais
+    except Exception as e:
+        if progresso is not None:
+            progresso.falhar(e)
+        conn.rollback()
+        logger.exception("Erro no shard %s", indice)
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+def _processar_em_processos(produtos: list, workers: int, ids_gravar=None,
+                            prazo=None, max_requisicoes=None, recentes=None) -> Counter:
+    """Divide os produtos por ID entre workers e consolida os contadores.
+
+    Cada worker abre a própria conexão MySQL e sessão HTTP; todos compartilham
+    o mesmo limite de requisições ao Bling, o mesmo prazo e uma parte igual do
+    limite de requisições de detalhes.
+    """
+    produtos = sorted(produtos, key=lambda p: int(p["id"]))
+    shards = [produtos[i::workers] for i in range(workers)]
+    limitador = novo_limitador()
+    if max_requisicoes:
+        max_requisicoes = -(-max_requisicoes // workers)
+    totais = Counter()
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_inicializar_worker, initargs=(limitador,)
+    ) as executor:
+        futuros = [
+            executor.submit(_sincronizar_shard, i, shard, ids_gravar, prazo, max_requisicoes, recentes)
+            for i, shard in enumerate(shards) if shard
+        ]
+        for futuro in futuros:
+            totais.update(futuro.result())
+    return totais
+
+def _diff_snapshot(conn, mapeados: list, dry_run: bool, vistos=None, inicio_listagem=None):
+    """Compara os produtos mapeados com o snapshot do banco.
+
+    Roda em toda execução: além de limitar o upsert no ``--diff``, os IDs
+    devolvidos alimentam o nível "alterados nesta execução" da fila de detalhes.
+    Em dry-run, os ausentes relatados são os que ``reconciliar`` inativaria
+    (mesma âncora ``inicio_listagem`` e mesmo limite de fração); sem ``vistos``
+    (``--sem-reconciliar``), nenhum.
+
     Returns:
-        dict: Dicionário com dados mapeados para o formato do banco
+        set | None: IDs novos + alterados; None em dry-run.
     """
-    # Extrai dados de estoque
-    estoque = 0
-    if 'estoques' in p and p['estoques']:
-        for deposito in p['estoques']:
-            estoque += _safe_float(deposito.get('saldoVirtualTotal', 0))
-    
-    # Extrai dimensões
-    dimensoes = p.get('dimensoes', {})
-    
-    # Extrai dados de preço
-    preco = 0
-    if isinstance(p.get('preco'), dict):
-        preco = _safe_float(p['preco'].get('preco', 0))
-    else:
-        preco = _safe_float(p.get('preco', 0))
-    
-    # Mapeia os campos do produto para o formato do banco
-    return {
-        "id_bling": int(p.get("id")),
-        "codigo": p.get("codigo"),
-        "nome": p.get("nome"),
-        "preco": p.get("preco", 0),
-        "estoque": (p.get("estoque") or {}).get("saldoVirtualTotal", 0),
-        "tipo": p.get("tipo"),
-        "situacao": (p.get("situacao") or "")[:1],
-        "formato": p.get("formato"),
-        "largura": _safe_float(dimensoes.get("largura")),
-        "altura": _safe_float(dimensoes.get("altura")),
-        "profundidade": _safe_float(dimensoes.get("profundidade")),
-        "peso_liquido": p.get("pesoLiquido"),
-        "peso_bruto": p.get("pesoBruto")
-    }
-
-def main():
+    snap = db.carregar_snapshot(conn, normalizar)
+    novos, alterados, campos = diferenca(mapeados, snap)
+    logger.info(
+        "Diff contra snapshot (%s linhas): novos=%s | alterados=%s | inalterados=%s",
+        len(snap), len(novos), len(alterados), len(mapeados) - len(novos) - len(alterados),
+    )
+    if dry_run:
+        ausentes = []
+        if vistos is not None:
+            ausentes = list(calcular_ausentes(conn, "produtos_bling", vistos, anterior_a=inicio_listagem))
+        logger.warning("Dry-run: nenhuma alteração gravada.\n%s", relatorio(novos, alterados, campos, ausentes))
+        return None
+    return {mp.id_bling for mp in novos} | {mp.id_bling for mp in alterados}
+
+def _full_refresh(conn, mapeados: list) -> int:
+    """Monta produtos_bling_novo com a listagem completa e troca pela tabela atual."""
+    total = troca_tabela.montar_tabela_nova(conn, mapeados)
+    try:
+        troca_tabela.trocar(conn)
+    except Exception:
+        troca_tabela.descartar(conn)
+        raise
+    return total
+
+def main(workers: int = SYNC_WORKERS, reconciliar_exclusoes: bool = True,
+         modo_diff: bool = False, dry_run: bool = False, full_refresh: bool = False,
+         orcamento_seg: float = DETALHES_ORCAMENTO_SEG,
+         max_requisicoes: int = DETALHES_MAX_REQUISICOES):
     """Função principal do script de sincronização.
-    
+
     Realiza a sincronização dos produtos do Bling com o banco de dados local,
     incluindo seus detalhes e informações complementares.
+
+    Args:
+        workers: quantidade de processos; com mais de 1, os produtos são
+            divididos em shards processados em paralelo.
+        reconciliar_exclusoes: inativa produtos do banco ausentes na listagem.
+        modo_diff: grava apenas produtos novos ou alterados frente ao snapshot
+            de produtos_bling carregado no início.
+        dry_run: apenas relata o que mudaria (implica modo_diff), sem gravar.
+        full_refresh: recria produtos_bling em uma tabela sombra e faz a troca
+            atômica; os detalhes são atualizados depois, na tabela já trocada.
+        orcamento_seg: duração máxima da execução, contada a partir do início;
+            a etapa de detalhes para ao atingi-la (0 = sem limite).
+        max_requisicoes: máximo de buscas de detalhes na execução (0 = sem limite).
     """
     conn = None
+    prazo = time.time() + orcamento_seg if orcamento_seg else None
+    progresso = Progresso("produtos")
     try:
         logger.info("Iniciando sincronização com Bling...")
-        
+        progresso.fase("listagem", pagina=1)
+
         # Estabelece conexão com o banco de dados
         conn = db.conectar_mysql()
         conn.autocommit = False  # Desativa autocommit para melhor controle
         cursor = conn.cursor()
 
-        total_processados = 0
-        total_upserts = 0
-        total_det_ok = 0
-        total_det_skip = 0
-        total_det_fail = 0
-
-        # Busca paginada de todos os produtos da API
-        todos_produtos = []
-        pagina = 1
-        while True:
-            produtos_api = buscar_produtos(pagina=pagina)
-            if not produtos_api:
-                break
-            todos_produtos.extend(produtos_api)
-            pagina += 1
-
+        # Produtos cadastrados depois deste instante (ex.: por webhooks) ficam fora da reconciliação
+        inicio_listagem = instante_banco(conn) if reconciliar_exclusoes else None
+        vistos = IdsVistos()
+        todos_produtos, falha_listagem = _buscar_todos_produtos(progresso, vistos)
         logger.info("Total de produtos encontrados na API: %s", len(todos_produtos))
+        if falha_listagem is not None:
+            if full_refresh or dry_run:
+                # A tabela nova / o relatório tratariam o que faltou como excluído
+                raise falha_listagem
+            logger.warning("Listagem incompleta: gravando o que foi listado, sem reconciliação")
+            reconciliar_exclusoes = False
+        progresso.fase("mapeamento", linhas=len(todos_produtos))
 
-        # Processa todos os produtos em um único lote
-        mapeados = [_mapear_produto(p) for p in todos_produtos if p.get("id")]
-        total_processados = len(mapeados)
-
-        # Faz um único upsert em lote
-        if mapeados:
-            total_upserts = db.upsert_batch(cursor, mapeados)
-            conn.commit()
-            
-            # Verifica se os registros foram inseridos
-            cursor.execute("SELECT COUNT(*) FROM produtos_bling")
-            total_registros = cursor.fetchone()[0]
-            logger.info("Total de registros no banco após upsert: %s", total_registros)
-
-        # Processa detalhes em lote
-        for mp in mapeados:
-            ib = mp["id_bling"]
-            try:
-                if db.needs_details(cursor, ib, DETAILS_MAX_AGE_HOURS):
-                    ok = update_product_details(cursor, ib)
-                    if ok:
-                        total_det_ok += 1
-                    else:
-                        total_det_fail += 1
-                else:
-                    total_det_skip += 1
-            except Exception:
-                total_det_fail += 1
-                conn.rollback()  # Rollback em caso de erro
-
-            # Commit a cada 100 detalhes processados
-            if (total_det_ok + total_det_skip + total_det_fail) % 100 == 0:
-                conn.commit()
-                logger.info(
-                    "Commit realizado após processar %s detalhes",
-                    total_det_ok + total_det_skip + total_det_fail,
-                )
+        todos_produtos = [p for p in todos_produtos if p.get("id")]
+        mapeados = [mapear_produto(p) for p in todos_produtos]
+        progresso.fase("diff")
+        alterados = _diff_snapshot(
+            conn, mapeados, dry_run, vistos if reconciliar_exclusoes else None, inicio_listagem
+        )
+        if dry_run:
+            progresso.concluir()
+            return
+        ids_gravar = alterados if modo_diff else None
+
+        if full_refresh:
+            progresso.fase("full-refresh", linhas=len(mapeados))
+            upserts = _full_refresh(conn, mapeados)
+            # Linhas já gravadas na tabela nova; resta apenas a etapa de detalhes
+            ids_gravar = set()
+            reconciliar_exclusoes = False
+
+        if workers > 1:
+            logger.info("Processando produtos em %s processos", workers)
+            progresso.fase(f"shards ({workers} processos)")
+            totais = _processar_em_processos(
+                todos_produtos, workers, ids_gravar, prazo, max_requisicoes, alterados
+            )
+            conn.ping(reconnect=True)  # conexão do coordenador ficou ociosa
+            cursor = conn.cursor()
+        else:
+            progresso.fase("upsert", linhas=len(mapeados))
+            totais = _processar_produtos(
+                conn, cursor, mapeados, ids_gravar, prazo, max_requisicoes, progresso, alterados
+            )
+        if full_refresh:
+            totais["upserts"] = upserts
+
+        if reconciliar_exclusoes:
+            progresso.fase("reconciliacao")
+            totais["inativados"] = reconciliar(
+                conn, "produtos_bling", vistos, anterior_a=inicio_listagem
+            )
 
-        conn.commit()  # commit final
-        
         # Verifica total final de registros
         cursor.execute("SELECT COUNT(*) FROM produtos_bling")
         total_final = cursor.fetchone()[0]
         logger.info("Total final de registros no banco: %s", total_final)
 
         logger.info(
-            "Finalizado. Processados=%s | Upserts=%s | Detalhes ok=%s | Detalhes pulados=%s | Detalhes falha=%s",
-            total_processados, total_upserts, total_det_ok, total_det_skip, total_det_fail
+            "Finalizado. Processados=%s | Upserts=%s | Detalhes ok=%s | Detalhes pulados=%s | Detalhes falha=%s | "
+            "Detalhes adiados=%s | Inativados=%s",
+            totais["processados"], totais["upserts"], totais["det_ok"], totais["det_skip"], totais["det_fail"],
+            totais["det_adiados"], totais["inativados"]
         )
-    except Exception:
+        if falha_listagem is not None:
+            raise falha_listagem
+        progresso.concluir(**{k: totais[k] for k in ("upserts", "det_ok", "det_fail", "det_adiados", "inativados")})
+    except Exception as e:
+        progresso.falhar(e)
         if conn:
             conn.rollback()
         logger.exception("Erro fatal durante a execução")
@@ -157,5 +326,71 @@ def main():
             cursor.close()
             conn.close()
 
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Sincroniza produtos do Bling com o MySQL.")
+    parser.add_argument(
+        "--workers", type=int, default=SYNC_WORKERS,
+        help="Processos paralelos para mapeamento, detalhes e escrita (padrão: SYNC_WORKERS ou 1)",
+    )
+    parser.add_argument(
+        "--sem-reconciliar", action="store_true",
+        help="Não inativa produtos do banco que não aparecem na listagem do Bling",
+    )
+    parser.add_argument(
+        "--diff", action="store_true",
+        help="Carrega um snapshot de produtos_bling e grava apenas novos/alterados",
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true",
+        help="Relata o que seria inserido/alterado/inativado, sem gravar nada",
+    )
+    parser.add_argument(
+        "--orcamento-seg", type=float, default=DETALHES_ORCAMENTO_SEG,
+        help="Duração máxima da execução em segundos; detalhes restantes ficam para a próxima (0 = sem limite)",
+    )
+    parser.add_argument(
+        "--max-requisicoes", type=int, default=DETALHES_MAX_REQUISICOES,
+        help="Máximo de buscas de detalhes por execução (0 = sem limite)",
+    )
+    parser.add_argument(
+        "--full-refresh", action="store_true",
+        help="Recria produtos_bling em tabela sombra e troca atomicamente ao final",
+    )
+    parser.add_argument(
+        "--reverter-refresh", action="store_true",
+        help="Desfaz o último --full-refresh (volta produtos_bling_antigo) e sai",
+    )
+    parser.add_argument(
+        "--perfil", "--profile", action="store_true",
+        help="Grava ao lado do log um relatório de CPU (cProfile), tempo por fase e memória (tracemalloc)",
+    )
+    parser.add_argument(
+        "--esperar-trava", type=float, default=TRAVA_ESPERA_SEG, metavar="SEG",
+        help="Com outra execução em curso, aguarda até SEG segundos em vez de sair (padrão: TRAVA_ESPERA_SEG ou 0)",
+    )
+    return parser.parse_args()
+
+def _reverter_refresh():
+    conn = db.conectar_mysql()
+    try:
+        troca_tabela.reverter(conn)
+    finally:
+        conn.close()
+
 if __name__ == "__main__":
-    main()
+    args = _parse_args()
+    # Uma execução de produtos por vez, entre cron, agendador e chamadas manuais
+    with trava_de_script("produtos", args.esperar_trava):
+        if args.reverter_refresh:
+            _reverter_refresh()
+        else:
+            with perfilar("produtos", args.perfil):
+                main(
+                    workers=args.workers,
+                    reconciliar_exclusoes=not args.sem_reconciliar,
+                    modo_diff=args.diff,
+                    dry_run=args.dry_run,
+                    full_refresh=args.full_refresh,
+                    orcamento_seg=args.orcamento_seg,
+                    max_requisicoes=args.max_requisicoes,
+                )
@@ -0,0 +1,111 @@
+"""Mapeamento único do payload de produto da API do Bling para o banco MySQL.
+
+O produto é convertido uma única vez, direto para a tupla de parâmetros usada
+pelo upsert em produtos_bling, sem dicionários intermediários.
+"""
+from __future__ import annotations
+
+from operator import itemgetter
+from typing import Any
+
+
+def to_float(value: Any) -> float:
+    """Converte valor para float de forma tolerante a vírgulas e None."""
+    if value is None:
+        return 0.0
+    tipo = type(value)
+    if tipo is float:
+        return value
+    if tipo is int:
+        return float(value)
+    if tipo is not str:
+        value = str(value)
+    if "," in value:
+        value = value.replace(",", ".")
+    try:
+        return float(value)
+    except ValueError:
+        return 0.0
+
+
+def to_int(value: Any) -> int:
+    """Converte valor para int aceitando entradas com vírgula/ponto."""
+    return int(to_float(value))
+
+
+def extrair_preco(p: dict) -> float:
+    """Preço pode vir como dict ({"preco": ...}) ou valor simples."""
+    preco = p.get("preco")
+    if isinstance(preco, dict):
+        return to_float(preco.get("preco"))
+    return to_float(preco)
+
+
+def extrair_estoque(p: dict) -> float:
+    """Soma o saldo virtual dos depósitos ou usa o saldo total do produto."""
+    estoques = p.get("estoques")
+    if estoques:
+        return sum(to_float(d.get("saldoVirtualTotal")) for d in estoques)
+    return to_float((p.get("estoque") or {}).get("saldoVirtualTotal"))
+
+
+class ProdutoMapeado(tuple):
+    """Registro imutável de produto já no formato de parâmetros do upsert.
+
+    É a própria tupla enviada ao ``executemany``; os atributos nomeados apenas
+    dão acesso legível às posições (sem ``__dict__`` por instância).
+    """
+
+    __slots__ = ()
+
+    CAMPOS = (
+        "id_bling", "codigo", "nome", "preco", "estoque", "tipo", "situacao",
+        "formato", "largura", "altura", "profundidade", "peso_liquido", "peso_bruto",
+    )
+
+    id_bling = property(itemgetter(0))
+    codigo = property(itemgetter(1))
+    nome = property(itemgetter(2))
+    preco = property(itemgetter(3))
+    estoque = property(itemgetter(4))
+    tipo = property(itemgetter(5))
+    situacao = property(itemgetter(6))
+    formato = property(itemgetter(7))
+    largura = property(itemgetter(8))
+    altura = property(itemgetter(9))
+    profundidade = property(itemgetter(10))
+    peso_liquido = property(itemgetter(11))
+    peso_bruto = property(itemgetter(12))
+
+    def __repr__(self) -> str:
+        return f"ProdutoMapeado(id_bling={self[0]!r}, codigo={self[1]!r})"
+
+
+_new = tuple.__new__
+
+
+def mapear_produto(p: dict) -> ProdutoMapeado:
+    """Mapeia o payload de produto da API direto para os parâmetros do upsert.
+
+    Args:
+        p (dict): Dicionário com dados do produto da API (deve conter "id")
+
+    Returns:
+        ProdutoMapeado: tupla na ordem das colunas de ``db._SQL_UPSERT``.
+    """
+    dimensoes = p.get("dimensoes") or {}
+    return _new(ProdutoMapeado, (
+        int(p["id"]),
+        p.get("codigo"),
+        (p.get("nome") or "")[:255],
+        extrair_preco(p),
+        extrair_estoque(p),
+        p.get("tipo"),
+        (p.get("situacao") or "")[:1],
+        p.get("formato"),
+        to_float(dimensoes.get("largura")),
+        to_float(dimensoes.get("altura")),
+        to_float(dimensoes.get("profundidade")),
+        to_float(p.get("pesoLiquido")),
+        to_float(p.get("pesoBruto")),
+    ))
@@ -0,0 +1,326 @@
+"""Migrações versionadas do esquema MySQL (tabelas e índices da sincronização).
+
+Deve rodar uma vez por deploy, não a cada sincronização:
+
+    python migracoes.py              # aplica as migrações pendentes
+    python migracoes.py --verificar  # apenas relata migrações e índices faltantes
+
+As versões aplicadas ficam registradas em ``schema_migracoes``.
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+from typing import Callable, Dict, List, Sequence, Tuple, Union
+
+from db import conectar_mysql
+from logger import logger
+
+_SQL_PRODUTOS = """
+CREATE TABLE IF NOT EXISTS produtos_bling (
+    id_bling BIGINT NOT NULL,
+    codigo VARCHAR(50),
+    nome VARCHAR(255),
+    preco DECIMAL(10,2),
+    estoque DECIMAL(10,2),
+    tipo VARCHAR(50),
+    situacao CHAR(1),
+    formato VARCHAR(50),
+    largura DECIMAL(10,3),
+    altura DECIMAL(10,3),
+    profundidade DECIMAL(10,3),
+    peso_liquido DECIMAL(10,3),
+    peso_bruto DECIMAL(10,3),
+    imagem TEXT,
+    data_alteracao TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (id_bling)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+"""
+
+_SQL_CLIENTES = """
+CREATE TABLE IF NOT EXISTS clientes_bling (
+    id BIGINT(20) NOT NULL AUTO_INCREMENT,
+    codigo BIGINT(20) DEFAULT NULL,
+    nome VARCHAR(255) NOT NULL,
+    fantasia VARCHAR(255),
+    tipo CHAR(1) NOT NULL COMMENT 'F=Física, J=Jurídica',
+    documento VARCHAR(20) COMMENT 'CPF ou CNPJ',
+    ie VARCHAR(20) COMMENT 'Inscrição Estadual',
+    rg VARCHAR(20),
+    telefone VARCHAR(20),
+    celular VARCHAR(20),
+    email VARCHAR(255),
+    endereco VARCHAR(255),
+    numero VARCHAR(10),
+    complemento VARCHAR(100),
+    bairro VARCHAR(100),
+    cep VARCHAR(10),
+    municipio VARCHAR(100),
+    uf CHAR(2),
+    situacao CHAR(1) DEFAULT 'A' COMMENT 'A=Ativo, I=Inativo',
+    data_cadastro TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    data_alteracao TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (`id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+"""
+
+_SQL_IMAGENS_CACHE = """
+CREATE TABLE IF NOT EXISTS imagens_cache (
+    id_bling BIGINT NOT NULL,
+    url TEXT NOT NULL,
+    etag VARCHAR(255),
+    last_modified VARCHAR(64),
+    sha256 CHAR(64),
+    caminho VARCHAR(255),
+    atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (id_bling),
+    KEY idx_imagens_sha256 (sha256)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+"""
+
+_SQL_PEDIDOS_VENDAS = """
+CREATE TABLE IF NOT EXISTS pedidos_vendas (
+    id BIGINT NOT NULL,
+    numero BIGINT,
+    numero_loja VARCHAR(100),
+    data DATE,
+    data_saida DATE,
+    data_prevista DATE,
+    total_produtos DECIMAL(12,2),
+    total DECIMAL(12,2),
+    id_contato BIGINT,
+    nome_contato VARCHAR(255),
+    documento_contato VARCHAR(20),
+    situacao_id BIGINT,
+    situacao_valor INT,
+    id_loja BIGINT,
+    assinatura CHAR(32) COMMENT 'md5 dos valores mapeados (detecção de alteração)',
+    data_alteracao TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+"""
+
+# Índices secundários exigidos pelas consultas quentes: {tabela: {nome: colunas}}
+INDICES: Dict[str, Dict[str, str]] = {
+    "produtos_bling": {
+        # needs_details / fila de detalhes: imagem vazia e data_alteracao antiga
+        "idx_produtos_imagem_alteracao": "imagem(16), data_alteracao",
+        "idx_produtos_data_alteracao": "data_alteracao",
+        "idx_produtos_codigo": "codigo",
+        # fila de detalhes com intervalo adaptativo
+        "idx_produtos_detalhes_proxima": "detalhes_proxima",
+    },
+    "clientes_bling": {
+        "idx_clientes_documento": "documento",
+        "idx_clientes_codigo": "codigo",
+        # busca de clientes (consulta_contatos.pesquisar)
+        "idx_clientes_telefone": "telefone",
+        "idx_clientes_celular": "celular",
+        "idx_clientes_email": "email",
+        "idx_clientes_nome": "nome",
+        "idx_clientes_fantasia": "fantasia",
+        "ft_clientes_nome_fantasia": "nome, fantasia",
+    },
+    "pedidos_vendas": {
+        "idx_pedidos_data": "data",
+        "idx_pedidos_contato": "id_contato",
+    },
+}
+
+# Índices de INDICES criados como FULLTEXT
+_FULLTEXT = {"ft_clientes_nome_fantasia"}
+
+
+def _indices_existentes(cursor, tabela: str) -> set:
+    cursor.execute(
+        """
+        SELECT DISTINCT index_name FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s
+        """,
+        (tabela,),
+    )
+    return {row[0] for row in cursor.fetchall()}
+
+
+def _garantir_indices(tabela: str, nomes: Sequence[str]) -> Callable:
+    """Passo de migração que cria os índices informados, se ainda não existirem."""
+    def passo(cursor) -> None:
+        existentes = _indices_existentes(cursor, tabela)
+        for nome in nomes:
+            if nome not in existentes:
+                tipo = "FULLTEXT INDEX" if nome in _FULLTEXT else "INDEX"
+                cursor.execute(f"CREATE {tipo} {nome} ON {tabela} ({INDICES[tabela][nome]})")
+                logger.info("Índice %s criado em %s", nome, tabela)
+    return passo
+
+
+def _colunas_existentes(cursor, tabela: str) -> set:
+    cursor.execute(
+        """
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = %s
+        """,
+        (tabela,),
+    )
+    return {row[0] for row in cursor.fetchall()}
+
+
+def _garantir_colunas(tabela: str, colunas: Dict[str, str]) -> Callable:
+    """Passo de migração que adiciona as colunas ({nome: definição}) ainda ausentes."""
+    def passo(cursor) -> None:
+        existentes = _colunas_existentes(cursor, tabela)
+        for nome, definicao in colunas.items():
+            if nome not in existentes:
+                cursor.execute(f"ALTER TABLE {tabela} ADD COLUMN {nome} {definicao}")
+                logger.info("Coluna %s adicionada em %s", nome, tabela)
+    return passo
+
+
+Passo = Union[str, Callable]
+
+# (versão, descrição, passos). Nunca altere uma migração já publicada; crie outra.
+MIGRACOES: List[Tuple[int, str, List[Passo]]] = [
+    (1, "Tabelas produtos_bling e clientes_bling", [_SQL_PRODUTOS, _SQL_CLIENTES]),
+    (2, "Índices secundários de produtos e clientes", [
+        _garantir_indices("produtos_bling", [
+            "idx_produtos_imagem_alteracao", "idx_produtos_data_alteracao", "idx_produtos_codigo",
+        ]),
+        _garantir_indices("clientes_bling", ["idx_clientes_documento", "idx_clientes_codigo"]),
+    ]),
+    (3, "Intervalo adaptativo de atualização de detalhes", [
+        _garantir_colunas("produtos_bling", {
+            "detalhes_intervalo_h": "INT NULL COMMENT 'Intervalo atual entre buscas de detalhes'",
+            "detalhes_proxima": "DATETIME NULL COMMENT 'Próxima busca de detalhes prevista'",
+        }),
+        _garantir_indices("produtos_bling", ["idx_produtos_detalhes_proxima"]),
+    ]),
+    (4, "Cache local de imagens de produto", [
+        _SQL_IMAGENS_CACHE,
+        _garantir_colunas("produtos_bling", {
+            "imagem_local": "VARCHAR(255) NULL COMMENT 'Caminho relativo a IMAGENS_DIR'",
+        }),
+    ]),
+    (5, "Índices da busca de clientes", [
+        _garantir_indices("clientes_bling", [
+            "idx_clientes_telefone", "idx_clientes_celular", "idx_clientes_email",
+            "idx_clientes_nome", "idx_clientes_fantasia", "ft_clientes_nome_fantasia",
+        ]),
+    ]),
+    (6, "Tabela pedidos_vendas", [
+        _SQL_PEDIDOS_VENDAS,
+        _garantir_indices("pedidos_vendas", ["idx_pedidos_data", "idx_pedidos_contato"]),
+    ]),
+    (7, "Hash dos detalhes de produto (intervalo adaptativo)", [
+        _garantir_colunas("produtos_bling", {
+            "detalhes_hash": "CHAR(32) NULL COMMENT 'md5 dos detalhes da última busca'",
+        }),
+    ]),
+    (8, "Data de cadastro de produtos (reconciliação de exclusões)", [
+        _garantir_colunas("produtos_bling", {
+            "data_cadastro": "TIMESTAMP DEFAULT CURRENT_TIMESTAMP",
+        }),
+    ]),
+]
+
+
+def _garantir_controle(cursor) -> None:
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migracoes (
+            versao INT NOT NULL PRIMARY KEY,
+            descricao VARCHAR(255) NOT NULL,
+            aplicada_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) ENGINE=InnoDB
+        """
+    )
+
+
+def versoes_aplicadas(cursor) -> set:
+    _garantir_controle(cursor)
+    cursor.execute("SELECT versao FROM schema_migracoes")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def migrar(conn) -> List[int]:
+    """Aplica, em ordem, as migrações ainda não registradas.
+
+    Returns:
+        list: versões aplicadas nesta execução.
+    """
+    cursor = conn.cursor()
+    aplicadas: List[int] = []
+    try:
+        feitas = versoes_aplicadas(cursor)
+        for versao, descricao, passos in MIGRACOES:
+            if versao in feitas:
+                continue
+            logger.info("Aplicando migração %s: %s", versao, descricao)
+            for passo in passos:
+                if callable(passo):
+                    passo(cursor)
+                else:
+                    cursor.execute(passo)
+            cursor.execute(
+                "INSERT INTO schema_migracoes (versao, descricao) VALUES (%s, %s)", (versao, descricao)
+            )
+            conn.commit()
+            aplicadas.append(versao)
+        return aplicadas
+    finally:
+        cursor.close()
+
+
+def indices_faltantes(conn) -> List[Tuple[str, str]]:
+    """Lista (tabela, índice) esperados que não existem no banco."""
+    cursor = conn.cursor()
+    try:
+        faltantes = []
+        for tabela, indices in INDICES.items():
+            existentes = _indices_existentes(cursor, tabela)
+            faltantes.extend((tabela, nome) for nome in indices if nome not in existentes)
+        return faltantes
+    finally:
+        cursor.close()
+
+
+def verificar(conn) -> bool:
+    """Relata migrações pendentes e índices ausentes.
+
+    Returns:
+        bool: True se o esquema está completo.
+    """
+    cursor = conn.cursor()
+    try:
+        pendentes = [v for v, _, _ in MIGRACOES if v not in versoes_aplicadas(cursor)]
+    finally:
+        cursor.close()
+    faltantes = indices_faltantes(conn)
+    if pendentes:
+        logger.warning("Migrações pendentes: %s", ", ".join(map(str, pendentes)))
+    for tabela, nome in faltantes:
+        logger.warning("Índice ausente: %s.%s (%s)", tabela, nome, INDICES[tabela][nome])
+    if not pendentes and not faltantes:
+        logger.info("Esquema atualizado; todos os índices presentes")
+    return not pendentes and not faltantes
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Migrações do esquema MySQL da integração Bling")
+    parser.add_argument("--verificar", action="store_true",
+                        help="Apenas relata migrações pendentes e índices ausentes")
+    args = parser.parse_args()
+
+    conn = conectar_mysql()
+    try:
+        if not args.verificar:
+            aplicadas = migrar(conn)
+            logger.warning(
+                "Migrações aplicadas: %s", ", ".join(map(str, aplicadas)) if aplicadas else "nenhuma"
+            )
+        return 0 if verificar(conn) else 1
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
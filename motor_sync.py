@@ -0,0 +1,481 @@
+"""Motor genérico de sincronização de entidades do Bling para o MySQL.
+
+Uma entidade é declarada com ``Entidade``: recurso da API (listagem paginada),
+função de mapeamento (item da API -> tupla de colunas), tabela de destino,
+coluna-chave e, opcionalmente, a chave de alteração usada para pular registros
+que não mudaram. ``sincronizar`` cuida do resto:
+
+- busca paginada com retentativas (``bling_api.buscar_pagina``), ancorada no
+  instante de início e sem IDs repetidos entre páginas (ver ``listar``);
+- detalhes de cada item em paralelo, sob o limite de requisições compartilhado
+  (``detalhar=True``);
+- etapas busca -> mapeamento -> gravação ligadas por filas limitadas, de modo
+  que a página N+1 é baixada enquanto a página N é gravada, com memória constante;
+- detecção de alteração contra um snapshot ``{chave: coluna_alteracao}``
+  carregado em uma única consulta;
+- gravação em lotes (executemany) com commit por lote;
+- métricas (Counter + log final), progresso para o monitor e reconciliação de
+  exclusões para as tabelas de ``reconciliacao.TABELAS``.
+
+Produtos (``PRODUTOS``, abaixo), contatos (``sincronizar_clientes.CLIENTES``) e
+pedidos de venda (``sincronizar_pedidos.PEDIDOS_VENDAS``) são declarados assim.
+"""
+from __future__ import annotations
+
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+import mysql.connector
+
+import gravacao_api
+from bling_api import FalhaListagem, buscar_pagina, buscar_registro
+from db import conectar_mysql, upsert_batch
+from limite_taxa import obter_limitador
+from logger import logger
+from mapeamento import ProdutoMapeado, mapear_produto
+from progresso import Progresso
+from reconciliacao import TABELAS, IdsVistos, instante_banco, reconciliar
+
+SYNC_LOTE = int(os.getenv("SYNC_LOTE", "100"))
+SYNC_DETALHE_WORKERS = int(os.getenv("SYNC_DETALHE_WORKERS", "4"))
+SYNC_FILA_MAX = int(os.getenv("SYNC_FILA_MAX", "200"))
+# 0 desliga o filtro de âncora (ex.: se o Bling recusar o formato de data/hora)
+LISTAGEM_ANCORADA = os.getenv("LISTAGEM_ANCORADA", "1") != "0"
+
+
+def _mais_recente(api_valor, db_valor) -> bool:
+    """Regra padrão da chave de alteração: grava se a API tem valor mais novo que o banco."""
+    if api_valor is None:
+        return False
+    try:
+        return api_valor > db_valor
+    except TypeError:
+        # Datas com e sem fuso: na dúvida, grava
+        return True
+
+
+class Entidade:
+    """Declaração de uma entidade sincronizável.
+
+    Args:
+        nome: identificação em logs, métricas e progresso.
+        recurso: caminho da listagem na API v3 (ex.: "contatos", "pedidos/vendas").
+        tabela: tabela MySQL de destino.
+        chave: coluna-chave (primeiro item da tupla mapeada).
+        colunas: colunas gravadas, na ordem da tupla mapeada.
+        mapear: item da API -> tupla de valores das colunas.
+        params_listagem: parâmetros extras da listagem (ou função que os devolve).
+        ancora: filtro de data de inclusão final da listagem (ex.: "dataInclusaoFinal"),
+            fixado no instante em que a listagem começa.
+        detalhar: busca ``GET /<recurso>/<id>`` de cada item antes de mapear.
+        coluna_alteracao: coluna comparada para decidir se o registro mudou.
+        extrair_alteracao: (item, linha mapeada) -> valor da chave de alteração.
+        mudou: (valor da API, valor do banco) -> bool; padrão ``_mais_recente``.
+        gravar: (cursor, linhas) -> int; padrão é o upsert gerado por ``sql_upsert``.
+    """
+
+    def __init__(self, nome: str, recurso: str, tabela: str, chave: str,
+                 colunas: Sequence[str], mapear: Callable[[dict], tuple],
+                 params_listagem=None, ancora: Optional[str] = None, detalhar: bool = False,
+                 coluna_alteracao: Optional[str] = None,
+                 extrair_alteracao: Optional[Callable[[dict, tuple], Any]] = None,
+                 mudou: Callable[[Any, Any], bool] = _mais_recente,
+                 gravar: Optional[Callable[[Any, List[tuple]], int]] = None):
+        self.nome = nome
+        self.recurso = recurso
+        self.tabela = tabela
+        self.chave = chave
+        self.colunas = tuple(colunas)
+        self.mapear = mapear
+        self.params_listagem = params_listagem
+        self.ancora = ancora
+        if ancora:
+            # Muda a cada execução: fora da chave da gravação, a reprodução ainda casa
+            gravacao_api.ignorar_na_chave(ancora)
+        self.detalhar = detalhar
+        self.coluna_alteracao = coluna_alteracao
+        self.extrair_alteracao = extrair_alteracao
+        self.mudou = mudou
+        self.gravar = gravar or self._gravar_padrao
+        self._sql = sql_upsert(tabela, self.colunas, chave)
+
+    def parametros(self) -> dict:
+        params = self.params_listagem
+        return dict(params() if callable(params) else (params or {}))
+
+    def _gravar_padrao(self, cursor, linhas: List[tuple]) -> int:
+        cursor.executemany(self._sql, linhas)
+        return len(linhas)
+
+
+def sql_upsert(tabela: str, colunas: Sequence[str], chave: str) -> str:
+    """INSERT ... ON DUPLICATE KEY UPDATE de todas as colunas exceto a chave."""
+    lista = ", ".join(colunas)
+    marcadores = ", ".join(["%s"] * len(colunas))
+    atualizacoes = ", ".join(f"{c} = VALUES({c})" for c in colunas if c != chave)
+    return f"INSERT INTO {tabela} ({lista}) VALUES ({marcadores}) ON DUPLICATE KEY UPDATE {atualizacoes}"
+
+
+# Produtos usam só listagem e gravação do motor; a etapa de detalhes (fila
+# priorizada, orçamento, shards) é específica de main.py
+PRODUTOS = Entidade(
+    nome="produtos",
+    recurso="produtos",
+    tabela="produtos_bling",
+    chave="id_bling",
+    colunas=ProdutoMapeado.CAMPOS,
+    mapear=mapear_produto,
+    params_listagem={"criterio": "cadastro", "ordem": "ASC"},
+    ancora="dataInclusaoFinal",
+    gravar=upsert_batch,
+)
+
+
+def listar(entidade: Entidade, contadores: Optional[Counter] = None,
+           vistos: Optional[IdsVistos] = None) -> Iterator[list]:
+    """Percorre a listagem da entidade, página a página, até a primeira página vazia.
+
+    A paginação do Bling é por número de página: registros criados durante a
+    listagem deslocam os demais entre páginas. Para uma passada completa e sem
+    retrabalho, as entidades listam em ordem crescente de cadastro (novos
+    registros entram no fim, não empurram os já lidos) com o filtro ``ancora``
+    fixado no início da listagem (a passada termina no retrato daquele
+    instante). IDs já entregues em páginas anteriores são descartados e somados
+    em ``contadores["repetidos"]``.
+
+    Os IDs entregues são acumulados em ``vistos`` (``IdsVistos``, 8 bytes por
+    ID), que ao final serve à reconciliação de exclusões.
+
+    Uma exclusão durante a listagem ainda pode adiantar um registro para uma
+    página já lida; se a reconciliação o inativar, a execução seguinte o
+    regrava como ativo (ver ``carregar_alteracoes``).
+
+    Raises:
+        FalhaListagem: se uma página não foi obtida; a listagem está incompleta.
+    """
+    params = entidade.parametros()
+    if entidade.ancora and LISTAGEM_ANCORADA:
+        params[entidade.ancora] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    vistos = IdsVistos() if vistos is None else vistos
+    pagina = 1
+    while True:
+        itens = buscar_pagina(entidade.recurso, pagina, params, descricao=entidade.nome)
+        if not itens:
+            break
+        novos = []
+        na_pagina = set()
+        for item in itens:
+            id_item = item.get("id")
+            if id_item:
+                if id_item in na_pagina or id_item in vistos:
+                    continue
+                na_pagina.add(id_item)
+            novos.append(item)
+        # Acrescentados só após a página inteira: no máximo uma ordenação por página
+        vistos.estender(na_pagina)
+        if len(novos) < len(itens):
+            logger.info(
+                "Página %s de %s: %s itens repetidos de páginas anteriores descartados",
+                pagina, entidade.nome, len(itens) - len(novos),
+            )
+            if contadores is not None:
+                contadores["repetidos"] += len(itens) - len(novos)
+        yield novos
+        pagina += 1
+
+
+def _reconciliavel(entidade: Entidade) -> bool:
+    """Tabelas cujos registros a reconciliação pode inativar (situacao = 'I')."""
+    return entidade.tabela in TABELAS and "situacao" in entidade.colunas
+
+
+def carregar_alteracoes(conn, entidade: Entidade) -> Tuple[Dict[int, Any], Set[int]]:
+    """Snapshot {chave: coluna_alteracao} da tabela, lido em streaming.
+
+    Returns:
+        tuple: (snapshot, chaves com situacao 'I'); o conjunto só é preenchido
+        para tabelas reconciliáveis. A reconciliação mantém ``data_alteracao``
+        ao inativar, então um registro inativado por engano (ex.: deslocado
+        para uma página já lida) não parece alterado quando volta na listagem:
+        ``sincronizar`` o regrava sempre que a API o traz ativo.
+    """
+    situacao = ", situacao = 'I'" if _reconciliavel(entidade) else ", FALSE"
+    cursor = conn.cursor(buffered=False)
+    try:
+        cursor.execute(
+            f"SELECT {entidade.chave}, {entidade.coluna_alteracao}{situacao} FROM {entidade.tabela}"
+        )
+        alteracoes: Dict[int, Any] = {}
+        inativos: Set[int] = set()
+        for chave, valor, inativo in cursor:
+            alteracoes[int(chave)] = valor
+            if inativo:
+                inativos.add(int(chave))
+        return alteracoes, inativos
+    finally:
+        cursor.close()
+
+
+# Marcadores que atravessam o pipeline (fila -> próxima etapa)
+_FIM = object()
+
+
+class _FimPagina(NamedTuple):
+    pagina: int
+    quantidade: int
+
+
+class _Pipeline:
+    """Etapas buscar -> mapear -> gravar ligadas por filas limitadas.
+
+    Busca e mapeamento rodam em threads; a gravação roda na thread chamadora,
+    dona da conexão MySQL. Filas cheias bloqueiam a etapa anterior
+    (backpressure). Um erro em qualquer etapa interrompe as demais.
+    """
+
+    def __init__(self, entidade: Entidade, tamanho_fila: int, workers: int):
+        self.entidade = entidade
+        self.workers = workers
+        self.para_mapear = queue.Queue(maxsize=tamanho_fila)
+        self.para_gravar = queue.Queue(maxsize=tamanho_fila)
+        self.parar = threading.Event()
+        self.erro = None
+        self.falha_listagem: Optional[FalhaListagem] = None
+        self.vistos = IdsVistos()
+        self.contadores = Counter()
+
+    def _colocar(self, fila: queue.Queue, item) -> bool:
+        while not self.parar.is_set():
+            try:
+                fila.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def obter(self, fila: queue.Queue):
+        """Próximo item da fila; _FIM se o pipeline foi interrompido e a fila esvaziou."""
+        while True:
+            try:
+                return fila.get(timeout=0.5)
+            except queue.Empty:
+                if self.parar.is_set():
+                    return _FIM
+
+    def _falhar(self, erro: Exception) -> None:
+        if self.erro is None:
+            self.erro = erro
+        self.parar.set()
+
+    def _detalhar(self, executor, itens: list) -> list:
+        """Detalhes dos itens da página em paralelo; None quando a busca falha."""
+        ids = [item.get("id") for item in itens]
+        return list(executor.map(
+            lambda i: buscar_registro(self.entidade.recurso, i, descricao=f"detalhes de {self.entidade.nome}"),
+            ids,
+        ))
+
+    def buscar(self) -> None:
+        """Etapa 1: pagina a listagem e, se configurado, busca o detalhe de cada item."""
+        executor = ThreadPoolExecutor(max_workers=self.workers) if self.entidade.detalhar else None
+        try:
+            for pagina, itens in enumerate(listar(self.entidade, self.contadores, self.vistos), start=1):
+                if self.parar.is_set():
+                    return
+                logger.info("Encontrados %s %s na página %s", len(itens), self.entidade.nome, pagina)
+                itens = [item for item in itens if item.get("id")]
+
+                detalhes = self._detalhar(executor, itens) if executor else itens
+                for item, detalhe in zip(itens, detalhes):
+                    if not detalhe:
+                        logger.warning(
+                            "Não foi possível obter detalhes de %s %s; prosseguindo com dados da listagem",
+                            self.entidade.nome, item["id"],
+                        )
+                    if not self._colocar(self.para_mapear, (detalhe or item, bool(detalhe))):
+                        return
+                if not self._colocar(self.para_mapear, _FimPagina(pagina, len(itens))):
+                    return
+        except FalhaListagem as e:
+            # As páginas já obtidas seguem para gravação; a reconciliação é cancelada
+            logger.error("Listagem de %s interrompida: %s", self.entidade.nome, e)
+            self.falha_listagem = e
+        except Exception as e:
+            logger.exception("Erro na etapa de busca de %s", self.entidade.nome)
+            self._falhar(e)
+        finally:
+            if executor:
+                executor.shutdown(wait=False)
+            self._colocar(self.para_mapear, _FIM)
+
+    def mapear(self) -> None:
+        """Etapa 2: monta a tupla de colunas e extrai a chave de alteração.
+
+        Um item que falha no mapeamento é registrado e contado em ``erros``.
+        """
+        entidade = self.entidade
+        try:
+            while True:
+                item = self.obter(self.para_mapear)
+                if item is _FIM or isinstance(item, _FimPagina):
+                    if not self._colocar(self.para_gravar, item) or item is _FIM:
+                        return
+                    continue
+                registro, detalhado = item
+                try:
+                    linha = entidade.mapear(registro)
+                    alteracao = entidade.extrair_alteracao(registro, linha) if entidade.extrair_alteracao else None
+                except Exception as e:
+                    # Um payload inválido não interrompe a sincronização dos demais
+                    self.contadores["erros"] += 1
+                    logger.error("Erro ao mapear %s %s: %s", entidade.nome, registro.get("id"), e)
+                    continue
+                if not self._colocar(self.para_gravar, (linha, alteracao, detalhado)):
+                    return
+        except Exception as e:
+            logger.exception("Erro na etapa de mapeamento de %s", entidade.nome)
+            self._falhar(e)
+
+
+def _gravar_lote(conn, cursor, entidade: Entidade, linhas: List[tuple], metricas: Counter) -> None:
+    """Grava e confirma um lote; se o lote falhar, tenta linha a linha para isolar o erro."""
+    if not linhas:
+        return
+    try:
+        metricas["gravados"] += entidade.gravar(cursor, linhas)
+        conn.commit()
+        return
+    except mysql.connector.Error as e:
+        conn.rollback()
+        logger.warning("Lote de %s falhou (%s); gravando linha a linha", entidade.nome, e)
+    for linha in linhas:
+        try:
+            metricas["gravados"] += entidade.gravar(cursor, [linha])
+        except mysql.connector.Error as e:
+            metricas["erros"] += 1
+            logger.error("Erro MySQL ao gravar %s %s: %s", entidade.nome, linha[0], e)
+    conn.commit()
+
+
+def sincronizar(entidade: Entidade, reconciliar_exclusoes: bool = True,
+                tamanho_lote: int = SYNC_LOTE, workers: int = SYNC_DETALHE_WORKERS,
+                tamanho_fila: int = SYNC_FILA_MAX) -> Counter:
+    """Sincroniza a entidade inteira: listagem, detalhes, alteração, gravação e reconciliação.
+
+    Args:
+        reconciliar_exclusoes: ao final, inativa registros ausentes na listagem
+            (só para tabelas de ``reconciliacao.TABELAS``).
+        tamanho_lote: linhas por executemany/commit.
+        workers: buscas de detalhe simultâneas (com ``detalhar``).
+        tamanho_fila: itens por fila do pipeline.
+
+    Returns:
+        Counter: listados, paginas, repetidos, gravados, pulados, sem_detalhe, erros e inativados.
+
+    Raises:
+        FalhaListagem: se uma página da listagem falhou. O que foi listado até
+            ali é gravado antes, mas a reconciliação não roda.
+    """
+    logger.info("Iniciando sincronização de %s do Bling", entidade.nome)
+    inicio = time.monotonic()
+    metricas = Counter()
+    progresso = Progresso(entidade.nome)
+    conn = conectar_mysql()
+    pipeline = _Pipeline(entidade, tamanho_fila, workers)
+    threads = [
+        threading.Thread(target=pipeline.buscar, name=f"{entidade.nome}-busca", daemon=True),
+        threading.Thread(target=pipeline.mapear, name=f"{entidade.nome}-mapa", daemon=True),
+    ]
+    try:
+        cursor = conn.cursor()
+        alteracoes, inativos = None, set()
+        if entidade.coluna_alteracao:
+            alteracoes, inativos = carregar_alteracoes(conn, entidade)
+        indice_situacao = entidade.colunas.index("situacao") if inativos else None
+        reconciliar_exclusoes = reconciliar_exclusoes and entidade.tabela in TABELAS
+        # Registros cadastrados depois deste instante (ex.: por webhooks) ficam fora da reconciliação
+        inicio_listagem = instante_banco(conn) if reconciliar_exclusoes else None
+        if entidade.detalhar:
+            obter_limitador()  # cria o limitador antes das threads de detalhe
+        progresso.fase("listagem", pagina=1, gravados=0)
+        for thread in threads:
+            thread.start()
+
+        # Etapa 3: gravação (thread atual, dona da conexão)
+        lote: List[tuple] = []
+        while True:
+            item = pipeline.obter(pipeline.para_gravar)
+            if item is _FIM:
+                break
+            if isinstance(item, _FimPagina):
+                _gravar_lote(conn, cursor, entidade, lote, metricas)
+                lote = []
+                metricas["paginas"] += 1
+                logger.info(
+                    "Página %s de %s processada. Total gravado: %s",
+                    item.pagina, entidade.nome, metricas["gravados"],
+                )
+                progresso.atualizar(pagina=item.pagina + 1, gravados=metricas["gravados"])
+                continue
+
+            linha, alteracao, detalhado = item
+            metricas["listados"] += 1
+            progresso.incrementar("linhas")
+            if not detalhado and entidade.detalhar:
+                metricas["sem_detalhe"] += 1
+                progresso.incrementar("erros")
+            reativado = linha[0] in inativos and linha[indice_situacao] != "I"
+            if alteracoes is not None and linha[0] in alteracoes and not reativado \
+                    and not entidade.mudou(alteracao, alteracoes[linha[0]]):
+                metricas["pulados"] += 1
+                continue
+            lote.append(linha)
+            if len(lote) >= tamanho_lote:
+                _gravar_lote(conn, cursor, entidade, lote, metricas)
+                lote = []
+
+        for thread in threads:
+            thread.join()
+        if pipeline.erro is not None:
+            raise pipeline.erro
+        metricas.update(pipeline.contadores)
+        _gravar_lote(conn, cursor, entidade, lote, metricas)
+        if pipeline.falha_listagem is not None:
+            # Listagem incompleta: ausentes não significam excluídos
+            logger.warning(
+                "Sincronização de %s parcial: %s registros gravados; reconciliação não executada",
+                entidade.nome, metricas["gravados"],
+            )
+            raise pipeline.falha_listagem
+
+        if reconciliar_exclusoes:
+            progresso.fase("reconciliacao")
+            metricas["inativados"] = reconciliar(
+                conn, entidade.tabela, pipeline.vistos, anterior_a=inicio_listagem
+            )
+
+        duracao = time.monotonic() - inicio
+        logger.info(
+            "Sincronização de %s concluída em %.1fs (%.1f itens/s). Listados=%s | Gravados=%s | "
+            "Repetidos=%s | Pulados=%s | Sem detalhe=%s | Erros=%s | Inativados=%s",
+            entidade.nome, duracao, metricas["listados"] / duracao if duracao else 0.0,
+            metricas["listados"], metricas["gravados"], metricas["repetidos"], metricas["pulados"],
+            metricas["sem_detalhe"], metricas["erros"], metricas["inativados"],
+        )
+        progresso.concluir(**metricas)
+        return metricas
+
+    except Exception as e:
+        logger.error("Erro durante sincronização de %s: %s", entidade.nome, e)
+        pipeline.parar.set()
+        progresso.falhar(e)
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
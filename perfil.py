@@ -0,0 +1,232 @@
+"""Modo de perfil das sincronizações (``--perfil``/``--profile``).
+
+Quando ativo, ``perfilar`` liga:
+- ``cProfile`` em todas as threads (pipeline e detalhes de ``motor_sync``):
+  até o Python 3.11, um perfil por thread, instalado via
+  ``threading.setprofile`` e somado no fim; a partir do 3.12 o cProfile usa
+  ``sys.monitoring``, que aceita um único perfil por interpretador e já
+  registra as chamadas de todas as threads, então só o perfil principal é
+  ligado;
+- tempo de parede e pico de memória por fase: as fases são as mesmas publicadas
+  em ``progresso.Progresso.fase``;
+- ``tracemalloc``, com as linhas que mais alocaram, medidas no fim da fase
+  com mais memória em uso.
+
+Se outra ferramenta de perfil já estiver ativa, a coleta de CPU é omitida e
+o relatório traz só fases e memória.
+
+O relatório (``perfil-<job>-<data>.txt``) e as estatísticas brutas (``.prof``,
+para ``pstats``/snakeviz) são gravados ao lado do LOG_FILE. O tempo próprio
+das funções é agrupado em categorias (HTTP, JSON, MySQL, mapeamento, espera)
+para mostrar para onde foi o tempo.
+
+Desligado, nada é instalado: o único custo é ``marcar_fase`` conferir se há um
+perfil ativo a cada mudança de fase. Com ``main.py --workers N`` só o processo
+coordenador é medido; os processos filhos desligam o perfil herdado no fork.
+"""
+from __future__ import annotations
+
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from logger import LOG_FILE, logger
+
+PERFIL_TOP_FUNCOES = 30
+PERFIL_TOP_ALOCACOES = 15
+PERFIL_FRAMES = 5
+
+# Categorias do tempo próprio: (nome, trechos do arquivo ou da função), na ordem de teste
+_CATEGORIAS: Tuple[Tuple[str, Tuple[str, ...]], ...] = (
+    ("espera (sleep/locks/filas)", ("time.sleep", "acquire", "_thread.lock", "wait")),
+    ("MySQL", ("mysql",)),
+    ("HTTP", ("requests", "urllib3", "http/client", "ssl", "socket", "select")),
+    ("JSON", ("json", "orjson")),
+    ("mapeamento", ("mapeamento.py", "sincronizar_clientes.py", "sincronizar_pedidos.py", "snapshot.py")),
+)
+
+# Importações e o próprio tracemalloc não interessam no ranking de alocações
+_FILTROS_ALOCACAO = (
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, tracemalloc.__file__),
+)
+
+# cProfile sobre sys.monitoring (3.12+): um perfil por interpretador, todas as threads
+_PERFIL_UNICO = sys.version_info >= (3, 12)
+
+_ativo: Optional["Perfil"] = None
+_fork_registrado = False
+
+
+def _categoria(arquivo: str, funcao: str) -> str:
+    texto = f"{arquivo} {funcao}"
+    for nome, trechos in _CATEGORIAS:
+        if any(t in texto for t in trechos):
+            return nome
+    return "outros"
+
+
+def _mib(valor: int) -> str:
+    return f"{valor / (1024 * 1024):.1f} MiB"
+
+
+def _desligar_no_filho() -> None:
+    """Após fork: o processo filho não herda o perfil do pai."""
+    global _ativo
+    if _ativo is not None:
+        for perfil in _ativo._perfis:
+            perfil.disable()
+        _ativo = None
+        threading.setprofile(None)
+        sys.setprofile(None)
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+class Perfil:
+    """Coleta de CPU (cProfile), fases e memória (tracemalloc) de uma execução."""
+
+    def __init__(self, nome: str, diretorio: Optional[str] = None):
+        self.nome = nome
+        self.diretorio = diretorio or os.path.dirname(os.path.abspath(LOG_FILE))
+        self.fases: List[Tuple[str, float, int]] = []  # (fase, segundos, pico em bytes)
+        self._perfis: List[cProfile.Profile] = []  # só os que foram ligados
+        self._principal: Optional[cProfile.Profile] = None
+        self._trava = threading.Lock()
+        self._fase: Optional[str] = "inicio"
+        self._inicio_fase = 0.0
+        self._inicio = 0.0
+        self._maior_em_uso = -1
+        self._alocacoes: list = []
+
+    @staticmethod
+    def _ligar(perfil: cProfile.Profile) -> bool:
+        try:
+            perfil.enable()
+            return True
+        except ValueError as e:  # outra ferramenta de perfil ativa
+            logger.warning("cProfile não ligado: %s", e)
+            return False
+
+    def _perfil_thread(self, *_args) -> None:
+        """Gancho de ``threading.setprofile``: liga um cProfile próprio na nova thread."""
+        sys.setprofile(None)
+        perfil = cProfile.Profile()
+        if self._ligar(perfil):
+            with self._trava:
+                self._perfis.append(perfil)
+
+    def iniciar(self) -> None:
+        global _fork_registrado
+        if not _fork_registrado:
+            os.register_at_fork(after_in_child=_desligar_no_filho)
+            _fork_registrado = True
+        tracemalloc.start(PERFIL_FRAMES)
+        self._inicio = self._inicio_fase = time.perf_counter()
+        principal = cProfile.Profile()
+        if self._ligar(principal):
+            self._principal = principal
+            self._perfis.append(principal)
+            if not _PERFIL_UNICO:
+                threading.setprofile(self._perfil_thread)
+
+    def marcar_fase(self, nome: Optional[str]) -> None:
+        """Fecha a fase atual (tempo e pico de memória) e abre ``nome``."""
+        agora = time.perf_counter()
+        if self._fase is not None:
+            em_uso, pico = tracemalloc.get_traced_memory()
+            self.fases.append((self._fase, agora - self._inicio_fase, pico))
+            if em_uso > self._maior_em_uso:
+                self._maior_em_uso = em_uso
+                snapshot = tracemalloc.take_snapshot().filter_traces(_FILTROS_ALOCACAO)
+                self._alocacoes = snapshot.statistics("lineno")[:PERFIL_TOP_ALOCACOES]
+        tracemalloc.reset_peak()
+        self._fase = nome
+        self._inicio_fase = time.perf_counter()  # o snapshot não conta para a próxima fase
+
+    def finalizar(self) -> str:
+        """Desliga a coleta e grava o relatório; devolve o caminho do .txt."""
+        threading.setprofile(None)
+        if self._principal is not None:
+            self._principal.disable()
+        self.marcar_fase(None)
+        duracao = time.perf_counter() - self._inicio
+        tracemalloc.stop()
+
+        with self._trava:
+            perfis = list(self._perfis)
+        saida = io.StringIO()
+        estatisticas = pstats.Stats(*perfis, stream=saida) if perfis else None
+
+        os.makedirs(self.diretorio, exist_ok=True)
+        base = os.path.join(self.diretorio, f"perfil-{self.nome}-{datetime.now():%Y%m%d-%H%M%S}")
+        if estatisticas is not None:
+            estatisticas.dump_stats(base + ".prof")
+        with open(base + ".txt", "w", encoding="utf-8") as f:
+            f.write(self._relatorio(duracao, estatisticas, saida))
+        return base + ".txt"
+
+    def _relatorio(self, duracao: float, estatisticas: Optional[pstats.Stats], saida: io.StringIO) -> str:
+        linhas = [
+            f"Perfil de {self.nome} em {datetime.now().isoformat(timespec='seconds')}",
+            f"Duração total: {duracao:.2f} s",
+            f"Pico de memória (tracemalloc): {_mib(max((p for _, _, p in self.fases), default=0))}",
+            "",
+            "Fases (tempo de parede | pico de memória na fase)",
+        ]
+        for fase, segundos, pico in self.fases:
+            linhas.append(f"  {fase:<40} {segundos:>9.2f} s  {_mib(pico):>12}")
+
+        if estatisticas is None:
+            linhas += ["", "Sem estatísticas de CPU: outra ferramenta de perfil já estava ativa"]
+        else:
+            categorias: Dict[str, float] = {}
+            for (arquivo, _linha, funcao), (_cc, _nc, proprio, _acum, _chamadores) in estatisticas.stats.items():
+                nome = _categoria(arquivo, funcao)
+                categorias[nome] = categorias.get(nome, 0.0) + proprio
+            total = sum(categorias.values()) or 1.0
+            linhas += ["", "Tempo próprio por categoria (somado entre threads)"]
+            for nome, segundos in sorted(categorias.items(), key=lambda item: -item[1]):
+                linhas.append(f"  {nome:<40} {segundos:>9.2f} s  {100 * segundos / total:>5.1f}%")
+
+        linhas += ["", f"Maiores alocações no fim da fase com mais memória em uso "
+                       f"({_mib(max(self._maior_em_uso, 0))}, top {PERFIL_TOP_ALOCACOES})"]
+        linhas += [f"  {estatistica}" for estatistica in self._alocacoes]
+
+        if estatisticas is not None:
+            estatisticas.sort_stats("cumulative").print_stats(PERFIL_TOP_FUNCOES)
+            linhas += ["", f"Funções por tempo acumulado (top {PERFIL_TOP_FUNCOES})", saida.getvalue()]
+        return "\n".join(linhas)
+
+
+def marcar_fase(nome: str) -> None:
+    """Registra a mudança de fase no perfil ativo (sem efeito se desligado)."""
+    if _ativo is not None:
+        _ativo.marcar_fase(nome)
+
+
+@contextmanager
+def perfilar(nome: str, ativo: bool = True) -> Iterator[Optional[Perfil]]:
+    """Executa o bloco sob perfil quando ``ativo``; caso contrário, não faz nada."""
+    global _ativo
+    if not ativo:
+        yield None
+        return
+    perfil = Perfil(nome)
+    _ativo = perfil
+    perfil.iniciar()
+    try:
+        yield perfil
+    finally:
+        _ativo = None
+        caminho = perfil.finalizar()
+        logger.warning("Relatório de perfil gravado em %s", caminho)
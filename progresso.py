@@ -0,0 +1,116 @@
+"""Publicação do progresso das sincronizações para o monitor (token_monitor).
+
+Cada job grava o próprio estado em ``PROGRESSO_DIR/<job>.json`` (gravação
+atômica via arquivo temporário + ``os.replace``), no máximo uma vez por
+PROGRESSO_INTERVALO_SEG, exceto em mudanças de fase e no fim. Um arquivo por job
+evita que processos diferentes (agendador, scripts avulsos, workers de
+``main.py``) sobrescrevam o progresso uns dos outros.
+
+O monitor detecta mudanças pelo ``mtime`` dos arquivos (``assinatura``) e só
+relê o diretório quando algo mudou, enviando o resultado por Server-Sent Events.
+
+Campos usuais: fase, pagina, linhas, linhas_por_seg (ambos da fase atual),
+fila_detalhes, erros.
+"""
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, Tuple
+
+import perfil
+from logger import logger
+
+PROGRESSO_DIR = os.getenv("PROGRESSO_DIR", "progresso")
+PROGRESSO_INTERVALO_SEG = float(os.getenv("PROGRESSO_INTERVALO_SEG", "1"))
+
+
+class Progresso:
+    """Estado de progresso de um job, publicado com limite de frequência."""
+
+    def __init__(self, job: str, diretorio: str = PROGRESSO_DIR,
+                 intervalo: float = PROGRESSO_INTERVALO_SEG):
+        self.job = job
+        self.caminho = os.path.join(diretorio, f"{job}.json")
+        self.intervalo = intervalo
+        self._inicio = self._inicio_fase = time.monotonic()
+        self._ultima_gravacao = 0.0
+        self.estado: dict = {
+            "job": job,
+            "pid": os.getpid(),
+            "estado": "executando",
+            "inicio": datetime.now().isoformat(timespec="seconds"),
+            "fase": None,
+            "linhas": 0,
+            "erros": 0,
+        }
+        self._gravar()
+
+    def fase(self, nome: str, **campos) -> None:
+        """Inicia uma nova fase; sempre publicada imediatamente.
+
+        ``linhas_por_seg`` passa a contar a partir daqui, com as ``linhas`` da fase.
+        """
+        perfil.marcar_fase(f"{self.job}/{nome}")
+        self._inicio_fase = time.monotonic()
+        self.atualizar(forcar=True, fase=nome, **campos)
+
+    def atualizar(self, forcar: bool = False, **campos) -> None:
+        self.estado.update(campos)
+        agora = time.monotonic()
+        if forcar or agora - self._ultima_gravacao >= self.intervalo:
+            self._gravar(agora)
+
+    def incrementar(self, campo: str, quantidade: int = 1) -> None:
+        self.atualizar(**{campo: self.estado.get(campo, 0) + quantidade})
+
+    def concluir(self, **campos) -> None:
+        self.atualizar(forcar=True, estado="concluido", **campos)
+
+    def falhar(self, erro: Exception) -> None:
+        self.atualizar(forcar=True, estado="erro", erro=str(erro))
+
+    def _gravar(self, agora: float = None) -> None:
+        agora = time.monotonic() if agora is None else agora
+        self.estado["decorrido_seg"] = round(agora - self._inicio, 1)
+        na_fase = agora - self._inicio_fase
+        self.estado["linhas_por_seg"] = round(self.estado.get("linhas", 0) / na_fase, 1) if na_fase > 0 else 0.0
+        self.estado["atualizado_em"] = datetime.now().isoformat(timespec="seconds")
+        self._ultima_gravacao = agora
+        diretorio = os.path.dirname(self.caminho)
+        try:
+            os.makedirs(diretorio, exist_ok=True)
+            fd, temporario = tempfile.mkstemp(dir=diretorio, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self.estado, f, ensure_ascii=False)
+            os.replace(temporario, self.caminho)
+        except OSError as e:
+            # Progresso é informativo; nunca interrompe a sincronização
+            logger.debug("Falha ao publicar progresso de %s: %s", self.job, e)
+
+
+def assinatura(diretorio: str = PROGRESSO_DIR) -> Tuple[Tuple[str, int], ...]:
+    """Nome e mtime de cada arquivo de progresso; muda quando algum job publica."""
+    try:
+        with os.scandir(diretorio) as entradas:
+            return tuple(sorted(
+                (e.name, e.stat().st_mtime_ns) for e in entradas if e.name.endswith(".json")
+            ))
+    except FileNotFoundError:
+        return ()
+
+
+def ler_todos(diretorio: str = PROGRESSO_DIR) -> Dict[str, dict]:
+    """Lê o progresso publicado por todos os jobs: {job: estado}."""
+    progresso = {}
+    for nome, _ in assinatura(diretorio):
+        try:
+            with open(os.path.join(diretorio, nome), "r", encoding="utf-8") as f:
+                estado = json.load(f)
+            progresso[estado.get("job", nome[:-5])] = estado
+        except (OSError, ValueError):
+            continue
+    return progresso
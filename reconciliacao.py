@@ -0,0 +1,202 @@
+"""Reconciliação de exclusões: marca como inativos registros que sumiram do Bling.
+
+Durante uma listagem completa os IDs vistos são acumulados em um ``array('q')``
+(8 bytes por ID). Ao final, o array ordenado é comparado em merge com os IDs
+da tabela lidos em ordem, sem montar conjuntos de dicts em memória, e os
+ausentes são inativados em um único UPDATE.
+
+Só entram na comparação os registros cadastrados no banco antes do início da
+listagem (``data_cadastro < anterior_a``, com o instante lido por
+``instante_banco``): a listagem é ancorada nesse instante e não traz o que foi
+criado depois, como os registros que os webhooks inserem durante a execução.
+
+Só roda depois de uma listagem completa: uma página que falha levanta
+``bling_api.FalhaListagem`` e os chamadores (``motor_sync.sincronizar``,
+``main.main``) não chamam ``reconciliar``. Como proteção adicional, a
+reconciliação é abortada se a fração de ausentes passar de
+RECONCILIAR_MAX_FRACAO (padrão 0.2).
+"""
+from __future__ import annotations
+
+import os
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+from typing import Iterable, Iterator, Optional
+
+from logger import logger
+
+MAX_FRACAO_AUSENTES = float(os.getenv("RECONCILIAR_MAX_FRACAO", "0.2"))
+
+# Coluna de ID de cada tabela reconciliável
+TABELAS = {
+    "produtos_bling": "id_bling",
+    "clientes_bling": "id",
+}
+
+
+class IdsVistos:
+    """Acumulador compacto de IDs vistos durante uma listagem.
+
+    Também serve à deduplicação entre páginas de ``motor_sync.listar``: a
+    consulta (``in``) é uma busca binária, ordenando antes os IDs no lugar se
+    algum chegou fora de ordem.
+    """
+
+    __slots__ = ("_ids", "_ordenado")
+
+    def __init__(self):
+        self._ids = array("q")
+        self._ordenado = True
+
+    def adicionar(self, id_registro) -> None:
+        id_registro = int(id_registro)
+        if self._ordenado and self._ids and id_registro < self._ids[-1]:
+            self._ordenado = False
+        self._ids.append(id_registro)
+
+    def estender(self, ids: Iterable) -> None:
+        for id_registro in ids:
+            self.adicionar(id_registro)
+
+    def __contains__(self, id_registro) -> bool:
+        if not self._ordenado:
+            # Listagens crescentes por cadastro chegam quase em ordem: o timsort é linear
+            self._ids = array("q", sorted(self._ids))
+            self._ordenado = True
+        id_registro = int(id_registro)
+        indice = bisect_left(self._ids, id_registro)
+        return indice < len(self._ids) and self._ids[indice] == id_registro
+
+    def ordenados(self) -> array:
+        """Retorna os IDs em ordem crescente e sem repetição."""
+        if not self._ordenado:
+            self._ids = array("q", sorted(self._ids))
+            self._ordenado = True
+        unicos = array("q")
+        anterior = None
+        for id_registro in self._ids:
+            if id_registro != anterior:
+                unicos.append(id_registro)
+                anterior = id_registro
+        self._ids = unicos
+        return unicos
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+def instante_banco(conn) -> datetime:
+    """Hora atual do MySQL; lida antes da listagem, é o ``anterior_a`` de ``reconciliar``."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT NOW()")
+        return cursor.fetchone()[0]
+    finally:
+        cursor.close()
+
+
+def _ids_tabela(cursor, tabela: str, coluna: str, anterior_a: Optional[datetime] = None,
+                tamanho_lote: int = 10000) -> Iterator[int]:
+    """Lê os IDs ativos da tabela em ordem crescente, em blocos."""
+    filtro, params = "", ()
+    if anterior_a is not None:
+        filtro, params = " AND data_cadastro < %s", (anterior_a,)
+    cursor.execute(
+        f"SELECT {coluna} FROM {tabela} WHERE (situacao IS NULL OR situacao <> 'I'){filtro} "
+        f"ORDER BY {coluna}",
+        params,
+    )
+    while True:
+        linhas = cursor.fetchmany(tamanho_lote)
+        if not linhas:
+            break
+        for (id_registro,) in linhas:
+            yield int(id_registro)
+
+
+def ids_ausentes(vistos: array, ids_tabela: Iterable[int]) -> array:
+    """Diferença (tabela - vistos) por merge de duas sequências ordenadas."""
+    ausentes = array("q")
+    i, n = 0, len(vistos)
+    for id_registro in ids_tabela:
+        while i < n and vistos[i] < id_registro:
+            i += 1
+        if i >= n or vistos[i] != id_registro:
+            ausentes.append(id_registro)
+    return ausentes
+
+
+def calcular_ausentes(conn, tabela: str, vistos: IdsVistos,
+                      max_fracao: float = MAX_FRACAO_AUSENTES,
+                      anterior_a: Optional[datetime] = None) -> array:
+    """IDs ativos da tabela ausentes na listagem, com as mesmas regras de ``reconciliar``.
+
+    Serve também ao ``--dry-run`` de ``main.py``, que relata sem gravar.
+
+    Returns:
+        array: IDs que seriam inativados; vazio se nenhum ID foi visto ou se a
+        fração de ausentes passou de ``max_fracao`` (ambos registrados no log).
+    """
+    coluna = TABELAS[tabela]
+    if not len(vistos):
+        logger.warning("Reconciliação de %s ignorada: nenhum ID visto na listagem", tabela)
+        return array("q")
+
+    cursor = conn.cursor()
+    try:
+        ativos = 0
+
+        def _contar(ids):
+            nonlocal ativos
+            for id_registro in ids:
+                ativos += 1
+                yield id_registro
+
+        ausentes = ids_ausentes(vistos.ordenados(), _contar(_ids_tabela(cursor, tabela, coluna, anterior_a)))
+    finally:
+        cursor.close()
+    if not ausentes:
+        logger.info("Reconciliação de %s: nenhum registro ausente", tabela)
+    elif ativos and len(ausentes) / ativos > max_fracao:
+        logger.error(
+            "Reconciliação de %s abortada: %s de %s ativos ausentes (limite %.0f%%). "
+            "A listagem pode ter sido interrompida.",
+            tabela, len(ausentes), ativos, max_fracao * 100,
+        )
+        return array("q")
+    return ausentes
+
+
+def reconciliar(conn, tabela: str, vistos: IdsVistos,
+                max_fracao: float = MAX_FRACAO_AUSENTES,
+                anterior_a: Optional[datetime] = None) -> int:
+    """Inativa (situacao = 'I') os registros ativos da tabela ausentes na listagem.
+
+    ``vistos`` deve vir de uma listagem completa (sem FalhaListagem). Com
+    ``anterior_a`` (``instante_banco`` lido antes da listagem), só registros
+    cadastrados antes dele podem ser inativados. O commit é feito aqui, após
+    o UPDATE.
+
+    Returns:
+        int: quantidade de registros inativados (0 se abortado).
+    """
+    ausentes = calcular_ausentes(conn, tabela, vistos, max_fracao, anterior_a)
+    if not ausentes:
+        return 0
+
+    cursor = conn.cursor()
+    try:
+        marcadores = ", ".join(["%s"] * len(ausentes))
+        # data_alteracao mantida: o ON UPDATE CURRENT_TIMESTAMP faria a detecção de
+        # alteração ignorar o registro quando ele reaparecer no Bling
+        cursor.execute(
+            f"UPDATE {tabela} SET situacao = 'I', data_alteracao = data_alteracao "
+            f"WHERE {TABELAS[tabela]} IN ({marcadores})",
+            list(ausentes),
+        )
+        conn.commit()
+        logger.warning("Reconciliação de %s: %s registros marcados como inativos", tabela, len(ausentes))
+        return len(ausentes)
+    finally:
+        cursor.close()
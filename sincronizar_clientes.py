@@ -1,53 +1,15 @@
 """Sincroniza clientes do Bling com o banco de dados MySQL."""
-from typing import List, Dict
-from mysql.connector import MySQLConnection
-import mysql.connector
-from db import conectar_mysql
-from bling_clientes import buscar_clientes, buscar_detalhes_cliente
-from logger import logger
+from collections import Counter
+from typing import Dict
+import argparse
+import motor_sync
+from motor_sync import Entidade
+from perfil import perfilar
+from trava_execucao import TRAVA_ESPERA_SEG, trava_de_script
 from datetime import datetime, timezone
+from functools import lru_cache
 import re
 
-def _criar_tabela_clientes(conn: MySQLConnection) -> None:
-    """Cria ou garante a existência da tabela clientes_bling."""
-    cursor = conn.cursor()
-    try:
-        cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS clientes_bling (
-                id BIGINT(20) NOT NULL AUTO_INCREMENT,
-                codigo BIGINT(20) DEFAULT NULL,
-                nome VARCHAR(255) NOT NULL,
-                fantasia VARCHAR(255),
-                tipo CHAR(1) NOT NULL COMMENT 'F=Física, J=Jurídica',
-                documento VARCHAR(20) COMMENT 'CPF ou CNPJ',
-                ie VARCHAR(20) COMMENT 'Inscrição Estadual',
-                rg VARCHAR(20),
-                telefone VARCHAR(20),
-                celular VARCHAR(20),
-                email VARCHAR(255),
-                endereco VARCHAR(255),
-                numero VARCHAR(10),
-                complemento VARCHAR(100),
-                bairro VARCHAR(100),
-                cep VARCHAR(10),
-                municipio VARCHAR(100),
-                uf CHAR(2),
-                situacao CHAR(1) DEFAULT 'A' COMMENT 'A=Ativo, I=Inativo',
-                data_cadastro TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                data_alteracao TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-                PRIMARY KEY (`id`)
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
-            """
-        )
-        conn.commit()
-        logger.info("Tabela clientes_bling criada/verificada")
-    except Exception as e:
-        logger.error("Erro ao criar tabela clientes_bling: %s", e)
-        raise
-    finally:
-        cursor.close()
-
 def _limpar_campo(valor: str) -> str:
     """Remove pontuação e caracteres especiais, mantendo apenas números."""
     if not valor:
@@ -63,17 +25,32 @@ def _to_upper(valor):
     except Exception:
         return valor
 
-def _parse_datetime(value: str):
-    """Tenta converter uma string de data/hora de API para datetime (naive, UTC)."""
-    if not value:
-        return None
-    s = str(value).strip()
+_RE_OFFSET_SEM_DOIS_PONTOS = re.compile(r"([+-]\d{2})(\d{2})$")
+
+_FORMATOS_FALLBACK = (
+    "%Y-%m-%d %H:%M:%S%z",
+    "%Y-%m-%dT%H:%M:%S%z",
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%dT%H:%M:%S",
+    "%Y-%m-%d",
+)
+
+_CHAVES_DATA_ALTERACAO = (
+    'atualizadoEm', 'dataAlteracao', 'data_alteracao',
+    'updatedAt', 'updated_at', 'dataAtualizacao', 'alteradoEm'
+)
+
+# Última chave em que a data de alteração foi encontrada: (usa_metadata, chave)
+_chave_data_aprendida = None
+
+def _parse_datetime_lento(s: str):
+    """Caminho geral: normaliza Z/offsets e tenta ISO e formatos comuns."""
     try:
         # Normaliza Z -> +00:00
         if s.endswith('Z'):
             s = s[:-1] + '+00:00'
         # Normaliza offsets como -0300 para -03:00
-        m = re.search(r"([+-]\d{2})(\d{2})$", s)
+        m = _RE_OFFSET_SEM_DOIS_PONTOS.search(s)
         if m and ':' not in s[-6:]:
             s = s[:-5] + f"{m.group(1)}:{m.group(2)}"
         dt = datetime.fromisoformat(s)
@@ -82,13 +59,7 @@ def _parse_datetime(value: str):
         return dt
     except Exception:
         # Tenta alguns formatos comuns
-        for fmt in (
-            "%Y-%m-%d %H:%M:%S%z",
-            "%Y-%m-%dT%H:%M:%S%z",
-            "%Y-%m-%d %H:%M:%S",
-            "%Y-%m-%dT%H:%M:%S",
-            "%Y-%m-%d",
-        ):
+        for fmt in _FORMATOS_FALLBACK:
             try:
                 dt = datetime.strptime(s, fmt)
                 if "%z" in fmt and dt.tzinfo is not None:
@@ -98,185 +69,142 @@ def _parse_datetime(value: str):
                 continue
     return None
 
+@lru_cache(maxsize=4096)
+def _parse_datetime_str(s: str):
+    """Converte a string já normalizada, com cache para timestamps repetidos."""
+    # Caminho rápido: formato retornado pelo Bling ("YYYY-MM-DD HH:MM:SS")
+    if len(s) == 19 and s[4] == '-' and s[7] == '-' and s[10] in ' T' and s[13] == ':' and s[16] == ':':
+        try:
+            return datetime(
+                int(s[0:4]), int(s[5:7]), int(s[8:10]),
+                int(s[11:13]), int(s[14:16]), int(s[17:19]),
+            )
+        except ValueError:
+            pass
+    return _parse_datetime_lento(s)
+
+def _parse_datetime(value: str):
+    """Tenta converter uma string de data/hora de API para datetime (naive, UTC)."""
+    if not value:
+        return None
+    return _parse_datetime_str(str(value).strip())
+
 def _api_data_alteracao(cliente: Dict):
-    """Extrai a data de alteração do cliente vindo da API, se disponível."""
-    for key in (
-        'atualizadoEm', 'dataAlteracao', 'data_alteracao',
-        'updatedAt', 'updated_at', 'dataAtualizacao', 'alteradoEm'
-    ):
-        if key in cliente and cliente.get(key):
-            return _parse_datetime(cliente.get(key))
+    """Extrai a data de alteração do cliente vindo da API, se disponível.
+
+    A chave encontrada é memorizada e testada primeiro nos próximos contatos,
+    já que todos os payloads de uma mesma API usam o mesmo formato.
+    """
+    global _chave_data_aprendida
+    if _chave_data_aprendida is not None:
+        usa_meta, chave = _chave_data_aprendida
+        origem = (cliente.get('metadata') or cliente.get('meta') or {}) if usa_meta else cliente
+        valor = origem.get(chave)
+        if valor:
+            return _parse_datetime(valor)
+
+    for key in _CHAVES_DATA_ALTERACAO:
+        valor = cliente.get(key)
+        if valor:
+            _chave_data_aprendida = (False, key)
+            return _parse_datetime(valor)
     # Alguns retornos podem ter metadata: { atualizadoEm: ... }
     meta = cliente.get('metadata') or cliente.get('meta') or {}
-    for key in (
-        'atualizadoEm', 'dataAlteracao', 'data_alteracao',
-        'updatedAt', 'updated_at', 'dataAtualizacao', 'alteradoEm'
-    ):
-        if key in meta and meta.get(key):
-            return _parse_datetime(meta.get(key))
+    for key in _CHAVES_DATA_ALTERACAO:
+        valor = meta.get(key)
+        if valor:
+            _chave_data_aprendida = (True, key)
+            return _parse_datetime(valor)
     return None
 
-def _deve_atualizar(cursor, id_cliente: int, api_dt):
-    """Decide se deve inserir/atualizar com base na comparação de datas."""
-    try:
-        cursor.execute("SELECT data_alteracao FROM clientes_bling WHERE id = %s", (id_cliente,))
-        row = cursor.fetchone()
-        if row is None:
-            return True
-        db_dt = row[0]
-        if api_dt is None:
-            return False
-        return api_dt > db_dt
-    except Exception as e:
-        logger.warning("Falha ao comparar data_alteracao para id=%s: %s. Prosseguindo.", id_cliente, e)
-        return True
+CAMPOS_CLIENTE = (
+    'id', 'codigo', 'nome', 'fantasia', 'tipo', 'documento', 'ie', 'rg',
+    'telefone', 'celular', 'email', 'endereco', 'numero', 'complemento',
+    'bairro', 'cep', 'municipio', 'uf', 'situacao',
+)
 
-def _inserir_ou_atualizar_cliente(cursor, cliente: Dict) -> bool:
-    """Insere ou atualiza um cliente no banco de dados.
+def _params_cliente(cliente: Dict) -> tuple:
+    """Mapeia o contato da API para os 19 valores de CAMPOS_CLIENTE.
 
     Implementa o mapeamento conforme estrutura padrão do retorno do endpoint /contatos (exemplo.json):
     - Campos raiz: fantasia, tipo, ie, rg, email
     - Endereço: endereco.geral (fallback para endereco.cobranca)
       com: endereco, numero, complemento, bairro, cep, municipio, uf
     """
-    try:
-        # Extrai o endereço geral do cliente, com fallback para cobranca
-        _endereco = (cliente.get('endereco') or {})
-        endereco = (_endereco.get('geral') or {})
-        if not endereco:
-            endereco = (_endereco.get('cobranca') or {})
-        
-        # Limpa os campos numéricos
-        documento = _limpar_campo(cliente.get('numeroDocumento'))
-        ie = _limpar_campo(cliente.get('ie'))
-        telefone = _limpar_campo(cliente.get('telefone'))
-        celular = _limpar_campo(cliente.get('celular'))
-        
-        sql = """
-            INSERT INTO clientes_bling (
-                id, codigo, nome, fantasia, tipo, documento, ie, rg,
-                telefone, celular, email, endereco, numero, complemento,
-                bairro, cep, municipio, uf, situacao
-            ) VALUES (
-                %s, %s, %s, %s, %s, %s, %s, %s,
-                %s, %s, %s, %s, %s, %s,
-                %s, %s, %s, %s, %s
-            ) ON DUPLICATE KEY UPDATE
-                codigo = VALUES(codigo),
-                nome = VALUES(nome),
-                fantasia = VALUES(fantasia),
-                tipo = VALUES(tipo),
-                documento = VALUES(documento),
-                ie = VALUES(ie),
-                rg = VALUES(rg),
-                telefone = VALUES(telefone),
-                celular = VALUES(celular),
-                email = VALUES(email),
-                endereco = VALUES(endereco),
-                numero = VALUES(numero),
-                complemento = VALUES(complemento),
-                bairro = VALUES(bairro),
-                cep = VALUES(cep),
-                municipio = VALUES(municipio),
-                uf = VALUES(uf),
-                situacao = VALUES(situacao);
-        """
-        
-        # Parâmetros corretos (19 valores) com conversão de campos de texto para UPPERCASE
-        params = (
-            cliente.get('id'),
-            cliente.get('codigo'),
-            _to_upper(cliente.get('nome')),
-            _to_upper(cliente.get('fantasia')),
-            _to_upper(cliente.get('tipo')),
-            documento,
-            ie,
-            _to_upper(cliente.get('rg')),
-            _limpar_campo(cliente.get('telefone')),
-            _limpar_campo(cliente.get('celular')),
-            _to_upper(cliente.get('email')),
-            _to_upper(endereco.get('endereco')),
-            _to_upper(endereco.get('numero')),
-            _to_upper(endereco.get('complemento')),
-            _to_upper(endereco.get('bairro')),
-            (_endereco.get('geral') or {}).get('cep') or (_endereco.get('cobranca') or {}).get('cep'),
-            _to_upper(endereco.get('municipio')),
-            _to_upper(endereco.get('uf')),
-            _to_upper(cliente.get('situacao', 'A'))
-        )
-        
-        cursor.execute(sql, params)
-        logger.debug(f"SQL executado com sucesso para cliente {cliente.get('id')}")
-        return True
-        
-    except mysql.connector.Error as e:
-        logger.error(f"Erro MySQL ao inserir/atualizar cliente {cliente.get('id')}: {e}")
-        logger.error(f"Dados do cliente que causaram erro: {cliente}")
-        return False
-        
-    except Exception as e:
-        logger.error(f"Erro inesperado ao inserir/atualizar cliente {cliente.get('id')}: {e}")
-        logger.error(f"Dados do cliente que causaram erro: {cliente}")
-        return False
-
-
-def sincronizar_clientes() -> None:
-    """Sincroniza todos os clientes do Bling com o banco de dados."""
-    logger.info("Iniciando sincronização de clientes do Bling")
-    conn = conectar_mysql()
-    try:
-        _criar_tabela_clientes(conn)
-        cursor = conn.cursor()
-        pagina = 1
-        total_sincronizado = 0
-        logger.info("Buscando clientes do Bling - Página %s", pagina)
-
-        while True:
-            clientes = buscar_clientes(pagina)
-            if not clientes:
-                logger.info("Não há mais clientes para sincronizar")
-                break
-
-            logger.info("Encontrados %s clientes na página %s", len(clientes), pagina)
-
-            for cliente in clientes:
-                cliente_id = cliente.get('id')
-                logger.debug("Processando cliente ID: %s", cliente_id)
-
-                detalhes = buscar_detalhes_cliente(cliente_id)
-                if detalhes:
-                    logger.debug("Detalhes obtidos para cliente %s", cliente_id)
-                    cliente = detalhes
-                else:
-                    logger.warning("Não foi possível obter detalhes do cliente %s; prosseguindo com dados da listagem", cliente_id)
-
-                api_dt = _api_data_alteracao(cliente)
-                if not _deve_atualizar(cursor, cliente_id, api_dt):
-                    logger.debug("Pulado update do cliente %s: banco mais recente/igual à API", cliente_id)
-                    continue
-
-                if _inserir_ou_atualizar_cliente(cursor, cliente):
-                    total_sincronizado += 1
-                    logger.debug("Cliente ID %s sincronizado", cliente_id)
-
-                    if total_sincronizado % 100 == 0:
-                        logger.info("Sincronizados %s clientes", total_sincronizado)
-                        conn.commit()
-                        logger.debug("Commit realizado")
-
-            conn.commit()
-            logger.info("Página %s processada. Total sincronizado: %s", pagina, total_sincronizado)
-
-            pagina += 1
-
-        logger.info("Sincronização concluída. Total de clientes sincronizados: %s", total_sincronizado)
-
-    except Exception as e:
-        logger.error("Erro durante sincronização: %s", e)
-        conn.rollback()
-        raise
-    finally:
-        conn.close()
+    # Extrai o endereço geral do cliente, com fallback para cobranca
+    _endereco = (cliente.get('endereco') or {})
+    endereco = (_endereco.get('geral') or {})
+    if not endereco:
+        endereco = (_endereco.get('cobranca') or {})
+
+    # Parâmetros (19 valores) com limpeza dos campos numéricos e texto em UPPERCASE
+    return (
+        cliente.get('id'),
+        cliente.get('codigo'),
+        _to_upper(cliente.get('nome')),
+        _to_upper(cliente.get('fantasia')),
+        _to_upper(cliente.get('tipo')),
+        _limpar_campo(cliente.get('numeroDocumento')),
+        _limpar_campo(cliente.get('ie')),
+        _to_upper(cliente.get('rg')),
+        _limpar_campo(cliente.get('telefone')),
+        _limpar_campo(cliente.get('celular')),
+        _to_upper(cliente.get('email')),
+        _to_upper(endereco.get('endereco')),
+        _to_upper(endereco.get('numero')),
+        _to_upper(endereco.get('complemento')),
+        _to_upper(endereco.get('bairro')),
+        (_endereco.get('geral') or {}).get('cep') or (_endereco.get('cobranca') or {}).get('cep'),
+        _to_upper(endereco.get('municipio')),
+        _to_upper(endereco.get('uf')),
+        _to_upper(cliente.get('situacao', 'A'))
+    )
+
+CLIENTES = Entidade(
+    nome="clientes",
+    recurso="contatos",
+    tabela="clientes_bling",
+    chave="id",
+    colunas=CAMPOS_CLIENTE,
+    mapear=_params_cliente,
+    params_listagem={"criterio": "cadastro", "ordem": "ASC"},
+    ancora="dataInclusaoFinal",
+    detalhar=True,
+    coluna_alteracao="data_alteracao",
+    extrair_alteracao=lambda cliente, _linha: _api_data_alteracao(cliente),
+)
+
+
+def sincronizar_clientes(reconciliar_exclusoes: bool = True,
+                         tamanho_fila: int = motor_sync.SYNC_FILA_MAX) -> Counter:
+    """Sincroniza todos os clientes do Bling com o banco de dados.
+
+    A tabela clientes_bling é criada por ``migracoes.py`` no deploy. A execução
+    fica a cargo de ``motor_sync.sincronizar``: detalhes em paralelo, pipeline
+    busca -> mapeamento -> gravação com filas de ``tamanho_fila`` itens e
+    gravação só dos contatos cuja data de alteração na API é mais recente que a
+    do banco. Com reconciliar_exclusoes, ao final inativa os clientes do banco
+    que não apareceram na listagem completa.
+    """
+    return motor_sync.sincronizar(CLIENTES, reconciliar_exclusoes, tamanho_fila=tamanho_fila)
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Sincroniza clientes do Bling com o MySQL.")
+    parser.add_argument(
+        "--sem-reconciliar", action="store_true",
+        help="Não inativa clientes do banco que não aparecem na listagem do Bling",
+    )
+    parser.add_argument(
+        "--perfil", "--profile", action="store_true",
+        help="Grava ao lado do log um relatório de CPU (cProfile), tempo por fase e memória (tracemalloc)",
+    )
+    parser.add_argument(
+        "--esperar-trava", type=float, default=TRAVA_ESPERA_SEG, metavar="SEG",
+        help="Com outra execução em curso, aguarda até SEG segundos em vez de sair (padrão: TRAVA_ESPERA_SEG ou 0)",
+    )
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    sincronizar_clientes()
\ No newline at end of file
+    args = _parse_args()
+    with trava_de_script("clientes", args.esperar_trava), perfilar("clientes", args.perfil):
+        sincronizar_clientes(reconciliar_exclusoes=not args.sem_reconciliar)
@@ -0,0 +1,70 @@
+"""Atualiza apenas o estoque de produtos_bling usando o endpoint de saldos em lote.
+
+Em vez de uma chamada de detalhes por SKU, consulta ``/estoques/saldos`` com
+até ESTOQUE_LOTE produtos por requisição e grava somente a coluna ``estoque``.
+Barato o suficiente para rodar a cada poucos minutos (job ``estoque`` do
+agendador).
+"""
+import os
+from typing import List
+
+import db
+from bling_api import buscar_saldos_estoque
+from logger import logger
+from progresso import Progresso
+from mapeamento import to_float
+from trava_execucao import trava_de_script
+
+ESTOQUE_LOTE = int(os.getenv("ESTOQUE_LOTE", "100"))
+
+
+def _ids_produtos(cursor) -> List[int]:
+    """IDs de produtos ativos cadastrados no banco, em ordem."""
+    cursor.execute("SELECT id_bling FROM produtos_bling WHERE situacao IS NULL OR situacao <> 'I' ORDER BY id_bling")
+    return [row[0] for row in cursor.fetchall()]
+
+
+def sincronizar_estoque(tamanho_lote: int = ESTOQUE_LOTE) -> int:
+    """Atualiza o estoque de todos os produtos ativos em lotes.
+
+    Returns:
+        int: quantidade de produtos com estoque gravado.
+    """
+    logger.info("Iniciando sincronização de estoque")
+    progresso = Progresso("estoque")
+    conn = db.conectar_mysql()
+    cursor = conn.cursor()
+    total = 0
+    try:
+        ids = _ids_produtos(cursor)
+        logger.info("Consultando saldo de %s produtos em lotes de %s", len(ids), tamanho_lote)
+        progresso.fase("saldos", total=len(ids))
+
+        for inicio in range(0, len(ids), tamanho_lote):
+            lote = ids[inicio:inicio + tamanho_lote]
+            saldos = buscar_saldos_estoque(lote)
+            pares = [
+                (item["produto"]["id"], to_float(item.get("saldoVirtualTotal")))
+                for item in saldos
+                if (item.get("produto") or {}).get("id")
+            ]
+            total += db.atualizar_estoques(cursor, pares)
+            conn.commit()
+            progresso.atualizar(linhas=inicio + len(lote), gravados=total)
+
+        logger.info("Sincronização de estoque concluída. Produtos atualizados: %s", total)
+        progresso.concluir(gravados=total)
+        return total
+    except Exception as e:
+        progresso.falhar(e)
+        conn.rollback()
+        logger.exception("Erro durante sincronização de estoque")
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    with trava_de_script("estoque"):
+        sincronizar_estoque()
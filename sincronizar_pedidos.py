@@ -0,0 +1,113 @@
+"""Sincroniza os pedidos de venda do Bling (``/pedidos/vendas``) com a tabela pedidos_vendas.
+
+Usa o motor genérico (``motor_sync``): a listagem é limitada aos pedidos dos
+últimos PEDIDOS_DIAS dias (``dataInicial``) e cada pedido só é regravado quando
+a ``assinatura`` (md5 dos valores mapeados) difere da gravada no banco.
+
+Os itens do pedido não vêm na listagem e exigiriam uma requisição por pedido;
+ficam fora desta sincronização.
+
+Uso:
+    python sincronizar_pedidos.py [--dias N]
+
+Variáveis de ambiente:
+- PEDIDOS_DIAS (padrão 90): janela de datas sincronizada a cada execução
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import os
+from collections import Counter
+from datetime import date, timedelta
+
+import motor_sync
+from mapeamento import to_float, to_int
+from trava_execucao import TRAVA_ESPERA_SEG, trava_de_script
+
+PEDIDOS_DIAS = int(os.getenv("PEDIDOS_DIAS", "90"))
+
+CAMPOS_PEDIDO = (
+    "id", "numero", "numero_loja", "data", "data_saida", "data_prevista",
+    "total_produtos", "total", "id_contato", "nome_contato", "documento_contato",
+    "situacao_id", "situacao_valor", "id_loja", "assinatura",
+)
+
+
+def _data(valor):
+    """Data da API ("YYYY-MM-DD"); o Bling usa "0000-00-00" para data vazia."""
+    if not valor or str(valor).startswith("0000-00-00"):
+        return None
+    return str(valor)[:10]
+
+
+def mapear_pedido(p: dict) -> tuple:
+    """Mapeia o pedido da listagem para os valores de CAMPOS_PEDIDO (assinatura por último)."""
+    contato = p.get("contato") or {}
+    situacao = p.get("situacao") or {}
+    valores = (
+        int(p["id"]),
+        to_int(p.get("numero")),
+        (p.get("numeroLoja") or None),
+        _data(p.get("data")),
+        _data(p.get("dataSaida")),
+        _data(p.get("dataPrevista")),
+        to_float(p.get("totalProdutos")),
+        to_float(p.get("total")),
+        to_int(contato.get("id")) or None,
+        (contato.get("nome") or "")[:255] or None,
+        "".join(c for c in str(contato.get("numeroDocumento") or "") if c.isdigit()) or None,
+        to_int(situacao.get("id")) or None,
+        to_int(situacao.get("valor")),
+        to_int((p.get("loja") or {}).get("id")) or None,
+    )
+    assinatura = hashlib.md5(repr(valores).encode("utf-8")).hexdigest()
+    return valores + (assinatura,)
+
+
+def _params_listagem(dias: int) -> dict:
+    return {"dataInicial": (date.today() - timedelta(days=dias)).isoformat()}
+
+
+def entidade_pedidos(dias: int = PEDIDOS_DIAS) -> motor_sync.Entidade:
+    """Pedidos de venda com a janela de ``dias`` dias, calculada a cada listagem."""
+    return motor_sync.Entidade(
+        nome="pedidos",
+        recurso="pedidos/vendas",
+        tabela="pedidos_vendas",
+        chave="id",
+        colunas=CAMPOS_PEDIDO,
+        mapear=mapear_pedido,
+        params_listagem=lambda: _params_listagem(dias),
+        coluna_alteracao="assinatura",
+        extrair_alteracao=lambda _pedido, linha: linha[-1],
+        mudou=lambda api, banco: api != banco,
+    )
+
+
+PEDIDOS_VENDAS = entidade_pedidos()
+
+
+def sincronizar_pedidos(dias: int = PEDIDOS_DIAS) -> Counter:
+    """Sincroniza os pedidos de venda dos últimos ``dias`` dias.
+
+    A tabela pedidos_vendas é criada por ``migracoes.py`` (versão 6). Como a
+    listagem cobre só uma janela de datas, não há reconciliação de exclusões.
+    """
+    entidade = PEDIDOS_VENDAS if dias == PEDIDOS_DIAS else entidade_pedidos(dias)
+    return motor_sync.sincronizar(entidade, reconciliar_exclusoes=False)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Sincroniza pedidos de venda do Bling com o MySQL")
+    parser.add_argument("--dias", type=int, default=PEDIDOS_DIAS,
+                        help="Janela de datas em dias (padrão: PEDIDOS_DIAS ou 90)")
+    parser.add_argument("--esperar-trava", type=float, default=TRAVA_ESPERA_SEG, metavar="SEG",
+                        help="Com outra execução em curso, aguarda até SEG segundos em vez de sair")
+    args = parser.parse_args()
+    with trava_de_script("pedidos", args.esperar_trava):
+        sincronizar_pedidos(args.dias)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Comparação local entre produtos mapeados e o snapshot de produtos_bling.
+
+Permite ao ``main.py`` gravar apenas inserções e alterações reais (``--diff``)
+e gerar um relatório do que mudaria sem escrever nada (``--dry-run``).
+"""
+from __future__ import annotations
+
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+from mapeamento import ProdutoMapeado
+
+# Casas decimais das colunas DECIMAL (None = texto), na ordem de ProdutoMapeado[1:]
+_ESCALAS = (None, None, 2, 2, None, None, None, 3, 3, 3, 3, 3)
+_CAMPOS = ProdutoMapeado.CAMPOS[1:]
+
+
+def normalizar(valores: tuple) -> tuple:
+    """Normaliza uma linha para comparação (DECIMAL arredondado, None -> vazio)."""
+    return tuple(
+        (value or "") if escala is None else round(float(value or 0), escala)
+        for value, escala in zip(valores, _ESCALAS)
+    )
+
+
+def diferenca(
+    mapeados: Iterable[ProdutoMapeado], snapshot: Dict[int, tuple]
+) -> Tuple[List[ProdutoMapeado], List[ProdutoMapeado], Counter]:
+    """Separa os produtos mapeados em novos e alterados em relação ao snapshot.
+
+    Returns:
+        tuple: (novos, alterados, contagem de alterações por campo).
+    """
+    novos: List[ProdutoMapeado] = []
+    alterados: List[ProdutoMapeado] = []
+    campos = Counter()
+    for mp in mapeados:
+        atual = snapshot.get(mp[0])
+        if atual is None:
+            novos.append(mp)
+            continue
+        recebido = normalizar(mp[1:])
+        if recebido != atual:
+            alterados.append(mp)
+            campos.update(c for c, a, b in zip(_CAMPOS, atual, recebido) if a != b)
+    return novos, alterados, campos
+
+
+def relatorio(novos: list, alterados: list, campos: Counter, ausentes: list,
+              exemplos: int = 10) -> str:
+    """Monta o texto do relatório de dry-run."""
+    linhas = [
+        f"Novos: {len(novos)} | Alterados: {len(alterados)} | Ausentes na API (ativos): {len(ausentes)}",
+    ]
+    if campos:
+        linhas.append("Alterações por campo: " + ", ".join(f"{c}={n}" for c, n in campos.most_common()))
+    if novos:
+        linhas.append("Exemplos de novos: " + ", ".join(str(mp.id_bling) for mp in novos[:exemplos]))
+    if alterados:
+        linhas.append("Exemplos de alterados: " + ", ".join(str(mp.id_bling) for mp in alterados[:exemplos]))
+    if ausentes:
+        linhas.append("Exemplos de ausentes: " + ", ".join(str(i) for i in ausentes[:exemplos]))
+    return "\n".join(linhas)
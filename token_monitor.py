@@ -4,19 +4,32 @@ Rotas principais:
 - GET /: Dashboard com status do token
 - POST /refresh-token: Renova o token e atualiza o status persistido
 - GET /api/contatos/<id>: Retorna detalhes do contato por ID (via API Bling)
+- POST /api/contatos/lote: Resolve vários contatos (banco local primeiro, depois Bling em paralelo)
+- GET /api/clientes/busca: Busca indexada em clientes_bling (nome, documento, telefone, email)
+- GET /api/jobs: Estado dos jobs do agendador (agendador.py)
+- POST /webhooks/bling: Recebe notificações do Bling e enfileira (webhooks.py)
+- GET /progresso: Painel com o progresso das sincronizações em tempo real
+- GET /api/progresso/stream: Progresso das sincronizações via Server-Sent Events
 """
 import os
 import json
-from datetime import datetime, timedelta
-from flask import Flask, render_template, jsonify, render_template_string
-from token_refresh import renovar_token
+import time
+from datetime import datetime
+from flask import Flask, Response, render_template, jsonify, render_template_string, request
+from token_refresh import TOKEN_STATUS_FILE, registrar_renovacao, renovar_token
 from dotenv import load_dotenv
 from bling_clientes import buscar_detalhes_cliente
+import webhooks
+import progresso
+import consulta_contatos
 
 app = Flask(__name__, static_url_path='/static', static_folder='static')
 load_dotenv()
 
-LAST_REFRESH_FILE = 'token_status.json'
+LAST_REFRESH_FILE = TOKEN_STATUS_FILE
+JOBS_STATUS_FILE = os.getenv('JOBS_STATUS_FILE', 'jobs_status.json')
+SSE_INTERVALO_SEG = float(os.getenv('SSE_INTERVALO_SEG', '1'))
+SSE_KEEPALIVE_SEG = 15
 
 
 def load_token_status() -> dict:
@@ -92,15 +105,7 @@ def refresh_token():
     try:
         new_token = renovar_token()
         if new_token:
-            now = datetime.now()
-            # Assumimos que o token expira em 8 horas; renovamos 1 hora antes.
-            next_refresh = now + timedelta(hours=7)
-
-            status = {
-                'last_refresh': now.isoformat(),
-                'next_refresh': next_refresh.isoformat()
-            }
-            save_token_status(status)
+            status = registrar_renovacao()
             app.logger.info("Token renovado com sucesso; próxima renovação programada para %s", status['next_refresh'])
 
             return jsonify({
@@ -120,6 +125,118 @@ def refresh_token():
         })
 
 
+@app.route('/api/jobs')
+def api_jobs():
+    """Retorna o estado dos jobs publicado pelo agendador."""
+    try:
+        with open(JOBS_STATUS_FILE, 'r', encoding='utf-8') as f:
+            return jsonify({'success': True, **json.load(f)})
+    except FileNotFoundError:
+        return jsonify({'success': False, 'error': 'Agendador não está em execução'}), 404
+    except Exception as e:
+        app.logger.error("Erro ao carregar status dos jobs: %s", e)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/progresso')
+def api_progresso():
+    """Retorna o último progresso publicado por cada job de sincronização."""
+    return jsonify({'success': True, 'jobs': progresso.ler_todos()})
+
+
+@app.route('/api/progresso/stream')
+def api_progresso_stream():
+    """Envia o progresso via Server-Sent Events sempre que algum job publicar.
+
+    Só o mtime dos arquivos é consultado a cada SSE_INTERVALO_SEG; o conteúdo é
+    relido apenas quando muda.
+    """
+    def eventos():
+        anterior = None
+        ultimo_envio = time.monotonic()
+        while True:
+            atual = progresso.assinatura()
+            if atual != anterior:
+                anterior = atual
+                ultimo_envio = time.monotonic()
+                yield f"data: {json.dumps(progresso.ler_todos(), ensure_ascii=False)}\n\n"
+            elif time.monotonic() - ultimo_envio >= SSE_KEEPALIVE_SEG:
+                ultimo_envio = time.monotonic()
+                yield ": keep-alive\n\n"
+            time.sleep(SSE_INTERVALO_SEG)
+
+    return Response(
+        eventos(),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+@app.route('/progresso')
+def progresso_page():
+    """Painel simples que acompanha /api/progresso/stream com EventSource."""
+    return render_template_string(
+        """
+        <!DOCTYPE html>
+        <html lang=\"pt-BR\">
+        <head>
+            <meta charset=\"UTF-8\">
+            <meta name=\"viewport\" content=\"width=device-width, initial-scale=1.0\">
+            <title>Progresso das Sincronizações</title>
+            <link rel=\"stylesheet\" href=\"/static/css/styles.css\">
+        </head>
+        <body>
+            <div class=\"card container\">
+                <h1>Progresso das Sincronizações</h1>
+                <table id=\"jobs\">
+                    <thead>
+                        <tr><th>Job</th><th>Estado</th><th>Fase</th><th>Página</th><th>Linhas</th>
+                            <th>Linhas/s</th><th>Fila de detalhes</th><th>Erros</th><th>Atualizado em</th></tr>
+                    </thead>
+                    <tbody></tbody>
+                </table>
+                <p class=\"muted\" id=\"conexao\">Conectando...</p>
+            </div>
+            <script>
+                const colunas = ['estado', 'fase', 'pagina', 'linhas', 'linhas_por_seg', 'fila_detalhes', 'erros', 'atualizado_em'];
+                const fonte = new EventSource('/api/progresso/stream');
+                fonte.onopen = () => { document.getElementById('conexao').textContent = 'Conectado'; };
+                fonte.onerror = () => { document.getElementById('conexao').textContent = 'Reconectando...'; };
+                fonte.onmessage = (evento) => {
+                    const jobs = JSON.parse(evento.data);
+                    const corpo = document.querySelector('#jobs tbody');
+                    corpo.innerHTML = '';
+                    for (const [nome, estado] of Object.entries(jobs)) {
+                        const linha = corpo.insertRow();
+                        linha.insertCell().textContent = nome;
+                        for (const coluna of colunas) {
+                            linha.insertCell().textContent = estado[coluna] ?? '-';
+                        }
+                    }
+                };
+            </script>
+        </body>
+        </html>
+        """
+    )
+
+
+@app.route('/webhooks/bling', methods=['POST'])
+def webhook_bling():
+    """Valida a notificação do Bling, grava na fila local e responde imediatamente."""
+    try:
+        tipo, acao, id_registro = webhooks.receber(
+            request.get_data(), request.headers.get('X-Bling-Signature-256')
+        )
+    except webhooks.WebhookInvalido as e:
+        app.logger.warning("Webhook rejeitado: %s", e)
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        app.logger.exception("Erro ao enfileirar webhook: %s", e)
+        return jsonify({'success': False, 'error': str(e)}), 500
+    return jsonify({'success': True, 'tipo': tipo, 'acao': acao, 'id': id_registro}), 202
+
+
 # Consulta de contato por ID
 @app.route('/contato')
 def contato_page():
@@ -177,6 +294,54 @@ def api_buscar_contato(id_cliente: int):
     except Exception as e:
         app.logger.exception("Erro ao buscar contato %s: %s", id_cliente, e)
         return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/contatos/lote', methods=['POST'])
+def api_buscar_contatos_lote():
+    """Resolve uma lista de IDs de contato em uma única resposta.
+
+    Corpo: {"ids": [1, 2, ...]}. Cada ID retorna com status local, cache, api,
+    nao_encontrado ou invalido.
+    """
+    corpo = request.get_json(silent=True)
+    if not isinstance(corpo, dict):
+        return jsonify({'success': False, 'error': 'Corpo deve ser um objeto JSON: {"ids": [...]}'}), 400
+    ids = corpo.get('ids')
+    if not isinstance(ids, list) or not ids:
+        return jsonify({'success': False, 'error': 'Informe "ids" como lista não vazia'}), 400
+    try:
+        contatos = consulta_contatos.buscar_lote(ids)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        app.logger.exception("Erro ao buscar lote de contatos: %s", e)
+        return jsonify({'success': False, 'error': str(e)}), 500
+    return jsonify({'success': True, 'data': contatos})
+
+
+@app.route('/api/clientes/busca')
+def api_buscar_clientes():
+    """Busca clientes no banco local, com paginação por keyset.
+
+    Parâmetros: nome, documento, telefone, email, apos (id do último item da
+    página anterior) e limite. O campo "proximo" da resposta é o ``apos`` da
+    próxima página (null na última).
+    """
+    try:
+        resultado = consulta_contatos.pesquisar(
+            nome=request.args.get('nome'),
+            documento=request.args.get('documento'),
+            telefone=request.args.get('telefone'),
+            email=request.args.get('email'),
+            apos=request.args.get('apos', 0, type=int),
+            limite=request.args.get('limite', 50, type=int),
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        app.logger.exception("Erro na busca de clientes: %s", e)
+        return jsonify({'success': False, 'error': str(e)}), 500
+    return jsonify({'success': True, **resultado})
 # -------------------------------------------------------------------------------------
 
 
@@ -1,5 +1,8 @@
 """Renovação do token de acesso do Bling via OAuth2 usando refresh_token."""
+import json
 import os
+from datetime import datetime, timedelta
+
 import requests
 from dotenv import load_dotenv
 from logger import logger
@@ -8,6 +11,9 @@ ENV_PATH = os.getenv("ENV_PATH", ".env")
 load_dotenv(dotenv_path=ENV_PATH)
 
 TOKEN_URL = "https://www.bling.com.br/Api/v3/oauth/token"
+TOKEN_STATUS_FILE = os.getenv("TOKEN_STATUS_FILE", "token_status.json")
+# Assumimos que o token expira em 8 horas; renovamos 1 hora antes.
+TOKEN_RENOVAR_APOS_HORAS = 7
 
 def _update_env_var(key: str, value: str) -> None:
     """Atualiza uma variável no processo e persiste no arquivo .env.
@@ -95,3 +101,34 @@ def renovar_token() -> str | None:
 
     logger.info("Token do Bling renovado com sucesso.")
     return access_token
+
+
+def registrar_renovacao(momento: datetime | None = None) -> dict:
+    """Persiste em TOKEN_STATUS_FILE a última e a próxima renovação do token.
+
+    Returns:
+        dict: status gravado, com as chaves last_refresh e next_refresh.
+    """
+    momento = momento or datetime.now()
+    status = {
+        "last_refresh": momento.isoformat(),
+        "next_refresh": (momento + timedelta(hours=TOKEN_RENOVAR_APOS_HORAS)).isoformat(),
+    }
+    try:
+        with open(TOKEN_STATUS_FILE, "w") as f:
+            json.dump(status, f)
+    except Exception as e:
+        logger.error("Erro ao salvar status do token: %s", e)
+    return status
+
+
+def token_expirado() -> bool:
+    """Indica se a próxima renovação registrada já passou (ou nunca houve)."""
+    try:
+        with open(TOKEN_STATUS_FILE, "r") as f:
+            next_refresh = json.load(f).get("next_refresh")
+    except (OSError, ValueError):
+        return True
+    if not next_refresh:
+        return True
+    return datetime.now() > datetime.fromisoformat(next_refresh)
@@ -0,0 +1,171 @@
+"""Trava de execução entre processos: um job por vez, mesmo entre cron e agendador.
+
+O job segura duas travas, obtidas nesta ordem e sempre ambas:
+
+1. ``fcntl.flock`` exclusivo sobre ``TRAVAS_DIR/<job>.lock``, mantido aberto
+   enquanto o job roda (exclui execuções nesta máquina);
+2. ``GET_LOCK`` do MySQL, em uma conexão dedicada (exclui execuções em
+   qualquer máquina que use o mesmo banco). O nome inclui o banco
+   (``<DB_NAME>:bling:<job>``) para não colidir entre bases no mesmo servidor.
+
+Se o processo morrer, o sistema fecha o descritor e o servidor encerra a
+sessão, liberando as duas travas sozinhos: não há trava órfã nem arquivo a
+remover (o conteúdo do arquivo, host, pid e início, serve só para diagnóstico).
+Não há recuo de uma para a outra: com o MySQL inacessível o job não roda
+(``TravaOcupada``), já que precisaria do banco de qualquer forma.
+
+Uma segunda execução sai na hora (``TravaOcupada``) ou, com ``espera_seg``,
+aguarda até esse prazo pela liberação.
+"""
+from __future__ import annotations
+
+import fcntl
+import json
+import os
+import socket
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Iterator
+
+import mysql.connector
+
+import db
+from logger import logger
+
+TRAVAS_DIR = os.getenv("TRAVAS_DIR", "travas")
+TRAVA_ESPERA_SEG = float(os.getenv("TRAVA_ESPERA_SEG", "0"))
+# Código de saída dos scripts quando outra execução do mesmo job está em curso (EX_TEMPFAIL)
+CODIGO_SAIDA_OCUPADA = 75
+
+# Sessão da trava fica ociosa durante o job inteiro; evita o corte por wait_timeout
+_TIMEOUT_SESSAO_SEG = 7 * 24 * 3600
+
+
+class TravaOcupada(RuntimeError):
+    """Outra execução do mesmo job está em andamento."""
+
+
+def _nome_mysql(job: str) -> str:
+    # GET_LOCK aceita nomes de até 64 caracteres
+    return f"{os.getenv('DB_NAME', '')}:bling:{job}"[-64:]
+
+
+def _trava_mysql(job: str, espera_seg: float):
+    """Obtém a trava via GET_LOCK; devolve a conexão que a segura.
+
+    Raises:
+        TravaOcupada: se não obtida dentro de ``espera_seg``.
+    """
+    conn = db.conectar_mysql(dedicada=True)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"SET SESSION wait_timeout = {_TIMEOUT_SESSAO_SEG}")
+        cursor.execute("SELECT GET_LOCK(%s, %s)", (_nome_mysql(job), int(espera_seg)))
+        (obtida,) = cursor.fetchone()
+        if obtida == 1:
+            cursor.close()
+            return conn
+        cursor.execute("SELECT IS_USED_LOCK(%s)", (_nome_mysql(job),))
+        (sessao,) = cursor.fetchone()
+        cursor.close()
+    except Exception:
+        conn.close()
+        raise
+    conn.close()
+    raise TravaOcupada(f"Job {job} já em execução (sessão MySQL {sessao})")
+
+
+def _liberar_mysql(conn, job: str) -> None:
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT RELEASE_LOCK(%s)", (_nome_mysql(job),))
+        cursor.fetchone()
+        cursor.close()
+    except mysql.connector.Error as e:
+        # Fechar a sessão libera a trava de qualquer forma
+        logger.warning("Falha ao liberar trava MySQL de %s: %s", job, e)
+    finally:
+        conn.close()
+
+
+def _dono_arquivo(caminho: str) -> dict:
+    try:
+        with open(caminho, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}  # ainda sendo escrito pelo dono
+
+
+def _trava_arquivo(job: str, espera_seg: float, diretorio: str) -> int:
+    """Obtém ``fcntl.flock`` exclusivo sobre o arquivo do job; devolve o descritor que o segura.
+
+    Fechar o descritor libera a trava. O arquivo não é removido: outro processo
+    pode já estar aguardando sobre ele.
+
+    Raises:
+        TravaOcupada: se não obtida dentro de ``espera_seg``.
+    """
+    os.makedirs(diretorio, exist_ok=True)
+    caminho = os.path.join(diretorio, f"{job}.lock")
+    prazo = time.monotonic() + espera_seg
+    fd = os.open(caminho, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() >= prazo:
+                    raise TravaOcupada(f"Job {job} já em execução ({_dono_arquivo(caminho) or caminho})") from None
+                time.sleep(1)
+        conteudo = json.dumps({
+            "host": socket.gethostname(),
+            "pid": os.getpid(),
+            "inicio": datetime.now().isoformat(timespec="seconds"),
+        })
+        os.ftruncate(fd, 0)
+        os.pwrite(fd, conteudo.encode("utf-8"), 0)
+        return fd
+    except BaseException:
+        os.close(fd)
+        raise
+
+
+@contextmanager
+def trava_execucao(job: str, espera_seg: float = TRAVA_ESPERA_SEG,
+                   diretorio: str = TRAVAS_DIR) -> Iterator[None]:
+    """Segura as travas do job (arquivo e MySQL) durante o bloco.
+
+    ``espera_seg`` é o prazo total para obter as duas.
+
+    Raises:
+        TravaOcupada: se outra execução segura alguma das travas além de
+            ``espera_seg``, ou se o MySQL estiver inacessível.
+    """
+    prazo = time.monotonic() + espera_seg
+    fd = _trava_arquivo(job, espera_seg, diretorio)
+    try:
+        try:
+            conn = _trava_mysql(job, max(0.0, prazo - time.monotonic()))
+        except TravaOcupada:
+            raise
+        except (mysql.connector.Error, RuntimeError) as e:
+            raise TravaOcupada(f"Trava MySQL de {job} inacessível ({e}); job não executado") from e
+        try:
+            yield
+        finally:
+            _liberar_mysql(conn, job)
+    finally:
+        os.close(fd)  # libera o flock
+
+
+@contextmanager
+def trava_de_script(job: str, espera_seg: float = TRAVA_ESPERA_SEG) -> Iterator[None]:
+    """Trava para pontos de entrada de script: ocupada, encerra com CODIGO_SAIDA_OCUPADA."""
+    try:
+        with trava_execucao(job, espera_seg):
+            yield
+    except TravaOcupada as e:
+        logger.warning("%s; esta execução foi encerrada", e)
+        raise SystemExit(CODIGO_SAIDA_OCUPADA)
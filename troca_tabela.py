@@ -0,0 +1,134 @@
+"""Refresh completo de produtos_bling em tabela sombra com troca atômica.
+
+Fluxo (``main.py --full-refresh``):
+1. ``produtos_bling_novo`` é criada com o mesmo esquema e recebe a listagem
+   completa; imagem, data_alteracao e o agendamento de detalhes são copiados
+   da tabela atual para não forçar o refetch de todos os detalhes.
+2. ``RENAME TABLE`` troca as tabelas em uma única operação atômica; a versão
+   anterior fica em ``produtos_bling_antigo``.
+3. Se algo falhar antes da troca, a tabela sombra é descartada e a tabela em
+   uso nunca é tocada. Depois da troca, ``reverter`` desfaz a operação
+   (``main.py --reverter-refresh``).
+
+Leitores de produtos_bling não disputam locks com a carga: as escritas vão para
+a tabela sombra e as leituras da tabela atual usam READ COMMITTED (sem locks).
+Gravações de outros jobs na tabela atual durante a montagem (webhooks, estoque)
+não são levadas para a nova tabela; elas voltam na próxima execução desses jobs.
+"""
+from __future__ import annotations
+
+from typing import Iterable
+
+import db
+from logger import logger
+from mapeamento import ProdutoMapeado
+from reconciliacao import MAX_FRACAO_AUSENTES
+
+TABELA = "produtos_bling"
+TABELA_NOVA = "produtos_bling_novo"
+TABELA_ANTIGA = "produtos_bling_antigo"
+TABELA_REVERTIDA = "produtos_bling_revertido"
+
+# A troca é recusada se a nova tabela tiver menos que esta fração dos ativos atuais
+MIN_FRACAO = 1 - MAX_FRACAO_AUSENTES
+
+
+class TrocaRecusada(RuntimeError):
+    """A tabela sombra não passou na verificação de sanidade antes da troca."""
+
+
+def _contar_ativos(cursor, tabela: str) -> int:
+    cursor.execute(f"SELECT COUNT(*) FROM {tabela} WHERE situacao IS NULL OR situacao <> 'I'")
+    return cursor.fetchone()[0]
+
+
+def montar_tabela_nova(conn, mapeados: Iterable[ProdutoMapeado]) -> int:
+    """Cria a tabela sombra, carrega os produtos e preserva imagem e agendamento de detalhes.
+
+    Returns:
+        int: produtos gravados na tabela sombra.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SET SESSION TRANSACTION ISOLATION LEVEL READ COMMITTED")
+        cursor.execute(f"DROP TABLE IF EXISTS {TABELA_NOVA}")
+        cursor.execute(f"CREATE TABLE {TABELA_NOVA} LIKE {TABELA}")
+
+        total = db.upsert_batch(cursor, mapeados, tabela=TABELA_NOVA)
+        cursor.execute(
+            f"""
+            UPDATE {TABELA_NOVA} n
+            JOIN {TABELA} p ON p.id_bling = n.id_bling
+            SET n.imagem = p.imagem,
+                n.data_cadastro = p.data_cadastro,
+                n.data_alteracao = p.data_alteracao,
+                n.detalhes_intervalo_h = p.detalhes_intervalo_h,
+                n.detalhes_proxima = p.detalhes_proxima,
+                n.detalhes_hash = p.detalhes_hash,
+                n.imagem_local = p.imagem_local
+            """
+        )
+        conn.commit()
+        logger.info("Tabela %s montada com %s produtos", TABELA_NOVA, total)
+        return total
+    except Exception:
+        conn.rollback()
+        descartar(conn)
+        raise
+    finally:
+        cursor.close()
+
+
+def trocar(conn, min_fracao: float = MIN_FRACAO) -> None:
+    """Troca atomicamente produtos_bling pela tabela sombra.
+
+    Raises:
+        TrocaRecusada: se a tabela sombra tiver poucos registros frente à atual.
+    """
+    cursor = conn.cursor()
+    try:
+        novos = _contar_ativos(cursor, TABELA_NOVA)
+        atuais = _contar_ativos(cursor, TABELA)
+        if atuais and novos < atuais * min_fracao:
+            raise TrocaRecusada(
+                f"{TABELA_NOVA} tem {novos} ativos contra {atuais} em {TABELA}; troca cancelada"
+            )
+        cursor.execute(f"DROP TABLE IF EXISTS {TABELA_ANTIGA}")
+        cursor.execute(
+            f"RENAME TABLE {TABELA} TO {TABELA_ANTIGA}, {TABELA_NOVA} TO {TABELA}"
+        )
+        logger.warning("Tabela %s trocada; versão anterior em %s", TABELA, TABELA_ANTIGA)
+    finally:
+        cursor.close()
+
+
+def descartar(conn) -> None:
+    """Remove a tabela sombra de uma montagem que falhou."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"DROP TABLE IF EXISTS {TABELA_NOVA}")
+    finally:
+        cursor.close()
+
+
+def reverter(conn) -> None:
+    """Volta a versão anterior (produtos_bling_antigo) para produtos_bling.
+
+    A tabela que estava em uso fica em produtos_bling_revertido para análise.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT COUNT(*) FROM information_schema.tables "
+            "WHERE table_schema = DATABASE() AND table_name = %s",
+            (TABELA_ANTIGA,),
+        )
+        if not cursor.fetchone()[0]:
+            raise RuntimeError(f"Não há {TABELA_ANTIGA} para reverter")
+        cursor.execute(f"DROP TABLE IF EXISTS {TABELA_REVERTIDA}")
+        cursor.execute(
+            f"RENAME TABLE {TABELA} TO {TABELA_REVERTIDA}, {TABELA_ANTIGA} TO {TABELA}"
+        )
+        logger.warning("Refresh revertido; tabela descartada mantida em %s", TABELA_REVERTIDA)
+    finally:
+        cursor.close()
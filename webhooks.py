@@ -0,0 +1,321 @@
+"""Recebimento de webhooks do Bling com fila local durável e aplicação em micro-lotes.
+
+O endpoint (``token_monitor``: POST /webhooks/bling) apenas valida a notificação
+e a grava na fila SQLite; ``processar_fila`` drena a fila em lotes, agrupa
+eventos repetidos do mesmo registro e aplica o estado atual via upsert/detalhes.
+
+Variáveis de ambiente:
+- BLING_WEBHOOK_SECRET: segredo do HMAC (padrão: BLING_CLIENT_SECRET)
+- WEBHOOK_FILA_DB: arquivo SQLite da fila (padrão webhooks_fila.db)
+- WEBHOOK_LOTE: eventos por micro-lote (padrão 200)
+- WEBHOOK_MAX_TENTATIVAS: tentativas antes de descartar um evento (padrão 5)
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import sqlite3
+import time
+from typing import Dict, List, Optional, Tuple
+
+import db
+from bling_api import buscar_detalhes_produto
+from bling_clientes import buscar_detalhes_cliente
+from detalhes_bling import agendar_proximos_detalhes, aplicar_detalhes
+from dotenv import load_dotenv
+from logger import logger
+from mapeamento import mapear_produto, to_float
+from sincronizar_clientes import CLIENTES
+
+load_dotenv()
+
+FILA_DB = os.getenv("WEBHOOK_FILA_DB", "webhooks_fila.db")
+TAMANHO_LOTE = int(os.getenv("WEBHOOK_LOTE", "200"))
+MAX_TENTATIVAS = int(os.getenv("WEBHOOK_MAX_TENTATIVAS", "5"))
+
+# Recursos aceitos (prefixo de "event") e o tipo de registro que afetam
+RECURSOS = {
+    "product": "produto",
+    "stock": "estoque",
+    "virtual_stock": "estoque",
+    "contact": "contato",
+}
+ACOES = {"created", "updated", "deleted"}
+
+
+class WebhookInvalido(ValueError):
+    """Notificação rejeitada (assinatura ou conteúdo inválido)."""
+
+
+def _segredo() -> str:
+    return os.getenv("BLING_WEBHOOK_SECRET") or os.getenv("BLING_CLIENT_SECRET") or ""
+
+
+def validar_assinatura(corpo: bytes, assinatura: Optional[str]) -> None:
+    """Confere o cabeçalho X-Bling-Signature-256 (``sha256=<hmac hex>``).
+
+    Raises:
+        WebhookInvalido: se não houver segredo configurado ou a assinatura divergir.
+    """
+    segredo = _segredo()
+    if not segredo:
+        raise WebhookInvalido("Segredo do webhook não configurado")
+    if not assinatura:
+        raise WebhookInvalido("Assinatura ausente")
+    esperado = hmac.new(segredo.encode("utf-8"), corpo, hashlib.sha256).hexdigest()
+    recebido = assinatura.split("=", 1)[1] if assinatura.startswith("sha256=") else assinatura
+    if not hmac.compare_digest(esperado, recebido.strip().lower()):
+        raise WebhookInvalido("Assinatura inválida")
+
+
+def interpretar(payload: dict) -> Tuple[str, str, int]:
+    """Extrai (tipo, ação, id do registro) de uma notificação do Bling.
+
+    Raises:
+        WebhookInvalido: se o evento não for suportado ou faltar o ID.
+    """
+    if not isinstance(payload, dict):
+        raise WebhookInvalido("Corpo não é um objeto JSON")
+    recurso, _, acao = str(payload.get("event") or "").rpartition(".")
+    tipo = RECURSOS.get(recurso)
+    if tipo is None or acao not in ACOES:
+        raise WebhookInvalido(f"Evento não suportado: {payload.get('event')!r}")
+    data = payload.get("data")
+    if not isinstance(data, dict):
+        raise WebhookInvalido("Campo data ausente")
+    if tipo == "estoque":
+        id_registro = (data.get("produto") or {}).get("id")
+    else:
+        id_registro = data.get("id")
+    try:
+        id_registro = int(id_registro)
+    except (TypeError, ValueError):
+        raise WebhookInvalido("ID do registro ausente ou inválido") from None
+    return tipo, acao, id_registro
+
+
+def _conectar_fila() -> sqlite3.Connection:
+    conn = sqlite3.connect(FILA_DB, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS eventos (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            tipo TEXT NOT NULL,
+            acao TEXT NOT NULL,
+            id_registro INTEGER NOT NULL,
+            payload TEXT NOT NULL,
+            recebido_em REAL NOT NULL,
+            tentativas INTEGER NOT NULL DEFAULT 0
+        )
+        """
+    )
+    return conn
+
+
+def enfileirar(tipo: str, acao: str, id_registro: int, payload: dict) -> None:
+    """Grava a notificação na fila local (durável antes de responder ao Bling)."""
+    conn = _conectar_fila()
+    try:
+        with conn:
+            conn.execute(
+                "INSERT INTO eventos (tipo, acao, id_registro, payload, recebido_em) VALUES (?, ?, ?, ?, ?)",
+                (tipo, acao, id_registro, json.dumps(payload, ensure_ascii=False), time.time()),
+            )
+    finally:
+        conn.close()
+
+
+def receber(corpo: bytes, assinatura: Optional[str]) -> Tuple[str, str, int]:
+    """Valida e enfileira uma notificação recebida pelo endpoint HTTP.
+
+    Raises:
+        WebhookInvalido: se a notificação for rejeitada.
+    """
+    validar_assinatura(corpo, assinatura)
+    try:
+        payload = json.loads(corpo)
+    except ValueError:
+        raise WebhookInvalido("Corpo não é JSON") from None
+    tipo, acao, id_registro = interpretar(payload)
+    enfileirar(tipo, acao, id_registro, payload)
+    return tipo, acao, id_registro
+
+
+def tamanho_fila() -> int:
+    conn = _conectar_fila()
+    try:
+        return conn.execute("SELECT COUNT(*) FROM eventos").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def _agrupar(eventos: List[tuple]) -> Dict[Tuple[str, int], Tuple[str, dict, List[int]]]:
+    """Agrupa eventos por (tipo, id); vale a última ação e o último payload."""
+    grupos: Dict[Tuple[str, int], Tuple[str, dict, List[int]]] = {}
+    for seq, tipo, acao, id_registro, payload in eventos:
+        chave = (tipo, id_registro)
+        seqs = grupos[chave][2] if chave in grupos else []
+        seqs.append(seq)
+        grupos[chave] = (acao, json.loads(payload), seqs)
+    return grupos
+
+
+def _aplicar_produto(cursor, id_bling: int, acao: str) -> bool:
+    if acao == "deleted":
+        db.marcar_produtos_inativos(cursor, [id_bling])
+        return True
+    produto = buscar_detalhes_produto(id_bling)
+    if not produto:
+        return False
+    # Detalhes antes do upsert: a comparação com detalhes_hash usa o estado anterior ao webhook
+    mudou = aplicar_detalhes(cursor, id_bling, produto)
+    db.upsert_batch(cursor, [mapear_produto(produto)])
+    if mudou is None:
+        # Produto novo (a linha só existe após o upsert) ou ainda sem hash
+        aplicar_detalhes(cursor, id_bling, produto)
+    agendar_proximos_detalhes(cursor, id_bling, mudou)
+    return True
+
+
+def _aplicar_contato(cursor, id_cliente: int, acao: str) -> bool:
+    if acao == "deleted":
+        # Mantém data_alteracao (ver reconciliacao.reconciliar)
+        cursor.execute(
+            "UPDATE clientes_bling SET situacao = 'I', data_alteracao = data_alteracao WHERE id = %s",
+            (id_cliente,),
+        )
+        return True
+    cliente = buscar_detalhes_cliente(id_cliente)
+    if not cliente:
+        return False
+    CLIENTES.gravar(cursor, [CLIENTES.mapear(cliente)])
+    return True
+
+
+def _aplicar(cursor, tipo: str, id_registro: int, acao: str) -> bool:
+    try:
+        if tipo == "produto":
+            return _aplicar_produto(cursor, id_registro, acao)
+        return _aplicar_contato(cursor, id_registro, acao)
+    except Exception as e:
+        logger.error("Erro ao aplicar webhook %s %s: %s", tipo, id_registro, e)
+        raise
+
+
+def _saldo_do_payload(payload: dict) -> Optional[float]:
+    saldo = (payload.get("data") or {}).get("saldoVirtualTotal")
+    return None if saldo is None else to_float(saldo)
+
+
+def processar_fila(tamanho_lote: int = TAMANHO_LOTE, max_lotes: Optional[int] = None) -> Dict[str, int]:
+    """Drena a fila em micro-lotes e aplica os eventos no MySQL.
+
+    Eventos repetidos do mesmo registro no lote são aplicados uma única vez.
+    Eventos de estoque que trazem o saldo são gravados sem chamar a API.
+    Cada registro é aplicado sob savepoint (``db.CommitEmGrupo``) e o lote é
+    confirmado em um commit; só então seus eventos saem da fila. Falhas
+    permanecem na fila (até WEBHOOK_MAX_TENTATIVAS); eventos de itens perdidos
+    porque o servidor desfez a transação (deadlock) voltam sem contar tentativa.
+
+    Returns:
+        dict: contadores eventos, aplicados, falhas e descartados (em eventos).
+    """
+    totais = {"eventos": 0, "aplicados": 0, "falhas": 0, "descartados": 0}
+    fila = _conectar_fila()
+    conn = db.conectar_mysql()
+    cursor = conn.cursor()
+    lotes = 0
+    try:
+        while max_lotes is None or lotes < max_lotes:
+            eventos = fila.execute(
+                "SELECT seq, tipo, acao, id_registro, payload FROM eventos ORDER BY seq LIMIT ?",
+                (tamanho_lote,),
+            ).fetchall()
+            if not eventos:
+                break
+            lotes += 1
+            totais["eventos"] += len(eventos)
+
+            concluidos: List[int] = []
+            falhos: List[int] = []
+            # Aplicados e ainda não confirmados; se o servidor desfizer a transação
+            # (deadlock), voltam para a fila sem contar tentativa
+            pendentes: List[int] = []
+            refazer: List[int] = []
+            saldos: List[Tuple[int, float]] = []
+            # Um commit por lote: só eventos de itens confirmados saem da fila
+            grupo = db.CommitEmGrupo(conn, cursor, max_linhas=len(eventos) + 1, max_seg=float("inf"))
+            for (tipo, id_registro), (acao, payload, seqs) in _agrupar(eventos).items():
+                if tipo == "estoque":
+                    saldo = _saldo_do_payload(payload)
+                    if saldo is not None:
+                        saldos.append((id_registro, saldo))
+                        concluidos.extend(seqs)
+                        continue
+                    tipo, acao = "produto", "updated"
+                perdidos = grupo.perdidos
+                if grupo.executar(_aplicar, cursor, tipo, id_registro, acao):
+                    pendentes.extend(seqs)
+                else:
+                    falhos.extend(seqs)
+                if grupo.perdidos > perdidos:
+                    refazer.extend(pendentes)
+                    pendentes = []
+
+            db.atualizar_estoques(cursor, saldos)
+            grupo.confirmar()
+            concluidos.extend(pendentes)
+            totais["aplicados"] += len(concluidos)
+            totais["falhas"] += len(falhos)
+            if refazer:
+                logger.warning("%s eventos de webhook desfeitos pelo servidor; ficam na fila", len(refazer))
+
+            with fila:
+                fila.executemany("DELETE FROM eventos WHERE seq = ?", [(s,) for s in concluidos])
+                fila.executemany(
+                    "UPDATE eventos SET tentativas = tentativas + 1 WHERE seq = ?", [(s,) for s in falhos]
+                )
+                descartados = fila.execute(
+                    "DELETE FROM eventos WHERE tentativas >= ?", (MAX_TENTATIVAS,)
+                ).rowcount
+            if descartados:
+                totais["descartados"] += descartados
+                logger.warning("%s eventos de webhook descartados após %s tentativas", descartados, MAX_TENTATIVAS)
+            if falhos or refazer:
+                # Evita girar em falso sobre os mesmos eventos; o próximo ciclo tenta de novo
+                break
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+        fila.close()
+
+    if totais["eventos"]:
+        logger.info(
+            "Webhooks processados. Eventos=%s | Aplicados=%s | Falhas=%s | Descartados=%s",
+            totais["eventos"], totais["aplicados"], totais["falhas"], totais["descartados"],
+        )
+    return totais
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Processa a fila local de webhooks do Bling")
+    parser.add_argument("--loop", type=float, metavar="SEGUNDOS",
+                        help="Continua drenando a fila a cada N segundos")
+    args = parser.parse_args()
+    while True:
+        processar_fila()
+        if not args.loop:
+            break
+        time.sleep(args.loop)
+
+
+if __name__ == "__main__":
+    main()